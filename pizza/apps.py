@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class PizzaConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'pizza'
+
+    def ready(self):
+        # connects the receivers that invalidate cached responses, configure sqlite connections and create search indexes
+        from pizza import database, search, signals
@@ -0,0 +1,128 @@
+"""
+Async GET handlers for toppings and pizzas, used when running under ASGI (pizza_store/asgi.py).
+Plain JSON reads are answered with the async ORM instead of passing through the thread of a sync view.
+The lists are read by the read serializers of the sync views, in a thread since they may query the toppings.
+Writes, the browsable API, query parameters and requests with credentials are passed to the views of pizza/views.py.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from rest_framework import exceptions
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from pizza.cache import PIZZA_DETAIL, PIZZA_LIST, TOPPING_DETAIL, TOPPING_LIST, acache_response
+from pizza.conditional import aconditional_get
+from pizza.models import PizzaTopping, Pizza
+from pizza.routers import replica_reads
+from pizza.serializers import PizzaToppingSerializer, PizzaToppingReadSerializer, PizzaReadSerializer
+
+
+def wants_plain_json(request):
+    """
+    True for a GET request without query parameters or an Authorization header that accepts JSON.
+    Those are answered the same way by the async handlers and the sync views.
+    """
+    if request.method != 'GET' or request.GET or 'Authorization' in request.headers:
+        return False
+
+    accept = request.headers.get('Accept', '*/*')
+    # browsers ask for text/html and get the browsable API
+    return 'text/html' not in accept and ('application/json' in accept or '*/*' in accept)
+
+
+def _not_found():
+    return Response({'detail': exceptions.NotFound.default_detail}, status=exceptions.NotFound.status_code)
+
+
+@sync_to_async
+def _read_rows(read_serializer, queryset, request):
+    """Returns the data of the rows of queryset, like the lists of the sync views"""
+    rows = read_serializer.values(queryset)
+
+    return read_serializer(rows, context={'request': request, 'fields': None}).data
+
+
+@aconditional_get(JSONRenderer.format)
+@acache_response(TOPPING_LIST)
+async def topping_list(request):
+    return Response(await _read_rows(PizzaToppingReadSerializer, PizzaTopping.objects.all(), request))
+
+
+@aconditional_get(JSONRenderer.format)
+@acache_response(TOPPING_DETAIL)
+async def topping_detail(request, pk):
+    try:
+        topping = await PizzaTopping.objects.aget(pk=pk)
+    except PizzaTopping.DoesNotExist:
+        return _not_found()
+
+    return Response(PizzaToppingSerializer(topping, context={'request': request}).data)
+
+
+@aconditional_get(JSONRenderer.format)
+@acache_response(PIZZA_LIST)
+async def pizza_list(request):
+    return Response(await _read_rows(PizzaReadSerializer, Pizza.objects.all(), request))
+
+
+@aconditional_get(JSONRenderer.format)
+@acache_response(PIZZA_DETAIL)
+async def pizza_detail(request, pk):
+    # the pizza is one row of pizza_pizza when its topping names are stored on it, like the sync view
+    data = await _read_rows(PizzaReadSerializer, Pizza.objects.filter(pk=pk), request)
+    if not data:
+        return _not_found()
+
+    return Response(data[0])
+
+
+def allow_header(view_class):
+    """Returns the Allow header of the responses of view_class"""
+    instance = view_class()
+    # setup() adds HEAD like it does for every request of the sync view
+    instance.setup(None)
+
+    return ', '.join(instance.allowed_methods)
+
+
+def _finalize(response, allow):
+    """Renders a Response as JSON and adds the headers of the sync views, like APIView.finalize_response"""
+    if isinstance(response, Response):
+        response.accepted_renderer = JSONRenderer()
+        response.accepted_media_type = JSONRenderer.media_type
+        response.renderer_context = {}
+        response.render()
+
+    response['Allow'] = allow
+    patch_vary_headers(response, ['Accept'])
+
+    return response
+
+
+def async_reads(view_class, handler):
+    """Returns a view answering plain JSON GET requests with the async handler and every other request with view_class"""
+    sync_view = view_class.as_view()
+    allow = allow_header(view_class)
+
+    async def view(request, *args, **kwargs):
+        if not wants_plain_json(request):
+            return await sync_to_async(sync_view)(request, *args, **kwargs)
+
+        with replica_reads(request):
+            response = await handler(request, *args, **kwargs)
+
+        return _finalize(response, allow)
+
+    # like the views of DRF, CSRF is only checked by SessionAuthentication
+    view.csrf_exempt = True
+    view.view_class = view_class
+
+    return view
+
+
+def read_view(view_class, handler):
+    """The view of view_class, with async reads when settings.PIZZA_ASYNC_READS is set"""
+    if getattr(settings, 'PIZZA_ASYNC_READS', False):
+        return async_reads(view_class, handler)
+
+    return view_class.as_view()
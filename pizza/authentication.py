@@ -0,0 +1,87 @@
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.utils.crypto import constant_time_compare, salted_hmac
+from rest_framework.authentication import BasicAuthentication
+
+
+class VerifiedCredentials:
+    """
+    Bounded, thread safe LRU of recently verified credentials with a time to live.
+    Entries are keyed on a keyed digest of the credentials, the plaintext password is never stored.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def digest(userid, password):
+        return salted_hmac('pizza.authentication.VerifiedCredentials', f'{userid}\0{password}', algorithm='sha256').hexdigest()
+
+    def get(self, key):
+        """Returns the (user pk, password hash) of the entry, None if it's missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            user_pk, password_hash, expires = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return user_pk, password_hash
+
+    def set(self, key, user):
+        ttl = getattr(settings, 'PIZZA_AUTH_CACHE_TTL', 60)
+        max_size = getattr(settings, 'PIZZA_AUTH_CACHE_SIZE', 1024)
+        with self._lock:
+            self._entries[key] = (user.pk, user.password, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > max_size:
+                self._entries.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+verified_credentials = VerifiedCredentials()
+
+
+class CachedBasicAuthentication(BasicAuthentication):
+    """
+    BasicAuthentication that skips hashing the password (PBKDF2) when the same credentials were verified recently.
+    The user is still loaded on every request and the entry is only used if the user is active and
+    has the same username and password hash, so changing the password or deactivating the user invalidates it.
+    """
+
+    def authenticate_credentials(self, userid, password, request=None):
+        key = verified_credentials.digest(userid, password)
+        entry = verified_credentials.get(key)
+        if entry is not None:
+            user_pk, password_hash = entry
+            user = get_user_model()._default_manager.filter(pk=user_pk).first()
+            if (
+                user is not None and user.is_active and user.get_username() == userid
+                and constant_time_compare(user.password, password_hash)
+            ):
+                return (user, None)
+
+            verified_credentials.discard(key)
+
+        user, auth = super().authenticate_credentials(userid, password, request)
+        verified_credentials.set(key, user)
+
+        return (user, auth)
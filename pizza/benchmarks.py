@@ -0,0 +1,592 @@
+"""
+Benchmarks for the pizza API.
+Each benchmark runs against a throwaway test database, see pizza/management/commands/benchmark.py
+"""
+import asyncio
+import base64
+import gzip
+import importlib.util
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from statistics import median
+from unittest.mock import patch
+import brotli
+from django.conf import settings
+from django.contrib.auth.models import Permission, User
+from django.db import OperationalError, connection
+from django.db.models import Max, Min
+from django.test import AsyncClient, Client, RequestFactory, override_settings
+from rest_framework.authentication import BasicAuthentication
+from rest_framework.pagination import Cursor
+from rest_framework.relations import HyperlinkedIdentityField
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from pizza.authentication import CachedBasicAuthentication, verified_credentials
+from pizza.database import apply_pragmas
+from pizza.filters import exclude_toppings, filter_toppings
+from pizza.models import CatalogChange, Pizza, PizzaTopping
+from pizza.pagination import PrimaryKeyCursorPagination
+from pizza.renderers import MessagePackRenderer, ORJSONRenderer
+from pizza.search import filter_prefix, filter_search
+from pizza.serializers import PizzaSerializer, PizzaToppingSerializer, TemplatedHyperlinkedIdentityField
+from pizza.serializers import PizzaReadSerializer, PizzaToppingReadSerializer
+from pizza.snapshot import build_snapshot, catalog_snapshots
+from pizza.views import ToppingDetails
+
+
+BENCHMARKS = {}
+
+
+def benchmark(function):
+    """Registers a benchmark under its function name"""
+    BENCHMARKS[function.__name__] = function
+    return function
+
+
+def _median_time(function, repeat):
+    """Returns the median wall time of function in milliseconds"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+
+    return median(timings) * 1000
+
+
+def _create_toppings(rows, start=0, batch_size=10000):
+    toppings = (
+        PizzaTopping(topping=f'Topping {number}', topping_key=f'topping {number}')
+        for number in range(start, start + rows)
+        )
+    while True:
+        batch = [topping for _, topping in zip(range(batch_size), toppings)]
+        if not batch:
+            break
+        PizzaTopping.objects.bulk_create(batch)
+
+
+@benchmark
+def pagination(stdout, rows, repeat):
+    """Latency of a /toppings/ page at different depths, keyset cursor vs OFFSET"""
+    page_size = 100
+    _create_toppings(rows)
+    client = Client()
+    first_pk, last_pk = PizzaTopping.objects.aggregate(Min('pk'), Max('pk')).values()
+    base_url = f'http://testserver/toppings/?page_size={page_size}'
+
+    stdout.write(f'{rows} toppings, page_size={page_size}, median of {repeat} runs')
+    stdout.write(f'{"depth":>8} {"keyset query (ms)":>18} {"OFFSET query (ms)":>18} {"keyset GET (ms)":>16}')
+    for depth in (0, 0.25, 0.5, 0.75, 0.99):
+        position = first_pk + int((last_pk - first_pk) * depth)
+        paginator = PrimaryKeyCursorPagination()
+        paginator.base_url = base_url
+        url = paginator.encode_cursor(Cursor(offset=0, reverse=False, position=position))
+        offset = int(rows * depth)
+
+        keyset_time = _median_time(
+            lambda: list(PizzaTopping.objects.filter(pk__gt=position).order_by('pk')[:page_size]), repeat
+            )
+        offset_time = _median_time(
+            lambda: list(PizzaTopping.objects.order_by('pk')[offset:offset + page_size]), repeat
+            )
+        get_time = _median_time(lambda: client.get(url), repeat)
+        stdout.write(f'{depth:>8.0%} {keyset_time:>18.3f} {offset_time:>18.3f} {get_time:>16.3f}')
+
+
+def _consume_response(client, url, params):
+    """Returns the time to the first chunk and to the whole body of a response"""
+    start = time.perf_counter()
+    response = client.get(url, params)
+    content = iter(response.streaming_content) if response.streaming else iter([response.content])
+    next(content)
+    first_byte = time.perf_counter() - start
+    for _ in content:
+        pass
+
+    return first_byte, time.perf_counter() - start
+
+
+@benchmark
+def streaming(stdout, rows, repeat):
+    """Peak memory and time to first byte of /toppings/ with and without ?stream=1"""
+    _create_toppings(rows)
+    client = Client()
+
+    stdout.write(f'{rows} toppings')
+    stdout.write(f'{"mode":>8} {"first byte (ms)":>16} {"total (ms)":>12} {"peak memory (MB)":>18}')
+    for mode, params in (('regular', {}), ('stream', {'stream': 1})):
+        first_byte, total = _consume_response(client, '/toppings/', params)
+
+        # timed separately since tracing allocations slows everything down
+        tracemalloc.start()
+        _consume_response(client, '/toppings/', params)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        stdout.write(f'{mode:>8} {first_byte * 1000:>16.1f} {total * 1000:>12.1f} {peak / 2 ** 20:>18.1f}')
+
+
+@benchmark
+def basic_auth(stdout, rows, repeat):
+    """Throughput of authenticated PUTs to /toppings/<pk> with and without cached Basic auth credentials"""
+    user = User.objects.create_user(username='benchmark_owner', password='pass')
+    user.user_permissions.add(*Permission.objects.filter(codename__endswith='_pizzatopping'))
+    topping = PizzaTopping.objects.create(topping='Benchmark Topping')
+    credentials = base64.b64encode(b'benchmark_owner:pass').decode()
+    client = Client(HTTP_AUTHORIZATION=f'Basic {credentials}')
+
+    stdout.write(f'{repeat} authenticated PUT requests')
+    stdout.write(f'{"authentication":>28} {"requests/s":>12}')
+    for authentication_class in (BasicAuthentication, CachedBasicAuthentication):
+        verified_credentials.clear()
+        with patch.object(ToppingDetails, 'authentication_classes', [authentication_class]):
+            start = time.perf_counter()
+            for number in range(repeat):
+                client.put(f'/toppings/{topping.pk}', {'topping': f'Topping {number}'}, content_type='application/json')
+            elapsed = time.perf_counter() - start
+        stdout.write(f'{authentication_class.__name__:>28} {repeat / elapsed:>12.1f}')
+
+
+@benchmark
+def bulk_toppings(stdout, rows, repeat):
+    """Time to create toppings with one POST per topping vs one POST of a list"""
+    user = User.objects.create_user(username='benchmark_owner', password='pass')
+    user.user_permissions.add(*Permission.objects.filter(codename__endswith='_pizzatopping'))
+    client = Client()
+    client.force_login(user)
+    single_rows = min(rows, 200)
+
+    start = time.perf_counter()
+    for number in range(single_rows):
+        client.post('/toppings/', {'topping': f'Single Topping {number}'}, content_type='application/json')
+    single_time = (time.perf_counter() - start) / single_rows * rows
+
+    toppings = [{'topping': f'Bulk Topping {number}'} for number in range(rows)]
+    start = time.perf_counter()
+    response = client.post('/toppings/', toppings, content_type='application/json')
+    bulk_time = time.perf_counter() - start
+
+    stdout.write(f'{rows} toppings (status {response.status_code})')
+    stdout.write(f'{"one POST per topping":>24} {single_time:>8.2f} s (extrapolated from {single_rows})')
+    stdout.write(f'{"one POST of a list":>24} {bulk_time:>8.2f} s')
+
+
+def _async_urlconf():
+    """Returns a fresh copy of pizza/urls.py built the way it is under ASGI"""
+    spec = importlib.util.find_spec('pizza.urls')
+    urlconf = importlib.util.module_from_spec(spec)
+    with override_settings(PIZZA_ASYNC_READS=True):
+        spec.loader.exec_module(urlconf)
+
+    return urlconf
+
+
+def _wsgi_reads(urls, concurrency):
+    """Sends the GET requests from concurrency threads, like the threads of a WSGI server"""
+    def worker(worker_urls):
+        client = Client()
+        for url in worker_urls:
+            client.get(url)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, [urls[number::concurrency] for number in range(concurrency)]))
+
+
+async def _asgi_reads(urls, concurrency):
+    """Sends the GET requests from concurrency tasks on one event loop, like an ASGI server"""
+    async def worker(worker_urls):
+        client = AsyncClient()
+        for url in worker_urls:
+            await client.get(url)
+
+    await asyncio.gather(*(worker(urls[number::concurrency]) for number in range(concurrency)))
+
+
+@benchmark
+def async_reads(stdout, rows, repeat):
+    """Throughput of concurrent GETs of /pizzas/<pk> through the sync views under WSGI and the async views under ASGI"""
+    pizza_count = min(rows, 1000)
+    _create_toppings(10)
+    toppings = list(PizzaTopping.objects.all())
+    Pizza.objects.bulk_create(Pizza(pizza=f'Pizza {number}', pizza_key=f'pizza {number}') for number in range(pizza_count))
+    for pizza in Pizza.objects.all():
+        pizza.toppings.set(toppings[:pizza.pk % len(toppings) + 1])
+    pizza_pks = list(Pizza.objects.values_list('pk', flat=True))
+    async_urlconf = _async_urlconf()
+
+    stdout.write(f'{pizza_count} pizzas, {repeat} GET requests per client')
+    stdout.write(f'{"":>8} {"requests/s":^54}')
+    stdout.write(f'{"clients":>8} {"WSGI, sync views":>18} {"ASGI, sync views":>18} {"ASGI, async views":>18}')
+    for concurrency in (1, 10, 50):
+        urls = [f'/pizzas/{pizza_pks[number % len(pizza_pks)]}' for number in range(repeat * concurrency)]
+
+        start = time.perf_counter()
+        _wsgi_reads(urls, concurrency)
+        wsgi_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        asyncio.run(_asgi_reads(urls, concurrency))
+        asgi_sync_time = time.perf_counter() - start
+
+        with override_settings(ROOT_URLCONF=async_urlconf):
+            start = time.perf_counter()
+            asyncio.run(_asgi_reads(urls, concurrency))
+            asgi_time = time.perf_counter() - start
+
+        stdout.write(
+            f'{concurrency:>8} {len(urls) / wsgi_time:>18.1f} {len(urls) / asgi_sync_time:>18.1f} '
+            f'{len(urls) / asgi_time:>18.1f}'
+            )
+
+
+def _sqlite_workload(path, pragmas, persistent, readers, writers, duration):
+    """
+    Runs reader and writer threads against the sqlite file for duration seconds.
+    Returns the number of reads, writes and 'database is locked' errors.
+    Without persistent connections every operation opens a new connection, like a request with CONN_MAX_AGE=0.
+    """
+    counts = {'reads': 0, 'writes': 0, 'locked': 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def connect():
+        # sqlite3 waits 5 seconds for a lock by default, like django
+        db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        apply_pragmas(db.cursor(), pragmas)
+        return db
+
+    def worker(statement, parameters, counter):
+        db = connect() if persistent else None
+        number = 0
+        while time.perf_counter() < deadline:
+            number += 1
+            current = db or connect()
+            try:
+                current.execute(statement, parameters(number)).fetchall()
+                result = counter
+            except sqlite3.OperationalError as error:
+                if 'locked' not in str(error):
+                    raise
+                result = 'locked'
+            finally:
+                if not persistent:
+                    current.close()
+            with lock:
+                counts[result] += 1
+
+    threads = [
+        threading.Thread(target=worker, args=(
+            'SELECT id, topping FROM pizza_pizzatopping WHERE id > ? ORDER BY id LIMIT 100',
+            lambda number: (number % 1000,), 'reads'
+            ))
+        for _ in range(readers)
+        ] + [
+        threading.Thread(target=worker, args=(
+            'UPDATE pizza_pizzatopping SET topping = ?, topping_key = ? WHERE id = ?',
+            lambda number, writer=writer: (f'Topping {writer}-{number}', f'topping {writer}-{number}', number % 1000 + 1),
+            'writes'
+            ))
+        for writer in range(writers)
+        ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return counts
+
+
+@benchmark
+def sqlite_tuning(stdout, rows, repeat):
+    """Throughput of concurrent reads and writes on a sqlite file with default and tuned pragmas"""
+    readers, writers, duration = 8, 2, 3
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sql FROM sqlite_master WHERE name = 'pizza_pizzatopping'")
+        create_table = cursor.fetchone()[0]
+    configurations = (
+        ('default pragmas, connection per request', {}, False),
+        ('tuned pragmas, connection per request', settings.PIZZA_SQLITE_PRAGMAS, False),
+        ('tuned pragmas, persistent connections', settings.PIZZA_SQLITE_PRAGMAS, True),
+        )
+
+    stdout.write(f'{min(rows, 100000)} toppings, {readers} readers and {writers} writers for {duration} s')
+    stdout.write(f'{"configuration":>42} {"reads/s":>10} {"writes/s":>10} {"locked":>8}')
+    for name, pragmas, persistent in configurations:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'benchmark.sqlite3')
+            db = sqlite3.connect(path)
+            db.execute(create_table)
+            db.executemany(
+                'INSERT INTO pizza_pizzatopping (topping, topping_key) VALUES (?, ?)',
+                ((f'Topping {number}', f'topping {number}') for number in range(min(rows, 100000)))
+                )
+            db.commit()
+            db.close()
+
+            counts = _sqlite_workload(path, pragmas, persistent, readers, writers, duration)
+        stdout.write(
+            f'{name:>42} {counts["reads"] / duration:>10.0f} {counts["writes"] / duration:>10.0f} '
+            f'{counts["locked"]:>8}'
+            )
+
+
+@benchmark
+def search(stdout, rows, repeat):
+    """Latency of ?prefix= and ?search= vs a LIKE '%x%' scan of the names"""
+    page_size = 20
+    _create_toppings(rows)
+    client = Client()
+    number = rows // 2
+    toppings = PizzaTopping.objects.order_by('pk')
+
+    queries = (
+        ('prefix range query', lambda: list(filter_prefix(toppings, f'Topping {number}')[:page_size])),
+        ('FTS5 search query', lambda: list(filter_search(toppings, str(number))[:page_size])),
+        ('LIKE %x% query', lambda: list(toppings.filter(topping__icontains=f' {number}')[:page_size])),
+        ('GET ?prefix=', lambda: client.get('/toppings/', {'prefix': f'Topping {number}', 'page_size': page_size})),
+        ('GET ?search=', lambda: client.get('/toppings/', {'search': str(number), 'page_size': page_size})),
+        )
+
+    stdout.write(f'{rows} toppings, page_size={page_size}, median of {repeat} runs')
+    stdout.write(f'{"lookup":>20} {"time (ms)":>10}')
+    for name, function in queries:
+        stdout.write(f'{name:>20} {_median_time(function, repeat):>10.3f}')
+
+
+def _create_pizzas(pizzas, toppings, toppings_per_pizza=3, batch_size=10000):
+    """Creates pizzas with toppings picked at random from the toppings, returns nothing"""
+    through = Pizza.toppings.through
+    start = Pizza.objects.count()
+    for offset in range(0, pizzas, batch_size):
+        batch = Pizza.objects.bulk_create([
+            Pizza(pizza=f'Pizza {number}', pizza_key=f'pizza {number}')
+            for number in range(start + offset, start + min(offset + batch_size, pizzas))
+            ])
+        through.objects.bulk_create([
+            through(pizza_id=pizza.pk, pizzatopping_id=topping.pk)
+            for pizza in batch for topping in random.sample(toppings, toppings_per_pizza)
+            ])
+        # the through table is filled directly, which doesn't send m2m_changed
+        pks = [pizza.pk for pizza in batch]
+        Pizza.update_fingerprints(pks)
+        Pizza.update_topping_names(pks)
+
+
+@benchmark
+def topping_filters(stdout, rows, repeat):
+    """
+    Latency of ?topping= and ?exclude_topping= on /pizzas/ as the number of pizzas grows up to rows.
+    The toppings grow with the pizzas so every topping is on about 300 pizzas, like a menu where new pizzas
+    bring new toppings. Filtering in the client, as done before, is timed on the fetch of the whole list.
+    """
+    random.seed(0)
+    page_size = 20
+    client = Client()
+    stdout.write(f'pizzas with 3 of (pizzas / 100) toppings, page_size={page_size}, median of {repeat} runs')
+    stdout.write(
+        f'{"pizzas":>9} {"all 2 (ms)":>11} {"any 2 (ms)":>11} {"exclude (ms)":>13} '
+        f'{"GET all 2 (ms)":>15} {"whole list (ms)":>16}'
+        )
+    created = 0
+    for pizzas in sorted({max(rows // 100, 1000), max(rows // 10, 1000), rows}):
+        _create_toppings(pizzas // 100 - created // 100, start=created // 100)
+        toppings = list(PizzaTopping.objects.only('pk'))
+        _create_pizzas(pizzas - created, toppings)
+        created = pizzas
+        # two toppings of the same pizza so the intersection isn't empty
+        names = list(Pizza.objects.order_by('-pk')[0].toppings.values_list('topping', flat=True)[:2])
+        queryset = Pizza.objects.order_by('pk')
+
+        all_time = _median_time(lambda: list(filter_toppings(queryset, names).values('pk')), repeat)
+        any_time = _median_time(lambda: list(filter_toppings(queryset, names, 'any').values('pk')), repeat)
+        exclude_time = _median_time(lambda: list(exclude_toppings(queryset, names).values('pk')[:page_size]), repeat)
+        get_time = _median_time(
+            lambda: client.get('/pizzas/', {'topping': names, 'page_size': page_size}), repeat
+            )
+        # the whole list takes minutes above 100000 pizzas
+        list_time = f'{_median_time(lambda: client.get("/pizzas/"), 1):.1f}' if pizzas <= 100000 else '-'
+        stdout.write(
+            f'{pizzas:>9} {all_time:>11.3f} {any_time:>11.3f} {exclude_time:>13.3f} {get_time:>15.3f} '
+            f'{list_time:>16}'
+            )
+
+
+@benchmark
+def hyperlinks(stdout, rows, repeat):
+    """Time to serialize the url of rows toppings with HyperlinkedIdentityField vs TemplatedHyperlinkedIdentityField"""
+    request = Request(RequestFactory().get('/toppings/'))
+    toppings = [PizzaTopping(pk=pk, topping=f'Topping {pk}') for pk in range(1, rows + 1)]
+
+    def serialize(field_class):
+        class Serializer(PizzaToppingSerializer):
+            url = field_class(view_name='toppings_detail', read_only=True)
+
+        return Serializer(toppings, many=True, context={'request': request}).data
+
+    stdout.write(f'{rows} toppings, median of {repeat} runs')
+    stdout.write(f'{"url field":>36} {"time (ms)":>10} {"per row (us)":>13}')
+    results = {}
+    for field_class in (HyperlinkedIdentityField, TemplatedHyperlinkedIdentityField):
+        results[field_class] = serialize(field_class)
+        elapsed = _median_time(lambda: serialize(field_class), repeat)
+        stdout.write(f'{field_class.__name__:>36} {elapsed:>10.1f} {elapsed * 1000 / rows:>13.2f}')
+
+    identical = JSONRenderer().render(results[HyperlinkedIdentityField]) == JSONRenderer().render(
+        results[TemplatedHyperlinkedIdentityField]
+        )
+    stdout.write(f'byte identical output: {identical}')
+
+
+@benchmark
+def renderers(stdout, rows, repeat):
+    """
+    Render time and payload size of the whole catalog of rows pizzas with 3 of (rows / 100) toppings for every
+    renderer, raw and compressed like CompressionMiddleware does.
+    """
+    random.seed(0)
+    _create_toppings(max(rows // 100, 10))
+    _create_pizzas(rows, list(PizzaTopping.objects.only('pk')))
+    request = Request(RequestFactory().get('/pizzas/'))
+    queryset = Pizza.objects.order_by('pk').prefetch_related('toppings')
+    data = PizzaSerializer(queryset, many=True, context={'request': request}).data
+    quality = getattr(settings, 'PIZZA_BROTLI_QUALITY', 5)
+
+    stdout.write(f'{rows} pizzas, median of {repeat} runs, brotli quality {quality}')
+    stdout.write(
+        f'{"renderer":>20} {"render (ms)":>12} {"size (kB)":>10} {"gzip (kB)":>10} {"gzip (ms)":>10} '
+        f'{"brotli (kB)":>12} {"brotli (ms)":>12}'
+        )
+    for renderer in (JSONRenderer(), ORJSONRenderer(), MessagePackRenderer()):
+        content = renderer.render(data)
+        elapsed = _median_time(lambda: renderer.render(data), repeat)
+        gzipped = gzip.compress(content, compresslevel=6)
+        gzip_time = _median_time(lambda: gzip.compress(content, compresslevel=6), repeat)
+        brotlied = brotli.compress(content, quality=quality)
+        brotli_time = _median_time(lambda: brotli.compress(content, quality=quality), repeat)
+        stdout.write(
+            f'{type(renderer).__name__:>20} {elapsed:>12.1f} {len(content) / 1000:>10.1f} '
+            f'{len(gzipped) / 1000:>10.1f} {gzip_time:>10.1f} {len(brotlied) / 1000:>12.1f} {brotli_time:>12.1f}'
+            )
+
+
+@benchmark
+def read_serializers(stdout, rows, repeat):
+    """
+    Time to read and serialize the whole topping and pizza lists with the model serializers vs the read serializers
+    built from values(), as the lists grow up to rows toppings and rows pizzas with 3 toppings each.
+    Above 100000 rows the lists are serialized once. prefetch_related('toppings') sends a query parameter per pizza,
+    so the pizzas of the model serializer fail above the parameter limit of sqlite.
+    """
+    random.seed(0)
+    request = Request(RequestFactory().get('/pizzas/'))
+    context = {'request': request, 'fields': None}
+
+    def serialize(serializer_class, queryset):
+        return JSONRenderer().render(serializer_class(queryset, many=True, context=context).data)
+
+    def read(read_serializer_class, queryset):
+        rows = read_serializer_class.values(queryset)
+        return JSONRenderer().render(read_serializer_class(rows, context=context).data)
+
+    def timed(function, runs):
+        try:
+            return f'{_median_time(function, runs):.1f}'
+        except OperationalError:
+            return 'failed'
+
+    stdout.write(f'toppings and pizzas with 3 toppings each, median of {repeat} runs')
+    stdout.write(
+        f'{"rows":>9} {"toppings (ms)":>14} {"read (ms)":>10} {"speedup":>8} '
+        f'{"pizzas (ms)":>12} {"read (ms)":>10} {"speedup":>8} {"identical":>10}'
+        )
+    created = 0
+    for size in sorted({max(rows // 100, 1000), max(rows // 10, 1000), rows}):
+        _create_toppings(size - created, start=created)
+        _create_pizzas(size - created, list(PizzaTopping.objects.only('pk')))
+        created = size
+        runs = repeat if size <= 100000 else 1
+        toppings = PizzaTopping.objects.all()
+        pizzas = Pizza.objects.prefetch_related('toppings')
+
+        topping_time = timed(lambda: serialize(PizzaToppingSerializer, toppings), runs)
+        topping_read_time = timed(lambda: read(PizzaToppingReadSerializer, toppings), runs)
+        pizza_time = timed(lambda: serialize(PizzaSerializer, pizzas), runs)
+        pizza_read_time = timed(lambda: read(PizzaReadSerializer, pizzas), runs)
+        identical = (
+            serialize(PizzaToppingSerializer, toppings) == read(PizzaToppingReadSerializer, toppings)
+            and serialize(PizzaSerializer, pizzas) == read(PizzaReadSerializer, pizzas)
+            ) if size <= 100000 else '-'
+        speedups = [
+            f'{float(model) / float(values):.1f}x' if model != 'failed' else '-'
+            for model, values in ((topping_time, topping_read_time), (pizza_time, pizza_read_time))
+            ]
+        stdout.write(
+            f'{size:>9} {topping_time:>14} {topping_read_time:>10} {speedups[0]:>8} '
+            f'{pizza_time:>12} {pizza_read_time:>10} {speedups[1]:>8} {str(identical):>10}'
+            )
+
+
+@benchmark
+def catalog_snapshot(stdout, rows, repeat):
+    """
+    Latency of anonymous GETs of the pizza list and a pizza answered by the views vs the catalog snapshot, for
+    rows pizzas with 3 of (rows / 100) toppings. The snapshot is built once per catalog version and process.
+    """
+    random.seed(0)
+    _create_toppings(max(rows // 100, 10))
+    _create_pizzas(rows, list(PizzaTopping.objects.only('pk')))
+    pizza_pk = Pizza.objects.order_by('pk').values_list('pk', flat=True)[rows // 2]
+    client = Client()
+    catalog_snapshots.clear()
+    build_time = _median_time(lambda: build_snapshot(RequestFactory().get('/'), None), min(repeat, 3))
+
+    stdout.write(f'{rows} pizzas, median of {repeat} runs, snapshot built in {build_time:.1f} ms')
+    stdout.write(f'{"url":>12} {"views (ms)":>11} {"snapshot (ms)":>14} {"speedup":>8} {"identical":>10}')
+    for name, url in (('list', '/pizzas/'), ('detail', f'/pizzas/{pizza_pk}')):
+        view_time = _median_time(lambda: client.get(url), repeat)
+        expected = client.get(url).content
+        with override_settings(PIZZA_CATALOG_SNAPSHOT=True, PIZZA_SNAPSHOT_MAX_AGE=60):
+            content = client.get(url).content
+            snapshot_time = _median_time(lambda: client.get(url), repeat)
+        stdout.write(
+            f'{name:>12} {view_time:>11.2f} {snapshot_time:>14.2f} {view_time / snapshot_time:>7.1f}x '
+            f'{str(content == expected):>10}'
+            )
+    catalog_snapshots.clear()
+
+
+@benchmark
+def change_feed(stdout, rows, repeat):
+    """
+    Time for a client to catch up with 10, 100 and 1000 pizza renames by reading /changes/, which carries the data of
+    the changed pizzas, vs downloading /pizzas/ again, for rows pizzas with 3 of (rows / 100) toppings.
+    Every pizza is renamed twice, the log keeps one change per pizza.
+    """
+    random.seed(0)
+    _create_toppings(max(rows // 100, 10))
+    _create_pizzas(rows, list(PizzaTopping.objects.only('pk')))
+    client = Client()
+    pizzas = list(Pizza.objects.order_by('pk')[:1000])
+
+    def sync(since):
+        url = f'/changes/?since={since}&page_size=1000'
+        while url:
+            page = client.get(url).json()
+            url = page['next']
+
+    stdout.write(f'{rows} pizzas, median of {repeat} runs')
+    stdout.write(f'{"changes":>8} {"full download (ms)":>19} {"change feed (ms)":>17}')
+    full_time = _median_time(lambda: client.get('/pizzas/'), repeat)
+    for changes in (10, 100, 1000):
+        since = CatalogChange.latest_seq()
+        for pizza in pizzas[:changes] * 2:
+            pizza.pizza = f'{pizza.pizza} {since}'
+            pizza.save(update_fields=['pizza'])
+        feed_time = _median_time(lambda: sync(since), repeat)
+        stdout.write(f'{changes:>8} {full_time:>19.1f} {feed_time:>17.1f}')
@@ -0,0 +1,145 @@
+"""
+Read-through cache for GET responses, built on Django's cache framework.
+Responses are stored under a generation token of the resource they display.
+pizza/signals.py replaces the token when the resource changes, which orphans every cached response of it.
+"""
+import hashlib
+import uuid
+from functools import wraps
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from rest_framework.response import Response
+from pizza.routers import reading_from_replica
+
+
+# Resources are formatted with the view kwargs, e.g. 'topping:{pk}' -> 'topping:1'
+TOPPING_LIST = 'toppings'
+TOPPING_DETAIL = 'topping:{pk}'
+PIZZA_LIST = 'pizzas'
+PIZZA_DETAIL = 'pizza:{pk}'
+
+
+def get_response_cache():
+    """Returns the cache from settings.PIZZA_CACHE_ALIAS, None when caching is disabled"""
+    alias = getattr(settings, 'PIZZA_CACHE_ALIAS', None)
+
+    return caches[alias] if alias else None
+
+
+def is_shared(cache):
+    """False for LocMemCache, whose entries are kept by each process and only dropped by the writes made in it"""
+    return not isinstance(cache, LocMemCache)
+
+
+def _generation_key(resource):
+    return f'pizza:generation:{resource}'
+
+
+def get_generation(cache, resource):
+    """Returns the current token of the resource, a new one is made if it was evicted or never set"""
+    key = _generation_key(resource)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, uuid.uuid4().hex, timeout=None)
+        generation = cache.get(key)
+
+    return generation
+
+
+async def aget_generation(cache, resource):
+    """Async version of get_generation"""
+    key = _generation_key(resource)
+    generation = await cache.aget(key)
+    if generation is None:
+        await cache.aadd(key, uuid.uuid4().hex, timeout=None)
+        generation = await cache.aget(key)
+
+    return generation
+
+
+def _replace_generations(resources):
+    cache = get_response_cache()
+    if cache is None:
+        return
+
+    cache.set_many({_generation_key(resource): uuid.uuid4().hex for resource in resources}, timeout=None)
+
+
+def invalidate(*resources):
+    """
+    Drops the cached responses of the resources.
+    Repeated after commit so a read racing the write transaction can't keep the old data cached.
+    """
+    if not resources or get_response_cache() is None:
+        return
+
+    _replace_generations(resources)
+    transaction.on_commit(lambda: _replace_generations(resources))
+
+
+def _response_key(resource_name, generation, request):
+    # the absolute uri is part of the key since urls in the response are built from it
+    uri_digest = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+
+    return f'pizza:response:{resource_name}:{generation}:{uri_digest}'
+
+
+def _is_cacheable(response):
+    # a replica may not have caught up with the write that replaced the generation
+    return isinstance(response, Response) and response.status_code == 200 and not reading_from_replica()
+
+
+def cache_response(resource):
+    """Caches the data of successful responses of a GET handler until the resource is invalidated."""
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            cache = get_response_cache()
+            if cache is None:
+                return method(view, request, *args, **kwargs)
+
+            resource_name = resource.format(**kwargs)
+            key = _response_key(resource_name, get_generation(cache, resource_name), request)
+
+            data = cache.get(key)
+            if data is not None:
+                return Response(data)
+
+            response = method(view, request, *args, **kwargs)
+            if _is_cacheable(response):
+                cache.set(key, response.data, getattr(settings, 'PIZZA_CACHE_TIMEOUT', 300))
+
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def acache_response(resource):
+    """cache_response for async handlers. Responses are shared with the sync handlers of the same resource."""
+    def decorator(handler):
+        @wraps(handler)
+        async def wrapper(request, *args, **kwargs):
+            cache = get_response_cache()
+            if cache is None:
+                return await handler(request, *args, **kwargs)
+
+            resource_name = resource.format(**kwargs)
+            key = _response_key(resource_name, await aget_generation(cache, resource_name), request)
+
+            data = await cache.aget(key)
+            if data is not None:
+                return Response(data)
+
+            response = await handler(request, *args, **kwargs)
+            if _is_cacheable(response):
+                await cache.aset(key, response.data, getattr(settings, 'PIZZA_CACHE_TIMEOUT', 300))
+
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,123 @@
+"""
+Conditional GET support. ETag and Last-Modified are taken from CatalogVersion, which is incremented on every write,
+so a matching If-None-Match or If-Modified-Since is answered with a 304 without serializing anything.
+"""
+import os
+import time
+from calendar import timegm
+from functools import wraps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from pizza.models import CatalogVersion
+
+
+CATALOG_VERSION_PK = 1
+
+
+def _catalog_version_query():
+    return CatalogVersion.objects.filter(pk=CATALOG_VERSION_PK).values_list('version', 'modified')
+
+
+def get_catalog_version():
+    """
+    Returns the version and modified time of the catalog, None when the row doesn't exist yet.
+    Read from the database on every request, it's one lookup by primary key. A cache local to the process would
+    keep the version of the other processes' writes out of date.
+    The read is routed like those of the response, a replica answers with the version of the data it holds.
+    """
+    return _catalog_version_query().first()
+
+
+async def aget_catalog_version():
+    """Async version of get_catalog_version"""
+    return await _catalog_version_query().afirst()
+
+
+def _touch_marker_file():
+    """Moves the mtime of settings.PIZZA_SNAPSHOT_MARKER_FILE forward, see pizza/snapshot.py"""
+    path = getattr(settings, 'PIZZA_SNAPSHOT_MARKER_FILE', None)
+    if not path:
+        return
+
+    try:
+        previous = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        previous = 0
+        open(path, 'a').close()
+    # later than the last mtime even if the clock hasn't moved since, or the change would go unnoticed
+    now = time.time_ns()
+    os.utime(path, ns=(now, max(now, previous + 1)))
+
+
+def bump_catalog_version():
+    """
+    Increments the catalog version, the row is created by the first write when migration 0006 didn't create it.
+    The marker file of the catalog snapshots is touched once the change is committed.
+    """
+    now = timezone.now()
+    updated = CatalogVersion.objects.filter(pk=CATALOG_VERSION_PK).update(version=F('version') + 1, modified=now)
+    if not updated:
+        CatalogVersion.objects.get_or_create(pk=CATALOG_VERSION_PK, defaults={'version': 1, 'modified': now})
+    transaction.on_commit(_touch_marker_file)
+
+
+def catalog_validators(catalog_version, renderer_format):
+    """Returns the ETag and Last-Modified timestamp of a response"""
+    version, modified = catalog_version
+    # the format is part of the ETag since JSON and the browsable API are different representations
+    return quote_etag(f'{version}-{renderer_format}'), timegm(modified.utctimetuple())
+
+
+def set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+
+    return response
+
+
+def conditional_get(method):
+    """Adds ETag and Last-Modified to successful responses of a GET handler and answers matching requests with 304."""
+    @wraps(method)
+    def wrapper(view, request, *args, **kwargs):
+        # read before the response is built so the response is never older than its ETag
+        catalog_version = get_catalog_version()
+        if catalog_version is None:
+            return method(view, request, *args, **kwargs)
+        etag, last_modified = catalog_validators(catalog_version, request.accepted_renderer.format)
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = method(view, request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+
+        return set_validators(response, etag, last_modified)
+
+    return wrapper
+
+
+def aconditional_get(renderer_format):
+    """conditional_get for async handlers, which are always rendered in renderer_format"""
+    def decorator(handler):
+        @wraps(handler)
+        async def wrapper(request, *args, **kwargs):
+            catalog_version = await aget_catalog_version()
+            if catalog_version is None:
+                return await handler(request, *args, **kwargs)
+            etag, last_modified = catalog_validators(catalog_version, renderer_format)
+
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = await handler(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+
+            return set_validators(response, etag, last_modified)
+
+        return wrapper
+
+    return decorator
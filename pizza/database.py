@@ -0,0 +1,28 @@
+"""
+Applies settings.PIZZA_SQLITE_PRAGMAS to every new sqlite connection.
+With CONN_MAX_AGE the connections are kept between requests, so the pragmas are only set once per connection.
+"""
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from pizza.routers import get_replicas
+
+
+def apply_pragmas(cursor, pragmas):
+    """Runs PRAGMA name=value for every item of pragmas on a DB-API cursor"""
+    for name, value in pragmas.items():
+        cursor.execute(f'PRAGMA {name}={value}')
+
+
+@receiver(connection_created)
+def configure_sqlite_connection(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+
+    pragmas = getattr(settings, 'PIZZA_SQLITE_PRAGMAS', {})
+    if connection.alias in get_replicas():
+        # snapshots made by 'manage.py snapshot_replica' are replaced as a whole and keep no WAL file
+        pragmas = {name: value for name, value in pragmas.items() if name != 'journal_mode'}
+    if pragmas:
+        with connection.cursor() as cursor:
+            apply_pragmas(cursor, pragmas)
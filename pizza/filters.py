@@ -0,0 +1,78 @@
+"""
+?topping=, ?topping_match=, ?exclude_topping= and ?toppings_exact= filters of the pizza list.
+Every topping is a subquery over the through table of Pizza.toppings, which reads the pizzas of the topping from
+the (pizzatopping_id, pizza_id) index. The cost follows the number of pizzas having the toppings instead of the
+number of pizzas.
+?toppings_exact= is one lookup in the index of Pizza.toppings_fingerprint.
+"""
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+from pizza.models import Pizza, PizzaTopping, nocase, toppings_fingerprint
+
+
+MATCH_ALL = 'all'
+MATCH_ANY = 'any'
+
+
+def _pizzas_with(names):
+    """Subquery of the ids of the pizzas having one of the toppings, names are matched regardless of case"""
+    through = Pizza.toppings.through
+
+    return through.objects.filter(
+        pizzatopping__topping_key__in=[nocase(name) for name in names]
+        ).values('pizza_id')
+
+
+def filter_toppings(queryset, toppings, match=MATCH_ALL):
+    """Filters queryset to the pizzas having all, or with MATCH_ANY any, of the toppings"""
+    if match == MATCH_ANY:
+        return queryset.filter(pk__in=_pizzas_with(toppings))
+
+    # the intersection of the pizzas of every topping
+    for topping in dict.fromkeys(toppings):
+        queryset = queryset.filter(pk__in=_pizzas_with([topping]))
+
+    return queryset
+
+
+def exclude_toppings(queryset, toppings):
+    """Filters queryset to the pizzas having none of the toppings"""
+    return queryset.exclude(pk__in=_pizzas_with(toppings))
+
+
+def filter_toppings_exact(queryset, toppings):
+    """Filters queryset to the pizzas having exactly the toppings, no toppings matches the pizzas without any"""
+    keys = {nocase(name) for name in toppings}
+    topping_pks = list(PizzaTopping.objects.filter(topping_key__in=keys).values_list('pk', flat=True))
+    if len(topping_pks) != len(keys):
+        # no pizza can have a topping that doesn't exist
+        return queryset.none()
+
+    return queryset.filter(toppings_fingerprint=toppings_fingerprint(topping_pks))
+
+
+class ToppingFilter(BaseFilterBackend):
+    """
+    Filter backend of the ?topping=, ?topping_match=, ?exclude_topping= and ?toppings_exact= query parameters.
+    ?topping= and ?exclude_topping= can be repeated, ?topping_match=any returns the pizzas having any of the toppings
+    instead of all of them. ?toppings_exact= is repeated for every topping, sent empty it matches pizzas without toppings.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        toppings = request.query_params.getlist('topping')
+        match = request.query_params.get('topping_match', MATCH_ALL)
+        if match not in (MATCH_ALL, MATCH_ANY):
+            raise ValidationError({'topping_match': [f'Must be "{MATCH_ALL}" or "{MATCH_ANY}".']})
+
+        if toppings:
+            queryset = filter_toppings(queryset, toppings, match)
+
+        excluded = request.query_params.getlist('exclude_topping')
+        if excluded:
+            queryset = exclude_toppings(queryset, excluded)
+
+        if 'toppings_exact' in request.query_params:
+            exact = [name for name in request.query_params.getlist('toppings_exact') if name]
+            queryset = filter_toppings_exact(queryset, exact)
+
+        return queryset
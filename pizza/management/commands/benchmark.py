@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.test.utils import (
+    override_settings, setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+    )
+from pizza.benchmarks import BENCHMARKS
+
+
+class Command(BaseCommand):
+    """
+    Runs a benchmark from pizza/benchmarks.py against a throwaway test database.
+    The response cache and the catalog snapshot are disabled unless the benchmark enables them.
+    e.g. python manage.py benchmark pagination --rows 1000000
+    """
+
+    help = 'Runs a benchmark against a throwaway test database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=sorted(BENCHMARKS))
+        parser.add_argument('--rows', type=int, default=100000, help='Number of rows to create')
+        parser.add_argument('--repeat', type=int, default=20, help='Number of timed runs per measurement')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            with override_settings(PIZZA_CACHE_ALIAS=None, PIZZA_CATALOG_SNAPSHOT=False):
+                BENCHMARKS[options['name']](stdout=self.stdout, rows=options['rows'], repeat=options['repeat'])
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
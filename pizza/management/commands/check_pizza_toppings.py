@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from pizza.models import Pizza, toppings_fingerprint
+
+
+class Command(BaseCommand):
+    """
+    Compares the topping names and toppings fingerprint stored on every pizza with the toppings of the pizza.
+    They are kept up to date by pizza/signals.py, but writes that don't send signals, like update() or raw SQL,
+    leave them behind. With --repair the pizzas that drifted are updated, otherwise the command fails when any did.
+    e.g. python manage.py check_pizza_toppings --repair
+    """
+
+    help = 'Checks the topping names and toppings fingerprints stored on pizzas, and repairs them with --repair'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repair', action='store_true', help='Updates the pizzas that drifted')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of pizzas checked at a time')
+
+    def _drifted(self, pizzas):
+        """Returns the pks of the pizzas whose stored toppings don't match their toppings"""
+        toppings = Pizza.toppings_of([pk for pk, names, fingerprint in pizzas])
+        drifted = []
+        for pk, names, fingerprint in pizzas:
+            expected_names = [name for topping_pk, name in toppings[pk]]
+            expected_fingerprint = toppings_fingerprint(topping_pk for topping_pk, name in toppings[pk])
+            if names != expected_names or fingerprint != expected_fingerprint:
+                drifted.append(pk)
+
+        return drifted
+
+    def handle(self, *args, **options):
+        checked = 0
+        drifted = []
+        last_pk = 0
+        while True:
+            # the pizzas and their toppings are read in one transaction so they are consistent with each other
+            with transaction.atomic():
+                pizzas = list(
+                    Pizza.objects.filter(pk__gt=last_pk).order_by('pk')
+                    .values_list('pk', 'topping_names', 'toppings_fingerprint')[:options['batch_size']]
+                    )
+                if not pizzas:
+                    break
+                batch_drifted = self._drifted(pizzas)
+                if options['repair'] and batch_drifted:
+                    Pizza.update_topping_names(batch_drifted)
+                    Pizza.update_fingerprints(batch_drifted)
+
+            checked += len(pizzas)
+            drifted.extend(batch_drifted)
+            last_pk = pizzas[-1][0]
+
+        self.stdout.write(f'Checked {checked} pizzas, {len(drifted)} drifted')
+        if drifted:
+            shown = ', '.join(str(pk) for pk in drifted[:20])
+            self.stdout.write(f'Drifted pizzas: {shown}{", ..." if len(drifted) > 20 else ""}')
+            if not options['repair']:
+                raise CommandError('The stored toppings of some pizzas drifted, run with --repair to update them.')
+            self.stdout.write(f'Repaired {len(drifted)} pizzas')
@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from pizza.conditional import CATALOG_VERSION_PK
+from pizza.models import CatalogChange, CatalogVersion
+
+
+class Command(BaseCommand):
+    """
+    Deletes the oldest changes of the change log read by /changes/, keeping the newest --keep changes.
+    Clients asking for changes older than the ones kept are answered with 410 Gone and download the catalog again.
+    Changes are deleted in batches so writes of the views aren't held up, e.g. every hour from cron.
+    e.g. python manage.py compact_changes --keep 100000
+    """
+
+    help = 'Deletes the oldest changes of the change log, keeping the newest ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keep', type=int, default=getattr(settings, 'PIZZA_CHANGE_LOG_SIZE', 100000),
+            help='Number of changes to keep, PIZZA_CHANGE_LOG_SIZE by default'
+            )
+        parser.add_argument('--batch-size', type=int, default=10000, help='Number of changes deleted at a time')
+
+    def handle(self, *args, **options):
+        keep = options['keep']
+        if keep < 1:
+            # the last change tells clients where to start from
+            raise CommandError('At least one change has to be kept.')
+
+        cutoff = CatalogChange.objects.order_by('-seq').values_list('seq', flat=True)[keep:keep + 1].first()
+        if cutoff is None:
+            self.stdout.write('Nothing to compact')
+            return
+
+        # clients are sent away before the changes they would miss are deleted
+        CatalogVersion.objects.get_or_create(pk=CATALOG_VERSION_PK)
+        CatalogVersion.objects.filter(pk=CATALOG_VERSION_PK, compacted_seq__lt=cutoff).update(compacted_seq=cutoff)
+
+        deleted = 0
+        while True:
+            batch = CatalogChange.objects.filter(seq__lte=cutoff).order_by('seq').values_list('seq', flat=True)
+            last_seq = batch[options['batch_size'] - 1:options['batch_size']].first() or cutoff
+            count, _ = CatalogChange.objects.filter(seq__lte=last_seq).delete()
+            deleted += count
+            if last_seq == cutoff:
+                break
+
+        self.stdout.write(f'Deleted {deleted} changes up to {cutoff}, kept the last {keep}')
@@ -0,0 +1,41 @@
+import os
+import sqlite3
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    """
+    Copies the sqlite database to the file of a replica, e.g. every few seconds from cron or a loop.
+    The copy is made next to the replica and moved over it, so readers never see a partial copy.
+    e.g. PIZZA_REPLICA_DB=/var/lib/pizza/replica.sqlite3 python manage.py snapshot_replica
+    """
+
+    help = 'Copies the sqlite database to the file of a read replica'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='replica', help='Alias of the replica in DATABASES')
+
+    def handle(self, *args, **options):
+        alias = options['database']
+        if alias not in connections.settings:
+            raise CommandError(f"There is no database '{alias}', set PIZZA_REPLICA_DB to add one.")
+
+        source = connections[DEFAULT_DB_ALIAS]
+        if source.vendor != 'sqlite' or connections[alias].vendor != 'sqlite':
+            raise CommandError('Only sqlite databases can be snapshotted.')
+
+        path = str(connections[alias].settings_dict['NAME'])
+        partial_path = f'{path}.partial'
+        source.ensure_connection()
+        target = sqlite3.connect(partial_path)
+        try:
+            # the backup API copies a consistent snapshot while writes go on
+            source.connection.backup(target)
+            # readers of the replica only see the file, a WAL file of the copy would be left behind
+            target.execute('PRAGMA journal_mode=DELETE')
+        finally:
+            target.close()
+        os.replace(partial_path, path)
+
+        self.stdout.write(f'Copied {source.settings_dict["NAME"]} to {path}')
@@ -0,0 +1,62 @@
+"""
+Compression of responses with brotli or gzip, see CompressionMiddleware.
+"""
+import brotli
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.regex_helper import _lazy_re_compile
+
+
+re_accepts_brotli = _lazy_re_compile(r'\bbr\b')
+
+
+def compress_sequence_brotli(sequence, quality):
+    """Compresses the chunks of a streamed response, every chunk is flushed so it is sent without delay"""
+    compressor = brotli.Compressor(quality=quality)
+    for chunk in sequence:
+        data = compressor.process(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    Compresses responses of at least settings.PIZZA_COMPRESSION_MIN_SIZE bytes, with brotli when the client
+    accepts it and gzip otherwise.
+    HTML pages carry CSRF tokens, so they are left to gzip, which pads them against the BREACH attack.
+    """
+
+    def process_response(self, request, response):
+        if not response.streaming and len(response.content) < getattr(settings, 'PIZZA_COMPRESSION_MIN_SIZE', 1024):
+            return response
+
+        if (
+            response.has_header('Content-Encoding')
+            or response.get('Content-Type', '').startswith('text/html')
+            or getattr(response, 'is_async', False)
+            or not re_accepts_brotli.search(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        ):
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        quality = getattr(settings, 'PIZZA_BROTLI_QUALITY', 5)
+        if response.streaming:
+            response.streaming_content = compress_sequence_brotli(response.streaming_content, quality)
+            # the compressed size isn't known until the whole response is streamed
+            del response.headers['Content-Length']
+        else:
+            compressed_content = brotli.compress(response.content, quality=quality)
+            if len(compressed_content) >= len(response.content):
+                return response
+            response.content = compressed_content
+            response.headers['Content-Length'] = str(len(response.content))
+
+        # like GZipMiddleware, a strong ETag is made weak since the body is no longer the same
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = 'br'
+
+        return response
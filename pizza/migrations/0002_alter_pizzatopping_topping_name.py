@@ -9,10 +9,11 @@ class Migration(migrations.Migration):
         ('pizza', '0001_created PizzaTopping model'),
     ]
 
+    # db_collation='NOCASE' was removed so the migrations run on databases without the collation, see 0007
     operations = [
         migrations.AlterField(
             model_name='pizzatopping',
             name='topping_name',
-            field=models.CharField(db_collation='NOCASE', error_messages={'unique': 'Topping already exists'}, max_length=200, unique=True),
+            field=models.CharField(error_messages={'unique': 'Topping already exists'}, max_length=200, unique=True),
         ),
     ]
@@ -9,6 +9,7 @@ class Migration(migrations.Migration):
         ('pizza', '0002_alter_pizzatopping_topping_name'),
     ]
 
+    # db_collation='NOCASE' was removed so the migrations run on databases without the collation, see 0007
     operations = [
         migrations.RenameField(
             model_name='pizzatopping',
@@ -19,7 +20,7 @@ class Migration(migrations.Migration):
             name='Pizza',
             fields=[
                 ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
-                ('pizza', models.CharField(db_collation='NOCASE', error_messages={'unique': 'Pizza already exists'}, max_length=200, unique=True)),
+                ('pizza', models.CharField(error_messages={'unique': 'Pizza already exists'}, max_length=200, unique=True)),
                 ('toppings', models.ManyToManyField(to='pizza.pizzatopping')),
             ],
         ),
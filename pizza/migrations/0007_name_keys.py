@@ -0,0 +1,59 @@
+# Generated by Django 4.2 on 2026-10-17 05:12
+
+import string
+from django.db import migrations, models
+
+
+def set_name_keys(apps, schema_editor):
+    """Sets the lookup keys of the existing toppings and pizzas, folded the same way as pizza.models.nocase"""
+    nocase_table = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+    for model_name, name_field in (('PizzaTopping', 'topping'), ('Pizza', 'pizza')):
+        model = apps.get_model('pizza', model_name)
+        instances = list(model.objects.only(name_field))
+        for instance in instances:
+            setattr(instance, f'{name_field}_key', getattr(instance, name_field).translate(nocase_table))
+        model.objects.bulk_update(instances, [f'{name_field}_key'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pizza', '0006_catalogversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pizzatopping',
+            name='topping_key',
+            field=models.CharField(default='', editable=False, max_length=200),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='pizza',
+            name='pizza_key',
+            field=models.CharField(default='', editable=False, max_length=200),
+            preserve_default=False,
+        ),
+        migrations.RunPython(set_name_keys, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='pizzatopping',
+            name='topping_key',
+            field=models.CharField(editable=False, error_messages={'unique': 'Topping already exists'}, max_length=200, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='pizza',
+            name='pizza_key',
+            field=models.CharField(editable=False, error_messages={'unique': 'Pizza already exists'}, max_length=200, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='pizzatopping',
+            name='topping',
+            field=models.CharField(max_length=200),
+        ),
+        migrations.AlterField(
+            model_name='pizza',
+            name='pizza',
+            field=models.CharField(max_length=200),
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Index of the pizzas of every topping for the ?topping= and ?exclude_topping= filters, see pizza/filters.py.
+    The unique index of the through table starts with pizza_id, this one covers the lookup from the topping side
+    without reading the table. The through table is created by Django, so the index is created with SQL.
+    """
+
+    dependencies = [
+        ('pizza', '0007_name_keys'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX pizza_pizza_toppings_pizzatopping_id_pizza_id '
+            'ON pizza_pizza_toppings (pizzatopping_id, pizza_id)',
+            'DROP INDEX pizza_pizza_toppings_pizzatopping_id_pizza_id',
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2 on 2026-10-17 04:26
+
+import hashlib
+from collections import defaultdict
+from django.db import migrations, models
+
+
+def set_toppings_fingerprints(apps, schema_editor):
+    """Sets the fingerprints of the existing pizzas, computed the same way as pizza.models.toppings_fingerprint"""
+    Pizza = apps.get_model('pizza', 'Pizza')
+    topping_pks = defaultdict(list)
+    for pizza_pk, topping_pk in Pizza.toppings.through.objects.values_list('pizza_id', 'pizzatopping_id'):
+        topping_pks[pizza_pk].append(topping_pk)
+
+    pizzas = list(Pizza.objects.only('pk'))
+    for pizza in pizzas:
+        canonical = ','.join(str(pk) for pk in sorted(set(topping_pks[pizza.pk])))
+        pizza.toppings_fingerprint = hashlib.sha256(canonical.encode()).hexdigest()
+    Pizza.objects.bulk_update(pizzas, ['toppings_fingerprint'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pizza', '0008_pizza_toppings_topping_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pizza',
+            name='toppings_fingerprint',
+            field=models.CharField(db_index=True, default='e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855', editable=False, max_length=64),
+        ),
+        migrations.RunPython(set_toppings_fingerprints, migrations.RunPython.noop),
+    ]
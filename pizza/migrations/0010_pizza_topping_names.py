@@ -0,0 +1,34 @@
+# Generated by Django 4.2 on 2026-10-17 05:20
+
+from collections import defaultdict
+from django.db import migrations, models
+
+
+def set_topping_names(apps, schema_editor):
+    """Sets the topping names of the existing pizzas, by topping pk like Pizza.update_topping_names"""
+    Pizza = apps.get_model('pizza', 'Pizza')
+    names = defaultdict(list)
+    rows = Pizza.toppings.through.objects.order_by('pizza_id', 'pizzatopping_id')
+    for pizza_pk, topping in rows.values_list('pizza_id', 'pizzatopping__topping'):
+        names[pizza_pk].append(topping)
+
+    pizzas = list(Pizza.objects.only('pk'))
+    for pizza in pizzas:
+        pizza.topping_names = names[pizza.pk]
+    Pizza.objects.bulk_update(pizzas, ['topping_names'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pizza', '0009_toppings_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pizza',
+            name='topping_names',
+            field=models.JSONField(default=list, editable=False),
+        ),
+        migrations.RunPython(set_topping_names, migrations.RunPython.noop),
+    ]
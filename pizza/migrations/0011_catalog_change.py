@@ -0,0 +1,29 @@
+# Generated by Django 4.2 on 2026-10-17 05:45
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pizza', '0010_pizza_topping_names'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogChange',
+            fields=[
+                ('seq', models.BigAutoField(primary_key=True, serialize=False)),
+                ('resource', models.CharField(choices=[('topping', 'Topping'), ('pizza', 'Pizza')], max_length=10)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('action', models.CharField(choices=[('created', 'Created'), ('updated', 'Updated'), ('deleted', 'Deleted'), ('toppings', 'Toppings changed')], max_length=10)),
+                ('changed', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='catalogversion',
+            name='compacted_seq',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
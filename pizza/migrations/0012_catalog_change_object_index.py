@@ -0,0 +1,25 @@
+# Generated by Django 4.2 on 2026-10-17 06:16
+
+from django.db import migrations, models
+
+
+def keep_latest_changes(apps, schema_editor):
+    """Deletes every change but the latest of each topping and pizza, like CatalogChange.record"""
+    CatalogChange = apps.get_model('pizza', 'CatalogChange')
+    latest = CatalogChange.objects.values('resource', 'object_id').annotate(latest=models.Max('seq')).values('latest')
+    CatalogChange.objects.exclude(seq__in=latest).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pizza', '0011_catalog_change'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='catalogchange',
+            index=models.Index(fields=['resource', 'object_id'], name='pizza_change_object_idx'),
+        ),
+        migrations.RunPython(keep_latest_changes, migrations.RunPython.noop),
+    ]
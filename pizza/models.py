@@ -1,29 +1,216 @@
-from django.db import models
+import hashlib
+import string
+from collections import defaultdict
+from django.db import connections, models, router
+from django.utils import timezone
 
 
-class PizzaTopping(models.Model): # TODO Change to Topping
+# Only ASCII letters are folded, like the NOCASE collation the names were compared with before
+NOCASE_TABLE = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def nocase(value):
+    """Folds the case of a topping or pizza name into its lookup key"""
+    return value.translate(NOCASE_TABLE)
+
+
+def toppings_fingerprint(topping_pks):
+    """Returns the fingerprint of a set of toppings, the same for the same toppings in any order"""
+    canonical = ','.join(str(pk) for pk in sorted(set(topping_pks)))
+
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+EMPTY_FINGERPRINT = toppings_fingerprint([])
+# Number of pizzas whose fingerprints or topping names are updated at a time
+FINGERPRINT_BATCH_SIZE = 500
+# Number of objects whose earlier changes are deleted at a time by CatalogChange.record
+CHANGE_BATCH_SIZE = 500
+# Columns of a change inserted by CatalogChange.record, seq is given by the database
+CHANGE_COLUMNS = ('resource', 'object_id', 'action', 'changed')
+
+
+class NameKeyMixin:
+    """
+    Keeps <name_field>_key, the name folded by nocase(), in sync with the name.
+    The key is computed in python so it is unique regardless of case the same way on every database.
+    The key isn't set by bulk_create() or update(), which have to set it themselves.
+    """
+
+    name_field = None
+
+    @classmethod
+    def key_field(cls):
+        return f'{cls.name_field}_key'
+
+    def set_key(self):
+        setattr(self, self.key_field(), nocase(getattr(self, self.name_field)))
+
+    def clean(self):
+        super().clean()
+        self.set_key()
+
+    def validate_unique(self, exclude=None):
+        # the key is never on a form, so it's checked whenever the name is
+        if exclude is not None and self.name_field not in exclude:
+            exclude = set(exclude) - {self.key_field()}
+        super().validate_unique(exclude)
+
+    def save(self, *args, **kwargs):
+        self.set_key()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and self.name_field in update_fields:
+            kwargs['update_fields'] = {*update_fields, self.key_field()}
+        super().save(*args, **kwargs)
+
+
+class PizzaTopping(NameKeyMixin, models.Model): # TODO Change to Topping
     """Models a single PizzaTopping instance"""
 
-    # db_collation is set to make the topping unique irregardless of case.
-    # might only be applicable to sqlite3 database.
-    topping = models.CharField(
-                            max_length=200, unique=True,
-                            error_messages={'unique':'Topping already exists'},
-                            db_collation= 'NOCASE'
+    name_field = 'topping'
+
+    topping = models.CharField(max_length=200)
+    # makes the topping unique irregardless of case
+    topping_key = models.CharField(
+                            max_length=200, unique=True, editable=False,
+                            error_messages={'unique':'Topping already exists'}
                             )
+
     def __str__(self):
         return str(self.topping)
 
 
-class Pizza(models.Model):
+class Pizza(NameKeyMixin, models.Model):
     """Models a single Pizza instance"""
 
-    pizza = models.CharField(
-                            max_length=200, unique=True,
-                            error_messages={'unique':'Pizza already exists'},
-                            db_collation= 'NOCASE'
+    name_field = 'pizza'
+
+    pizza = models.CharField(max_length=200)
+    # makes the pizza unique irregardless of case
+    pizza_key = models.CharField(
+                            max_length=200, unique=True, editable=False,
+                            error_messages={'unique':'Pizza already exists'}
                             )
     toppings = models.ManyToManyField(PizzaTopping)
+    # fingerprint of the set of toppings, kept up to date by pizza/signals.py, finds pizzas with the same toppings
+    toppings_fingerprint = models.CharField(max_length=64, db_index=True, editable=False, default=EMPTY_FINGERPRINT)
+    # names of the toppings by topping pk, kept up to date by pizza/signals.py, so pizzas are read without a join
+    topping_names = models.JSONField(default=list, editable=False)
 
     def __str__(self):
         return str(self.pizza)
+
+    @classmethod
+    def update_fingerprints(cls, pizza_pks, without=()):
+        """
+        Stores the fingerprints of the toppings of the pizzas, leaving out the toppings of without.
+        without is for the toppings that are about to be removed, while they are still in the database.
+        """
+        pizza_pks = list(pizza_pks)
+        # batches keep the IN lists below the query parameter limit of the database
+        for start in range(0, len(pizza_pks), FINGERPRINT_BATCH_SIZE):
+            batch = pizza_pks[start:start + FINGERPRINT_BATCH_SIZE]
+            topping_pks = defaultdict(list)
+            rows = cls.toppings.through.objects.filter(pizza_id__in=batch).exclude(pizzatopping_id__in=without)
+            for pizza_pk, topping_pk in rows.values_list('pizza_id', 'pizzatopping_id'):
+                topping_pks[pizza_pk].append(topping_pk)
+
+            pizzas = [cls(pk=pk, toppings_fingerprint=toppings_fingerprint(topping_pks[pk])) for pk in batch]
+            cls.objects.bulk_update(pizzas, ['toppings_fingerprint'])
+
+    @classmethod
+    def toppings_of(cls, pizza_pks, without=()):
+        """Returns the (pk, name) of the toppings of every pizza of pizza_pks by topping pk, leaving out without"""
+        toppings = defaultdict(list)
+        rows = cls.toppings.through.objects.filter(pizza_id__in=pizza_pks).exclude(pizzatopping_id__in=without)
+        rows = rows.order_by('pizza_id', 'pizzatopping_id')
+        for pizza_pk, topping_pk, name in rows.values_list('pizza_id', 'pizzatopping_id', 'pizzatopping__topping'):
+            toppings[pizza_pk].append((topping_pk, name))
+
+        return toppings
+
+    @classmethod
+    def update_topping_names(cls, pizza_pks, without=()):
+        """Stores the names of the toppings of the pizzas, without is the same as for update_fingerprints"""
+        pizza_pks = list(pizza_pks)
+        for start in range(0, len(pizza_pks), FINGERPRINT_BATCH_SIZE):
+            batch = pizza_pks[start:start + FINGERPRINT_BATCH_SIZE]
+            toppings = cls.toppings_of(batch, without)
+            pizzas = [cls(pk=pk, topping_names=[name for topping_pk, name in toppings[pk]]) for pk in batch]
+            cls.objects.bulk_update(pizzas, ['topping_names'])
+
+
+class CatalogVersion(models.Model):
+    """
+    Single row counting the changes made to toppings and pizzas.
+    Incremented by pizza/signals.py and used for the ETag and Last-Modified headers of GET responses.
+    """
+
+    version = models.PositiveBigIntegerField(default=0)
+    modified = models.DateTimeField(default=timezone.now)
+    # the changes up to this sequence number were deleted from CatalogChange by 'manage.py compact_changes'
+    compacted_seq = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return str(self.version)
+
+
+class CatalogChange(models.Model):
+    """
+    Log of the changes made to toppings and pizzas, read from /changes/?since=<seq> by clients keeping a copy of
+    the catalog. Written by pizza/signals.py after the catalog version is incremented: the write of the
+    CatalogVersion row holds the write lock until commit, so the sequence numbers follow the order of the commits.
+    Only the latest change of every topping and pizza is kept, a client behind it reads the object once.
+    """
+
+    TOPPING = 'topping'
+    PIZZA = 'pizza'
+    RESOURCES = [(TOPPING, 'Topping'), (PIZZA, 'Pizza')]
+
+    CREATED = 'created'
+    UPDATED = 'updated'
+    DELETED = 'deleted'
+    # the toppings of a pizza were added, removed, renamed or deleted
+    TOPPINGS = 'toppings'
+    ACTIONS = [(CREATED, 'Created'), (UPDATED, 'Updated'), (DELETED, 'Deleted'), (TOPPINGS, 'Toppings changed')]
+
+    # AUTOINCREMENT on sqlite, so a sequence number is never used again even after compaction
+    seq = models.BigAutoField(primary_key=True)
+    resource = models.CharField(max_length=10, choices=RESOURCES)
+    object_id = models.PositiveBigIntegerField()
+    action = models.CharField(max_length=10, choices=ACTIONS)
+    changed = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=['resource', 'object_id'], name='pizza_change_object_idx')]
+
+    @classmethod
+    def record(cls, resource, action, object_ids):
+        """Appends a change of every object of resource and deletes the earlier changes of the objects"""
+        object_ids = list(object_ids)
+        # pks aren't used again, so a created object has no earlier changes
+        if action != cls.CREATED:
+            for start in range(0, len(object_ids), CHANGE_BATCH_SIZE):
+                batch = object_ids[start:start + CHANGE_BATCH_SIZE]
+                cls.objects.filter(resource=resource, object_id__in=batch).delete()
+        if not object_ids:
+            return
+
+        # executemany instead of bulk_create, which builds and prepares every field of a model per change
+        connection = connections[router.db_for_write(cls)]
+        quote_name = connection.ops.quote_name
+        columns = ', '.join(quote_name(cls._meta.get_field(name).column) for name in CHANGE_COLUMNS)
+        changed = connection.ops.adapt_datetimefield_value(timezone.now())
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {quote_name(cls._meta.db_table)} ({columns}) VALUES (%s, %s, %s, %s)',
+                [(resource, pk, action, changed) for pk in object_ids]
+                )
+
+    @classmethod
+    def latest_seq(cls):
+        """Returns the sequence number of the last change, 0 when the log is empty"""
+        return cls.objects.aggregate(latest=models.Max('seq'))['latest'] or 0
+
+    def __str__(self):
+        return f'{self.seq} {self.resource} {self.object_id} {self.action}'
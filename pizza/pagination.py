@@ -0,0 +1,76 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination, CursorPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class PrimaryKeyCursorPagination(CursorPagination):
+    """
+    Keyset pagination ordered by primary key.
+    Pages are fetched with 'WHERE id > cursor LIMIT page_size' instead of OFFSET,
+    so the last page of a large table costs the same as the first page.
+    Pagination is only applied when ?page_size= is sent or PAGE_SIZE is set in REST_FRAMEWORK.
+    """
+
+    ordering = 'pk'
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+def since_param(request):
+    """Returns the sequence number of ?since=, 0 when it isn't sent"""
+    try:
+        since = int(request.query_params.get('since', 0))
+    except ValueError:
+        since = -1
+    if since < 0:
+        raise ValidationError({'since': ['Must be a sequence number, 0 or more.']})
+
+    return since
+
+
+class SequencePagination(BasePagination):
+    """
+    Keyset pagination of the change log by sequence number, oldest first.
+    Pages are fetched with 'WHERE seq > since LIMIT page_size' from the primary key, and the next page is the same
+    request with ?since= the last sequence number of the page. Always applied, ?page_size= sets the size of the pages.
+    """
+
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+
+        return min(max(page_size, 1), self.max_page_size)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        since = since_param(request)
+        page_size = self.get_page_size(request)
+        changes = list(queryset.filter(seq__gt=since).order_by('seq')[:page_size + 1])
+        self.has_next = len(changes) > page_size
+        page = changes[:page_size]
+        # what the client sends as ?since= next, the same when nothing changed
+        self.last_seq = page[-1].seq if page else since
+        self.latest_seq = queryset.model.latest_seq()
+
+        return page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+
+        return replace_query_param(self.request.build_absolute_uri(), 'since', self.last_seq)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'last_seq': self.last_seq,
+            'latest_seq': self.latest_seq,
+            'results': data,
+            })
@@ -0,0 +1,129 @@
+"""
+Authentication backend that keeps the permissions of users and groups in the response cache,
+so permission checks such as DjangoModelPermissionsOrAnonReadOnly don't query the database.
+Entries are dropped by pizza/signals.py when group membership or permissions change.
+Only enabled when the processes share the cache, see get_permission_cache.
+"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import Permission
+from django.db import transaction
+from pizza.cache import get_generation, get_response_cache, invalidate, is_shared
+
+
+# Resource whose generation is part of every key, invalidating it drops every entry
+PERMISSIONS = 'permissions'
+
+
+def get_permission_cache():
+    """
+    Returns the response cache when the processes share it, None otherwise.
+    A change of permissions drops the entries of the cache of the process making it, with a cache local to each
+    process the other processes would keep granting a revoked permission.
+    """
+    cache = get_response_cache()
+
+    return cache if cache is not None and is_shared(cache) else None
+
+
+def _user_key(generation, pk):
+    return f'pizza:permissions:{generation}:user:{pk}'
+
+
+def _group_key(generation, pk):
+    return f'pizza:permissions:{generation}:group:{pk}'
+
+
+def _all_key(generation):
+    return f'pizza:permissions:{generation}:all'
+
+
+def _permission_names(permissions):
+    permissions = permissions.values_list('content_type__app_label', 'codename').order_by()
+
+    return frozenset(f'{app_label}.{codename}' for app_label, codename in permissions)
+
+
+def _get_group_permissions(cache, generation, group_pks):
+    """Returns the permissions of the groups, the groups missing from the cache are loaded in one query"""
+    keys = {_group_key(generation, pk): pk for pk in group_pks}
+    cached = cache.get_many(keys)
+    missing = {pk: set() for key, pk in keys.items() if key not in cached}
+    if missing:
+        permissions = Permission.objects.filter(group__in=missing).values_list(
+            'group', 'content_type__app_label', 'codename'
+            ).order_by()
+        for group_pk, app_label, codename in permissions:
+            missing[group_pk].add(f'{app_label}.{codename}')
+
+        loaded = {_group_key(generation, pk): frozenset(names) for pk, names in missing.items()}
+        cache.set_many(loaded, getattr(settings, 'PIZZA_CACHE_TIMEOUT', 300))
+        cached.update(loaded)
+
+    return frozenset().union(*cached.values())
+
+
+def get_permission_map(cache, user):
+    """Returns every permission of an active user from the cache, loading the missing entries"""
+    generation = get_generation(cache, PERMISSIONS)
+    timeout = getattr(settings, 'PIZZA_CACHE_TIMEOUT', 300)
+    if user.is_superuser:
+        permissions = cache.get(_all_key(generation))
+        if permissions is None:
+            permissions = _permission_names(Permission.objects.all())
+            cache.set(_all_key(generation), permissions, timeout)
+
+        return permissions
+
+    # the user's own permissions and the groups the user is in
+    entry = cache.get(_user_key(generation, user.pk))
+    if entry is None:
+        entry = (_permission_names(user.user_permissions.all()), tuple(user.groups.values_list('pk', flat=True)))
+        cache.set(_user_key(generation, user.pk), entry, timeout)
+
+    user_permissions, group_pks = entry
+
+    return user_permissions | _get_group_permissions(cache, generation, group_pks)
+
+
+def _delete_keys(make_key, pks):
+    cache = get_permission_cache()
+    if cache is not None:
+        generation = get_generation(cache, PERMISSIONS)
+        cache.delete_many([make_key(generation, pk) for pk in pks])
+
+
+def forget_users(user_pks):
+    """Drops the cached permissions of the users, again after commit in case a read raced the transaction"""
+    user_pks = list(user_pks)
+    _delete_keys(_user_key, user_pks)
+    transaction.on_commit(lambda: _delete_keys(_user_key, user_pks))
+
+
+def forget_groups(group_pks):
+    """Drops the cached permissions of the groups, again after commit in case a read raced the transaction"""
+    group_pks = list(group_pks)
+    _delete_keys(_group_key, group_pks)
+    transaction.on_commit(lambda: _delete_keys(_group_key, group_pks))
+
+
+def forget_all():
+    if get_permission_cache() is not None:
+        invalidate(PERMISSIONS)
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend that reads the permissions of active users from the cache.
+    Falls back to ModelBackend when the response cache is disabled or local to the process.
+    """
+
+    def get_all_permissions(self, user_obj, obj=None):
+        cache = get_permission_cache()
+        if cache is None or not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return super().get_all_permissions(user_obj, obj=obj)
+
+        if not hasattr(user_obj, '_perm_cache'):
+            user_obj._perm_cache = get_permission_map(cache, user_obj)
+
+        return user_obj._perm_cache
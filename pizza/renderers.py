@@ -0,0 +1,63 @@
+"""
+Renderers of the topping and pizza views, next to DRF's JSON and browsable API renderers.
+MessagePackRenderer is selected with 'Accept: application/msgpack' or ?format=msgpack.
+ORJSONRenderer renders the same JSON as JSONRenderer with orjson, which is several times faster. It is selected with
+'Accept: application/json; encoder=orjson' or ?format=orjson, a plain 'Accept: application/json' keeps JSONRenderer.
+"""
+import msgpack
+import orjson
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import BaseRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+
+# converts the values msgpack and orjson can't encode, e.g. lazy translations, like DRF's JSONRenderer
+_encoder = JSONEncoder()
+
+
+class ORJSONRenderer(BaseRenderer):
+    media_type = 'application/json; encoder=orjson'
+    format = 'orjson'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        content = orjson.dumps(data, default=_encoder.default)
+        # escaped by JSONRenderer as they end lines in javascript
+        return content.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        return msgpack.packb(data, default=_encoder.default)
+
+
+# ORJSONRenderer comes first since its media type only matches requests asking for it
+RENDERER_CLASSES = [ORJSONRenderer, *api_settings.DEFAULT_RENDERER_CLASSES, MessagePackRenderer]
+
+
+class FormatContentNegotiation(DefaultContentNegotiation):
+    """
+    ?format= picks its renderer whatever the Accept header is.
+    DefaultContentNegotiation still matches the Accept header, which never matches the media type of ORJSONRenderer
+    unless it asks for it.
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        format = format_suffix or request.query_params.get(self.settings.URL_FORMAT_OVERRIDE)
+        if format:
+            renderers = self.filter_renderers(renderers, format)
+            return renderers[0], renderers[0].media_type
+
+        return super().select_renderer(request, renderers, format_suffix)
@@ -0,0 +1,128 @@
+"""
+Sends the reads of GET requests to the read replicas of settings.PIZZA_READ_REPLICAS.
+A client that made a change reads from the default database for PIZZA_REPLICA_PIN_SECONDS afterwards,
+so it doesn't read a replica, or the catalog snapshot of pizza/snapshot.py, that hasn't caught up with its own
+change yet. Clients sending credentials are also pinned in the PIZZA_CACHE_ALIAS cache when the processes share it,
+and always read from default otherwise.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.utils.crypto import salted_hmac
+from rest_framework.permissions import SAFE_METHODS
+
+
+PIN_COOKIE = 'pizza_primary'
+
+# database alias for the reads of the current request, None reads from default
+_read_database = ContextVar('pizza_read_database', default=None)
+
+
+def get_replicas():
+    return getattr(settings, 'PIZZA_READ_REPLICAS', [])
+
+
+def reading_from_replica():
+    """True while the reads of the current request go to a replica"""
+    return _read_database.get() is not None
+
+
+def _credentials_key(request):
+    """Clients sending credentials are pinned by their credentials as they may not keep cookies"""
+    authorization = request.headers.get('Authorization')
+    if not authorization:
+        return None
+
+    digest = salted_hmac('pizza.routers.pin', authorization, algorithm='sha256').hexdigest()
+    return f'pizza:pinned:{digest}'
+
+
+def get_pin_cache():
+    """
+    Returns the response cache when the processes share it, None otherwise.
+    A pin kept by the process that made the change isn't seen by the process answering the next read.
+    """
+    # pizza.cache imports this module
+    from pizza.cache import get_response_cache, is_shared
+
+    cache = get_response_cache()
+
+    return cache if cache is not None and is_shared(cache) else None
+
+
+def is_pinned(request):
+    """
+    True when the client made a change within the last PIZZA_REPLICA_PIN_SECONDS.
+    Clients sending credentials are always pinned when there is no shared cache to keep their pins.
+    """
+    if PIN_COOKIE in request.COOKIES:
+        return True
+
+    key = _credentials_key(request)
+    if key is None:
+        return False
+
+    cache = get_pin_cache()
+    return cache is None or cache.get(key) is not None
+
+
+def pin_to_primary(request, response):
+    """Makes the next reads of the client go to the default database"""
+    if not get_replicas() and not getattr(settings, 'PIZZA_CATALOG_SNAPSHOT', False):
+        return
+
+    seconds = getattr(settings, 'PIZZA_REPLICA_PIN_SECONDS', 5)
+    response.set_cookie(PIN_COOKIE, '1', max_age=seconds, httponly=True, samesite='Lax')
+    key = _credentials_key(request)
+    cache = get_pin_cache()
+    if key is not None and cache is not None:
+        cache.set(key, True, seconds)
+
+
+def choose_replica(request):
+    """Returns the replica alias for the reads of request, None to read from default"""
+    replicas = get_replicas()
+    if not replicas or request.method not in SAFE_METHODS or is_pinned(request):
+        return None
+
+    return random.choice(replicas)
+
+
+@contextmanager
+def replica_reads(request):
+    """Sends the reads made inside the block to a replica unless the client is pinned to default"""
+    token = _read_database.set(choose_replica(request))
+    try:
+        yield
+    finally:
+        _read_database.reset(token)
+
+
+class ReplicaRouter:
+    """Database router for settings.DATABASE_ROUTERS"""
+
+    def db_for_read(self, model, **hints):
+        return _read_database.get()
+
+    def allow_migrate(self, db, app_label, **hints):
+        # replicas get their tables from the default database
+        if db in get_replicas():
+            return False
+
+        return None
+
+
+class ReplicaReadsMixin:
+    """Reads of GET requests to the view go to a replica and successful changes pin the client to default"""
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method in SAFE_METHODS:
+            with replica_reads(request):
+                return super().dispatch(request, *args, **kwargs)
+
+        response = super().dispatch(request, *args, **kwargs)
+        if response.status_code < 400:
+            pin_to_primary(request, response)
+
+        return response
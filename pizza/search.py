@@ -0,0 +1,172 @@
+"""
+?prefix= and ?search= filters of the topping and pizza lists.
+
+?prefix= is a range over the unique <name>_key index, so it costs one index seek whatever the size of the table.
+On PostgreSQL, whose collations may not order the keys by code point, it is a LIKE 'prefix%' answered by the
+varchar_pattern_ops index django adds to the unique key.
+?search= matches names having a word starting with every word of the search. On sqlite it is answered by an FTS5
+table per model, kept in sync with the model table by triggers. The tables and triggers are created after migrate
+when they are missing, since sqlite drops the triggers of a table that a migration rebuilds. On PostgreSQL it is
+answered by a GIN index of the tsvector of the names, created after migrate as well. Other databases aren't supported.
+"""
+import sys
+from django.db import NotSupportedError, connections, router
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_migrate
+from django.dispatch import receiver
+from rest_framework.filters import BaseFilterBackend
+from pizza.models import PizzaTopping, Pizza, nocase
+
+
+SEARCH_MODELS = (PizzaTopping, Pizza)
+
+
+def search_table(model):
+    return f'{model._meta.db_table}_search'
+
+
+def _trigger_names(model):
+    search = search_table(model)
+    return [f'{search}_insert', f'{search}_delete', f'{search}_update']
+
+
+def _search_index_sql(model):
+    """Returns the statements creating the FTS5 table of model and the triggers that keep it in sync"""
+    table = model._meta.db_table
+    column = model._meta.get_field(model.name_field).column
+    search = search_table(model)
+    insert, delete, update = _trigger_names(model)
+
+    return [
+        # external content table, the names are only stored in the model table
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {search} USING fts5("
+        f"{column}, content='{table}', content_rowid='id', prefix='2 3')",
+        f"CREATE TRIGGER IF NOT EXISTS {insert} AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {search}(rowid, {column}) VALUES (new.id, new.{column}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {delete} AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {search}({search}, rowid, {column}) VALUES ('delete', old.id, old.{column}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {update} AFTER UPDATE OF {column} ON {table} BEGIN "
+        f"INSERT INTO {search}({search}, rowid, {column}) VALUES ('delete', old.id, old.{column}); "
+        f"INSERT INTO {search}(rowid, {column}) VALUES (new.id, new.{column}); END",
+    ]
+
+
+def _postgresql_search_index_sql(model):
+    """Returns the statement creating the GIN index of the words of the names of model"""
+    table = model._meta.db_table
+    column = model._meta.get_field(model.name_field).column
+
+    # the 'simple' configuration folds the case of the words and keeps them whole, like the FTS5 table
+    return f"CREATE INDEX IF NOT EXISTS {search_table(model)} ON {table} USING gin (to_tsvector('simple', {column}))"
+
+
+def _has_triggers(cursor, model):
+    names = _trigger_names(model)
+    cursor.execute(
+        f"SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name IN ({', '.join(['%s'] * len(names))})",
+        names
+        )
+    return cursor.fetchone()[0] == len(names)
+
+
+@receiver(post_migrate)
+def create_search_indexes(sender, using, **kwargs):
+    connection = connections[using]
+    if sender.name != 'pizza' or connection.vendor not in ('sqlite', 'postgresql'):
+        return
+
+    with connection.cursor() as cursor:
+        for model in SEARCH_MODELS:
+            if not router.allow_migrate_model(using, model):
+                continue
+            if connection.vendor == 'postgresql':
+                cursor.execute(_postgresql_search_index_sql(model))
+                continue
+            if _has_triggers(cursor, model):
+                continue
+
+            for statement in _search_index_sql(model):
+                cursor.execute(statement)
+            # the model table may have changed while the triggers were missing
+            search = search_table(model)
+            cursor.execute(f"INSERT INTO {search}({search}) VALUES ('rebuild')")
+
+
+def prefix_range(prefix):
+    """
+    Returns the bounds of the keys starting with prefix, lower <= key < upper, upper is None when unbounded.
+    The keys compare by code point, like sqlite's BINARY collation, so upper is prefix with its last character
+    incremented. Not for PostgreSQL, which compares them with the collation of the database.
+    """
+    stem = prefix.rstrip(chr(sys.maxunicode))
+    if not stem:
+        return prefix, None
+
+    following = ord(stem[-1]) + 1
+    # surrogates can't be encoded, the next character is the first after them
+    if 0xD800 <= following <= 0xDFFF:
+        following = 0xE000
+
+    return prefix, stem[:-1] + chr(following)
+
+
+def filter_prefix(queryset, prefix):
+    """Filters queryset to the names starting with prefix, regardless of case"""
+    key_field = queryset.model.key_field()
+    if connections[queryset.db].vendor == 'postgresql':
+        return queryset.filter(**{f'{key_field}__startswith': nocase(prefix)})
+
+    lower, upper = prefix_range(nocase(prefix))
+    queryset = queryset.filter(**{f'{key_field}__gte': lower})
+
+    return queryset if upper is None else queryset.filter(**{f'{key_field}__lt': upper})
+
+
+def tsquery(words):
+    """
+    Returns the to_tsquery() text matching the names having a word starting with every word of words.
+    Every word is quoted so it is matched as a prefix and never read as tsquery syntax.
+    """
+    quoted = ("'{}'".format(word.replace('\\', '\\\\').replace("'", "''")) for word in words)
+
+    return ' & '.join(f'{word}:*' for word in quoted)
+
+
+def filter_search(queryset, search):
+    """Filters queryset to the names having a word starting with every word of search"""
+    words = search.split()
+    if not words:
+        return queryset
+
+    model = queryset.model
+    vendor = connections[queryset.db].vendor
+    if vendor == 'sqlite':
+        table = search_table(model)
+        # every word is quoted so it is matched as a prefix and never read as FTS5 syntax
+        match = ' '.join('"{}"*'.format(word.replace('"', '""')) for word in words)
+        return queryset.filter(pk__in=RawSQL(f'SELECT rowid FROM {table} WHERE {table} MATCH %s', (match,)))
+
+    if vendor == 'postgresql':
+        table = model._meta.db_table
+        column = model._meta.get_field(model.name_field).column
+        # the same expression as the index, see _postgresql_search_index_sql
+        match = f"to_tsvector('simple', {column}) @@ to_tsquery('simple', %s)"
+        return queryset.filter(pk__in=RawSQL(f'SELECT {model._meta.pk.column} FROM {table} WHERE {match}', (tsquery(words),)))
+
+    # a LIKE '%word%' would scan the whole table
+    raise NotSupportedError(f'?search= needs the search index of sqlite or PostgreSQL, not {vendor}')
+
+
+class NameSearchFilter(BaseFilterBackend):
+    """Filter backend of the ?prefix= and ?search= query parameters"""
+
+    def filter_queryset(self, request, queryset, view):
+        prefix = request.query_params.get('prefix')
+        if prefix:
+            queryset = filter_prefix(queryset, prefix)
+
+        search = request.query_params.get('search')
+        if search:
+            queryset = filter_search(queryset, search)
+
+        return queryset
@@ -1,11 +1,274 @@
-from pizza.models import PizzaTopping, Pizza
+from collections import defaultdict
+from operator import attrgetter, itemgetter
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import QuerySet
+from pizza.models import CatalogChange, PizzaTopping, Pizza, nocase, toppings_fingerprint
+from pizza.signals import bulk_created
 from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
+from rest_framework.reverse import reverse
 
-class PizzaToppingSerializer(serializers.ModelSerializer):
+
+# Maximum number of toppings that can be created in one request
+BULK_CREATE_MAX_LENGTH = 10000
+
+
+def _batched(values):
+    """Splits values into lists that fit in the query parameter limit of the database"""
+    batch_size = connection.features.max_query_params
+    for start in range(0, len(values), batch_size):
+        yield values[start:start + batch_size]
+
+
+def requested_fields(request, serializer_class):
+    """
+    Returns the field names sent in ?fields=, comma separated, or None when every field is wanted.
+    Names that aren't fields of serializer_class are rejected with a 400.
+    """
+    names = [name.strip() for name in request.query_params.get('fields', '').split(',') if name.strip()]
+    if not names:
+        return None
+
+    unknown = [name for name in names if name not in serializer_class.Meta.fields]
+    if unknown:
+        raise serializers.ValidationError({'fields': [f'Unknown field: {name}' for name in unknown]})
+
+    return names
+
+
+def only_requested(queryset, fields):
+    """Leaves the columns and relations of the fields that aren't requested out of queryset"""
+    if fields is None:
+        return queryset
+
+    model = queryset.model
+    columns = [field.name for field in model._meta.concrete_fields if field.name in fields]
+    queryset = queryset.only('pk', *columns)
+    # prefetch_related(None) drops every prefetch, the requested ones are added back
+    prefetches = [
+        lookup for lookup in queryset._prefetch_related_lookups
+        if getattr(lookup, 'prefetch_through', lookup).split('__')[0] in fields
+        ]
+
+    return queryset.prefetch_related(None).prefetch_related(*prefetches)
+
+
+class SparseFieldsMixin:
+    """
+    Keeps only the fields listed in context['fields'], see requested_fields().
+    The other fields are removed before serialization, so their values, urls and relations are never looked up.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = self._context.get('fields')
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class TemplatedHyperlinkedIdentityField(serializers.HyperlinkedIdentityField):
+    """
+    HyperlinkedIdentityField that reverses the url once per serializer instead of once per object.
+    The url of a placeholder pk is split around the pk and every object's url is the pk put back between the parts,
+    which is the same url reverse() builds for an integer pk. Other lookup values are reversed as usual.
+    """
+
+    PLACEHOLDER = 9223372036854775807
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._templates = {}
+
+    def _template(self, view_name, request, format):
+        """Returns the parts of the url around the lookup value, None when the url can't be split"""
+        key = (view_name, format)
+        if key not in self._templates:
+            kwargs = {self.lookup_url_kwarg: self.PLACEHOLDER}
+            url = self.reverse(view_name, kwargs=kwargs, request=request, format=format)
+            parts = url.split(str(self.PLACEHOLDER))
+            self._templates[key] = parts if len(parts) == 2 else None
+
+        return self._templates[key]
+
+    def url_template(self):
+        """Returns the parts of the url around the lookup value for the request of the context, see _template"""
+        format = self.context.get('format')
+        if format and self.format and self.format != format:
+            format = self.format
+
+        return self._template(self.view_name, self.context.get('request'), format)
+
+    def get_url(self, obj, view_name, request, format):
+        lookup_value = getattr(obj, self.lookup_field)
+        if type(lookup_value) is not int:
+            return super().get_url(obj, view_name, request, format)
+
+        template = self._template(view_name, request, format)
+        if template is None:
+            return super().get_url(obj, view_name, request, format)
+
+        return f'{template[0]}{lookup_value}{template[1]}'
+
+
+def unique_message(model):
+    """The error message of a duplicate name, taken from the unique key field of model"""
+    return model._meta.get_field(model.key_field()).error_messages['unique']
+
+
+class UniqueNameMixin:
+    """
+    Leaves the uniqueness of the name to the unique index of the key field, see NameKeyMixin.
+    The write is attempted without looking for a duplicate first, and the IntegrityError of a duplicate
+    is raised as the ValidationError a uniqueness validator would have raised, so the response is still a 400.
+    """
+
+    def create(self, validated_data):
+        return self._write(super().create, validated_data)
+
+    def update(self, instance, validated_data):
+        return self._write(super().update, instance, validated_data)
+
+    def _write(self, write, *args):
+        model = self.Meta.model
+        try:
+            # the savepoint keeps the transaction usable after the error
+            with transaction.atomic():
+                return write(*args)
+        except IntegrityError:
+            # the error may come from another constraint, the duplicate is only looked up once the write failed
+            name = args[-1].get(model.name_field)
+            duplicates = model.objects.filter(**{model.key_field(): nocase(name or '')})
+            if self.instance is not None:
+                duplicates = duplicates.exclude(pk=self.instance.pk)
+            if name is None or not duplicates.exists():
+                raise
+
+            raise serializers.ValidationError({model.name_field: [unique_message(model)]})
+
+
+class SlugsRelatedField(serializers.ManyRelatedField):
+    """
+    Resolves a list of slugs in one IN query on the lookup key of the model instead of one query per slug.
+    Slugs are matched regardless of case like the key, see NameKeyMixin.
+    The related objects are listed by pk, an unordered query returns them in the order of the plan of the database.
+    """
+
+    def get_attribute(self, instance):
+        return sorted(super().get_attribute(instance), key=attrgetter('pk'))
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+
+        child = self.child_relation
+        keys = {nocase(slug) for slug in data if isinstance(slug, str)}
+        queryset = child.get_queryset()
+        key_field = queryset.model.key_field()
+        objects = {}
+        for batch in _batched(list(keys)):
+            for obj in queryset.filter(**{f'{key_field}__in': batch}):
+                objects[getattr(obj, key_field)] = obj
+
+        values = []
+        errors = []
+        for slug in data:
+            if not isinstance(slug, str):
+                # other types are left to the single lookup of the slug field
+                try:
+                    values.append(child.to_internal_value(slug))
+                except serializers.ValidationError as error:
+                    errors.extend(error.detail)
+            elif nocase(slug) in objects:
+                values.append(objects[nocase(slug)])
+            else:
+                message = child.error_messages['does_not_exist'].format(slug_name=child.slug_field, value=slug)
+                errors.append(message)
+
+        if errors:
+            raise serializers.ValidationError(errors)
+
+        return values
+
+
+class BatchedSlugRelatedField(serializers.SlugRelatedField):
+    """SlugRelatedField that is resolved with SlugsRelatedField when many=True"""
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+
+        return SlugsRelatedField(**list_kwargs)
+
+
+class PizzaToppingListSerializer(serializers.ListSerializer):
+    """
+    Creates a list of toppings at once.
+    The toppings are inserted with bulk_create in one transaction. Repeated toppings in the list are rejected
+    before the insert and stored toppings by the unique index, they are only looked up when the insert fails.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('max_length', BULK_CREATE_MAX_LENGTH)
+        super().__init__(*args, **kwargs)
+
+    @staticmethod
+    def _existing_keys(keys):
+        """Returns the keys of the stored toppings matching any of keys"""
+        for batch in _batched(keys):
+            yield from PizzaTopping.objects.filter(topping_key__in=batch).values_list('topping_key', flat=True)
+
+    @staticmethod
+    def _duplicate_errors(keys, stored=()):
+        """Returns the errors of every topping, toppings in stored and repeats of earlier toppings are duplicates"""
+        message = unique_message(PizzaTopping)
+        seen = set(stored)
+        errors = []
+        for key in keys:
+            errors.append({'topping': [message]} if key in seen else {})
+            seen.add(key)
+
+        return errors
+
+    def to_internal_value(self, data):
+        validated_data = super().to_internal_value(data)
+        errors = self._duplicate_errors([nocase(item['topping']) for item in validated_data])
+        if any(errors):
+            raise serializers.ValidationError(errors)
+
+        return validated_data
+
+    def create(self, validated_data):
+        toppings = [PizzaTopping(**item) for item in validated_data]
+        # bulk_create doesn't call save(), which sets the key
+        for topping in toppings:
+            topping.set_key()
+        try:
+            with transaction.atomic():
+                PizzaTopping.objects.bulk_create(toppings)
+                # bulk_create doesn't send post_save
+                bulk_created.send(sender=PizzaTopping, instances=toppings)
+        except IntegrityError:
+            keys = [topping.topping_key for topping in toppings]
+            errors = self._duplicate_errors(keys, stored=self._existing_keys(keys))
+            if not any(errors):
+                raise
+            raise serializers.ValidationError(errors)
+
+        return toppings
+
+
+class PizzaToppingSerializer(SparseFieldsMixin, UniqueNameMixin, serializers.ModelSerializer):
     """Displays toppings and url to individual topping pages."""
 
     # url for individual pizza topping entry
-    url = serializers.HyperlinkedIdentityField(
+    url = TemplatedHyperlinkedIdentityField(
                                             view_name='toppings_detail',
                                             read_only=True
                                             )
@@ -13,19 +276,21 @@ class PizzaToppingSerializer(serializers.ModelSerializer):
     class Meta:
         model = PizzaTopping
         fields = ['topping', 'url']
+        list_serializer_class = PizzaToppingListSerializer
 
 
-class PizzaSerializer(serializers.ModelSerializer):
+class PizzaSerializer(SparseFieldsMixin, UniqueNameMixin, serializers.ModelSerializer):
     """Displays pizza, associated toppings and url to individual pizza pages."""
 
     # SlugRelatedField was used to represent field as 'topping' instead of pk
-    toppings = serializers.SlugRelatedField(
+    # all toppings of the pizza are looked up in one query when validating
+    toppings = BatchedSlugRelatedField(
                                             many=True,
                                             queryset= PizzaTopping.objects.all(),
                                             slug_field='topping'
                                             )
                                             
-    url = serializers.HyperlinkedIdentityField(
+    url = TemplatedHyperlinkedIdentityField(
                                             view_name='pizzas_detail',
                                             read_only=True
                                             )
@@ -33,3 +298,189 @@ class PizzaSerializer(serializers.ModelSerializer):
     class Meta:
         model = Pizza
         fields = ['pizza', 'toppings', 'url' ]
+
+    def validate(self, attrs):
+        # with settings.PIZZA_UNIQUE_TOPPING_SETS two pizzas can't have the same toppings
+        if getattr(settings, 'PIZZA_UNIQUE_TOPPING_SETS', False) and 'toppings' in attrs:
+            fingerprint = toppings_fingerprint(topping.pk for topping in attrs['toppings'])
+            duplicates = Pizza.objects.filter(toppings_fingerprint=fingerprint)
+            if self.instance is not None:
+                duplicates = duplicates.exclude(pk=self.instance.pk)
+            duplicate = duplicates.values_list('pizza', flat=True).first()
+            if duplicate is not None:
+                raise serializers.ValidationError({'toppings': [f'{duplicate} already has these toppings']})
+
+        return attrs
+
+
+def reads_topping_names():
+    """True when the toppings of pizzas are read from Pizza.topping_names instead of Pizza.toppings"""
+    return getattr(settings, 'PIZZA_DENORMALIZED_TOPPINGS', True)
+
+
+class ValuesReadSerializer:
+    """
+    Read-only serializer of the rows of values() for the lists, with the same output as serializer_class.
+    The rows are turned into dicts directly instead of building model instances and running every field
+    of serializer_class on them. serializer_class is still used for single entries and for validating writes.
+    """
+
+    serializer_class = None
+
+    def __init__(self, rows, context):
+        self.rows = rows
+        self.context = context
+        # the fields keep the order of serializer_class, see SparseFieldsMixin
+        fields = context.get('fields')
+        self.field_names = [name for name in self.serializer_class.Meta.fields if fields is None or name in fields]
+
+    @classmethod
+    def columns(cls, fields):
+        """Returns the columns of the rows for fields, see requested_fields(), besides the pk"""
+        name_field = cls.serializer_class.Meta.model.name_field
+
+        return [name_field] if fields is None or name_field in fields else []
+
+    @classmethod
+    def values(cls, queryset, fields=None):
+        """
+        Returns the rows of queryset read by the serializer, they can be paginated like the queryset.
+        Rows are ordered by pk unless queryset is ordered, so the order doesn't change with the columns that are read.
+        """
+        if not queryset.ordered:
+            queryset = queryset.order_by('pk')
+
+        return queryset.prefetch_related(None).values('pk', *cls.columns(fields))
+
+    def _url_getter(self):
+        """Returns the function building the url of a row, like TemplatedHyperlinkedIdentityField"""
+        field = self.serializer_class(context=self.context).fields['url']
+        template = field.url_template()
+        if template is None:
+            model = self.serializer_class.Meta.model
+            return lambda row: field.to_representation(model(pk=row['pk']))
+
+        start, end = template
+        return lambda row: f'{start}{row["pk"]}{end}'
+
+    def related_getters(self, pks):
+        """
+        Returns the functions of the fields that aren't columns of the rows, looked up for all rows at once.
+        pks is the list of the pks of the rows, or a subquery of them for a whole list.
+        """
+        return {}
+
+    @property
+    def data(self):
+        # a whole list is looked up with a subquery instead of a parameter per row
+        pks = self.rows.values('pk') if isinstance(self.rows, QuerySet) else None
+        rows = list(self.rows)
+        name_field = self.serializer_class.Meta.model.name_field
+        getters = {name_field: itemgetter(name_field)} if name_field in self.field_names else {}
+        if 'url' in self.field_names:
+            getters['url'] = self._url_getter()
+        getters.update(self.related_getters([row['pk'] for row in rows] if pks is None else pks))
+        getters = [(name, getters[name]) for name in self.field_names]
+
+        return [{name: getter(row) for name, getter in getters} for row in rows]
+
+
+class PizzaToppingReadSerializer(ValuesReadSerializer):
+    """Output of PizzaToppingSerializer for the rows of PizzaToppingReadSerializer.values()"""
+
+    serializer_class = PizzaToppingSerializer
+
+
+class PizzaReadSerializer(ValuesReadSerializer):
+    """
+    Output of PizzaSerializer for the rows of PizzaReadSerializer.values().
+    The names of the toppings are read from Pizza.topping_names with the rest of the row, unless
+    settings.PIZZA_DENORMALIZED_TOPPINGS is False. Then they are read in one query, in the order of the index
+    of Pizza.toppings, which lists the toppings of every pizza by pk like SlugsRelatedField.
+    """
+
+    serializer_class = PizzaSerializer
+
+    @classmethod
+    def columns(cls, fields):
+        columns = super().columns(fields)
+        if reads_topping_names() and (fields is None or 'toppings' in fields):
+            columns.append('topping_names')
+
+        return columns
+
+    def related_getters(self, pks):
+        if 'toppings' not in self.field_names:
+            return {}
+        if reads_topping_names():
+            return {'toppings': itemgetter('topping_names')}
+
+        toppings = defaultdict(list)
+        through = Pizza.toppings.through.objects.filter(pizza_id__in=pks).order_by('pizza_id', 'pizzatopping_id')
+        for pizza_pk, topping in through.values_list('pizza_id', 'pizzatopping__topping'):
+            toppings[pizza_pk].append(topping)
+
+        # a new list for every pizza, like the serializer
+        return {'toppings': lambda row: list(toppings.get(row['pk'], ()))}
+
+
+class CatalogChangeListSerializer(serializers.ListSerializer):
+    """
+    Output of CatalogChangeSerializer with the current data of the topping or pizza of every change as 'data',
+    null once it was deleted. The objects of a page are read with one query per resource like the lists, and the
+    changes are turned into dicts directly with the urls built from the url template of the read serializers.
+    """
+
+    READ_SERIALIZERS = {CatalogChange.TOPPING: PizzaToppingReadSerializer, CatalogChange.PIZZA: PizzaReadSerializer}
+
+    def _read_objects(self, read_serializer, object_ids):
+        """Returns the data of the objects that still exist by pk"""
+        rows = read_serializer.values(read_serializer.serializer_class.Meta.model.objects.filter(pk__in=object_ids))
+        # evaluated first so the rows can be zipped with their data, which is built from the same result
+        list(rows)
+        data = read_serializer(rows, context={'request': self.context.get('request'), 'fields': None}).data
+
+        return {row['pk']: item for row, item in zip(rows, data)}
+
+    def to_representation(self, data):
+        changes = list(data)
+        object_ids = defaultdict(list)
+        for change in changes:
+            object_ids[change.resource].append(change.object_id)
+
+        objects = {}
+        urls = {}
+        for resource, pks in object_ids.items():
+            read_serializer = self.READ_SERIALIZERS[resource]
+            objects[resource] = self._read_objects(read_serializer, pks)
+            urls[resource] = read_serializer([], context={'request': self.context.get('request')})._url_getter()
+
+        changed = self.child.fields['changed']
+        return [{
+            'seq': change.seq,
+            'resource': change.resource,
+            'object_id': change.object_id,
+            'action': change.action,
+            'changed': changed.to_representation(change.changed),
+            'url': urls[change.resource]({'pk': change.object_id}),
+            'data': objects[change.resource].get(change.object_id),
+            } for change in changes]
+
+
+class CatalogChangeSerializer(serializers.ModelSerializer):
+    """Displays a change of the change log and the url of the topping or pizza that changed."""
+
+    DETAIL_VIEWS = {CatalogChange.TOPPING: 'toppings_detail', CatalogChange.PIZZA: 'pizzas_detail'}
+
+    # the url of a deleted topping or pizza answers 404
+    url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = CatalogChange
+        fields = ['seq', 'resource', 'object_id', 'action', 'changed', 'url']
+        list_serializer_class = CatalogChangeListSerializer
+
+    def get_url(self, change):
+        view_name = self.DETAIL_VIEWS[change.resource]
+
+        return reverse(view_name, kwargs={'pk': change.object_id}, request=self.context.get('request'))
@@ -0,0 +1,198 @@
+"""
+Invalidates cached responses and increments the catalog version when toppings and pizzas are changed.
+Updates the toppings fingerprints and topping names of pizzas when their toppings change.
+Appends the changes of toppings and pizzas to CatalogChange, after the catalog version is incremented.
+Drops cached permissions when group membership or permissions change.
+"""
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import Signal, receiver
+from pizza.cache import PIZZA_DETAIL, PIZZA_LIST, TOPPING_DETAIL, TOPPING_LIST, invalidate
+from pizza.conditional import bump_catalog_version
+from pizza.models import CatalogChange, PizzaTopping, Pizza
+from pizza.permissions import forget_all, forget_groups, forget_users
+
+
+User = get_user_model()
+
+# Sent with the created instances after bulk_create, which doesn't send post_save
+bulk_created = Signal()
+
+
+def _changed_pks(instance, action, reverse, pk_set, reverse_accessor):
+    """
+    Returns the pks of the forward side of a changed many to many relation, None before anything changed.
+    When the relation is changed from the reverse side, instance is the related object and pk_set holds the forward pks.
+    """
+    if action in ('post_add', 'post_remove'):
+        return pk_set if reverse else [instance.pk]
+    if action == 'pre_clear':
+        return getattr(instance, reverse_accessor).values_list('pk', flat=True) if reverse else [instance.pk]
+
+    return None
+
+
+def _catalog_changed(*resources):
+    if not resources:
+        return
+
+    invalidate(*resources)
+    bump_catalog_version()
+
+
+def _pizza_resources(pizza_pks):
+    pizza_pks = list(pizza_pks)
+    if not pizza_pks:
+        return []
+
+    return [PIZZA_LIST] + [PIZZA_DETAIL.format(pk=pk) for pk in pizza_pks]
+
+
+def _topping_resources(topping):
+    """The topping and every pizza that lists the topping"""
+    pizza_pks = topping.pizza_set.values_list('pk', flat=True)
+
+    return [TOPPING_LIST, TOPPING_DETAIL.format(pk=topping.pk)] + _pizza_resources(pizza_pks)
+
+
+@receiver(post_save, sender=PizzaTopping)
+def topping_saved(sender, instance, created, **kwargs):
+    if created:
+        # a new topping isn't on any pizza yet
+        _catalog_changed(TOPPING_LIST, TOPPING_DETAIL.format(pk=instance.pk))
+    else:
+        _catalog_changed(*_topping_resources(instance))
+
+
+@receiver(bulk_created, sender=PizzaTopping)
+def toppings_bulk_created(sender, instances, **kwargs):
+    # new toppings aren't on any pizza yet
+    _catalog_changed(TOPPING_LIST)
+
+
+@receiver(pre_delete, sender=PizzaTopping)
+def topping_deleted(sender, instance, **kwargs):
+    # pizzas are looked up before the delete removes the topping from them
+    _catalog_changed(*_topping_resources(instance))
+
+
+@receiver([post_save, post_delete], sender=Pizza)
+def pizza_changed(sender, instance, **kwargs):
+    _catalog_changed(*_pizza_resources([instance.pk]))
+
+
+@receiver(m2m_changed, sender=Pizza.toppings.through)
+def pizza_toppings_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    pizza_pks = _changed_pks(instance, action, reverse, pk_set, 'pizza_set')
+    if pizza_pks is not None:
+        _catalog_changed(*_pizza_resources(pizza_pks))
+
+
+@receiver(m2m_changed, sender=Pizza.toppings.through)
+def pizza_fingerprints_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove'):
+        Pizza.update_fingerprints(pk_set if reverse else [instance.pk])
+    elif action == 'pre_clear' and reverse:
+        # the pizzas of the topping are only known before the clear
+        Pizza.update_fingerprints(instance.pizza_set.values_list('pk', flat=True), without=[instance.pk])
+    elif action == 'post_clear' and not reverse:
+        Pizza.update_fingerprints([instance.pk])
+
+
+@receiver(pre_delete, sender=PizzaTopping)
+def topping_fingerprints_changed(sender, instance, **kwargs):
+    # the delete removes the topping from its pizzas without sending m2m_changed
+    Pizza.update_fingerprints(instance.pizza_set.values_list('pk', flat=True), without=[instance.pk])
+
+
+@receiver(m2m_changed, sender=Pizza.toppings.through)
+def pizza_topping_names_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove'):
+        Pizza.update_topping_names(pk_set if reverse else [instance.pk])
+    elif action == 'pre_clear' and reverse:
+        Pizza.update_topping_names(instance.pizza_set.values_list('pk', flat=True), without=[instance.pk])
+    elif action == 'post_clear' and not reverse:
+        Pizza.update_topping_names([instance.pk])
+
+
+@receiver(post_save, sender=PizzaTopping)
+def topping_renamed(sender, instance, created, update_fields, **kwargs):
+    # a new topping isn't on any pizza yet
+    if not created and (update_fields is None or 'topping' in update_fields):
+        Pizza.update_topping_names(instance.pizza_set.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=PizzaTopping)
+def topping_names_deleted(sender, instance, **kwargs):
+    Pizza.update_topping_names(instance.pizza_set.values_list('pk', flat=True), without=[instance.pk])
+
+
+# the receivers of the change log are connected after those incrementing the catalog version, so they run after them
+
+@receiver(post_save, sender=PizzaTopping)
+def topping_saved_logged(sender, instance, created, update_fields, **kwargs):
+    if created:
+        CatalogChange.record(CatalogChange.TOPPING, CatalogChange.CREATED, [instance.pk])
+        return
+
+    CatalogChange.record(CatalogChange.TOPPING, CatalogChange.UPDATED, [instance.pk])
+    # the pizzas list the toppings by name
+    if update_fields is None or 'topping' in update_fields:
+        CatalogChange.record(
+            CatalogChange.PIZZA, CatalogChange.TOPPINGS, instance.pizza_set.values_list('pk', flat=True)
+            )
+
+
+@receiver(bulk_created, sender=PizzaTopping)
+def toppings_bulk_created_logged(sender, instances, **kwargs):
+    CatalogChange.record(CatalogChange.TOPPING, CatalogChange.CREATED, [topping.pk for topping in instances])
+
+
+@receiver(pre_delete, sender=PizzaTopping)
+def topping_deleted_logged(sender, instance, **kwargs):
+    CatalogChange.record(CatalogChange.TOPPING, CatalogChange.DELETED, [instance.pk])
+    CatalogChange.record(CatalogChange.PIZZA, CatalogChange.TOPPINGS, instance.pizza_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Pizza)
+def pizza_saved_logged(sender, instance, created, **kwargs):
+    action = CatalogChange.CREATED if created else CatalogChange.UPDATED
+    CatalogChange.record(CatalogChange.PIZZA, action, [instance.pk])
+
+
+@receiver(post_delete, sender=Pizza)
+def pizza_deleted_logged(sender, instance, **kwargs):
+    CatalogChange.record(CatalogChange.PIZZA, CatalogChange.DELETED, [instance.pk])
+
+
+@receiver(m2m_changed, sender=Pizza.toppings.through)
+def pizza_toppings_changed_logged(sender, instance, action, reverse, pk_set, **kwargs):
+    pizza_pks = _changed_pks(instance, action, reverse, pk_set, 'pizza_set')
+    if pizza_pks is not None:
+        CatalogChange.record(CatalogChange.PIZZA, CatalogChange.TOPPINGS, pizza_pks)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def user_permissions_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    user_pks = _changed_pks(instance, action, reverse, pk_set, 'user_set')
+    if user_pks is not None:
+        forget_users(user_pks)
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def group_permissions_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    group_pks = _changed_pks(instance, action, reverse, pk_set, 'group_set')
+    if group_pks is not None:
+        forget_groups(group_pks)
+
+
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    forget_groups([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=Permission)
+def permission_changed(sender, instance, **kwargs):
+    forget_all()
@@ -0,0 +1,236 @@
+"""
+In-memory snapshot of the whole catalog: every topping and pizza list and detail rendered as JSON once per catalog
+version. When settings.PIZZA_CATALOG_SNAPSHOT is set, anonymous plain JSON GET requests (see wants_plain_json) are
+answered from the snapshot of the process by CatalogSnapshotMiddleware without touching the database.
+
+Every process reads the version marker, the CatalogVersion row or the mtime of settings.PIZZA_SNAPSHOT_MARKER_FILE,
+at most once per PIZZA_SNAPSHOT_MAX_AGE seconds and builds a new snapshot when it changed. A write is served by
+every process after at most PIZZA_SNAPSHOT_MAX_AGE seconds plus the time to build the snapshot, so the snapshot is
+off by default. Clients that made a change are pinned (see pizza/routers.py) and read their own changes from the
+views, as do clients sending credentials, query parameters or asking for another format.
+"""
+import os
+import threading
+import time
+from collections import namedtuple
+from types import MappingProxyType
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.http import HttpResponse
+from django.urls import Resolver404, resolve, reverse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from rest_framework.renderers import JSONRenderer
+from pizza import views
+from pizza.async_views import allow_header, wants_plain_json
+from pizza.conditional import catalog_validators, get_catalog_version, set_validators
+from pizza.renderers import ORJSONRenderer
+from pizza.routers import is_pinned
+from pizza.serializers import PizzaReadSerializer, PizzaToppingReadSerializer, TemplatedHyperlinkedIdentityField
+
+
+# the read serializer, list url name and view, detail url name and view of every resource of the snapshot
+RESOURCES = (
+    (PizzaToppingReadSerializer, 'toppings_list', views.ToppingList, 'toppings_detail', views.ToppingDetails),
+    (PizzaReadSerializer, 'pizzas_list', views.PizzaList, 'pizzas_detail', views.PizzaDetails),
+)
+SNAPSHOT_URL_NAMES = {name for resource in RESOURCES for name in (resource[1], resource[3])}
+
+# content is the rendered JSON of the resource, allow the Allow header of its view
+Document = namedtuple('Document', ['content', 'allow'])
+
+# documents maps the path of every resource to its Document, etag and last_modified are those of the views
+CatalogSnapshot = namedtuple('CatalogSnapshot', ['marker', 'etag', 'last_modified', 'documents'])
+
+
+def read_marker():
+    """Returns the version marker shared by the processes, it changes on every write"""
+    path = getattr(settings, 'PIZZA_SNAPSHOT_MARKER_FILE', None)
+    if path:
+        try:
+            return os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    # read from the database, the response cache may be local to the process
+    return get_catalog_version()
+
+
+def build_snapshot(request, marker):
+    """
+    Renders every resource, the urls in the documents are built for the scheme and host of request.
+    Returns None when the catalog version doesn't exist yet.
+    """
+    renderer = ORJSONRenderer()
+    context = {'request': request, 'fields': None}
+    documents = {}
+    # one read transaction, so the documents and the ETag are of the same version of the catalog
+    with transaction.atomic():
+        catalog_version = get_catalog_version()
+        if catalog_version is None:
+            return None
+        for read_serializer, list_name, list_view, detail_name, detail_view in RESOURCES:
+            model = read_serializer.serializer_class.Meta.model
+            # evaluated first so the rows can be zipped with their data, which is built from the same result
+            rows = read_serializer.values(model.objects.all())
+            list(rows)
+            data = read_serializer(rows, context=context).data
+            documents[reverse(list_name)] = Document(renderer.render(data), allow_header(list_view))
+
+            placeholder = TemplatedHyperlinkedIdentityField.PLACEHOLDER
+            start, end = reverse(detail_name, kwargs={'pk': placeholder}).split(str(placeholder))
+            detail_allow = allow_header(detail_view)
+            for row, item in zip(rows, data):
+                documents[f'{start}{row["pk"]}{end}'] = Document(renderer.render(item), detail_allow)
+
+    etag, last_modified = catalog_validators(catalog_version, JSONRenderer.format)
+
+    return CatalogSnapshot(marker, etag, last_modified, MappingProxyType(documents))
+
+
+class CatalogSnapshots:
+    """
+    The snapshots of the process, one per origin since the urls in the documents are absolute.
+    Snapshots are never changed, a new version replaces them. While one thread builds the new snapshot the other
+    threads keep serving the previous one, or are answered by the views when there is none yet.
+    """
+
+    def __init__(self):
+        self._snapshots = {}
+        self._marker = None
+        self._checked = None
+        self._lock = threading.Lock()
+
+    def _is_stale(self, now):
+        return self._checked is None or now - self._checked >= getattr(settings, 'PIZZA_SNAPSHOT_MAX_AGE', 1)
+
+    def _current_marker(self):
+        """Returns the version marker, read again when it's older than PIZZA_SNAPSHOT_MAX_AGE seconds"""
+        now = time.monotonic()
+        if self._is_stale(now):
+            self._marker = read_marker()
+            self._checked = now
+
+        return self._marker
+
+    def get_fresh(self, request):
+        """
+        Returns the snapshot for the origin of request when the marker doesn't have to be read again, None otherwise.
+        Doesn't touch the database or the lock, so async requests are answered without leaving the event loop.
+        """
+        marker = self._marker
+        if self._is_stale(time.monotonic()):
+            return None
+
+        snapshot = self._snapshots.get(request.build_absolute_uri('/'))
+        return snapshot if snapshot is not None and snapshot.marker == marker else None
+
+    def get(self, request):
+        """Returns the snapshot for the origin of request, None while the first one is being built"""
+        origin = request.build_absolute_uri('/')
+        marker = self._current_marker()
+        snapshot = self._snapshots.get(origin)
+        if snapshot is not None and snapshot.marker == marker:
+            return snapshot
+
+        if not self._lock.acquire(blocking=False):
+            return snapshot
+
+        try:
+            snapshot = self._snapshots.get(origin)
+            if snapshot is None or snapshot.marker != marker:
+                snapshot = build_snapshot(request, marker)
+                if snapshot is None:
+                    return None
+                # the snapshots of the other origins are dropped once they are out of date
+                snapshots = {key: value for key, value in self._snapshots.items() if value.marker == marker}
+                snapshots[origin] = snapshot
+                self._snapshots = snapshots
+
+            return snapshot
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        with self._lock:
+            self._snapshots = {}
+            self._checked = None
+
+
+catalog_snapshots = CatalogSnapshots()
+
+
+def serves_snapshot(request):
+    """True for an anonymous plain JSON GET request of a topping or pizza list or detail by a client that isn't pinned"""
+    if not getattr(settings, 'PIZZA_CATALOG_SNAPSHOT', False) or not wants_plain_json(request):
+        return False
+
+    # signed in through the browsable API, or made a change the snapshot may not have yet
+    if settings.SESSION_COOKIE_NAME in request.COOKIES or is_pinned(request):
+        return False
+
+    try:
+        match = resolve(request.path_info)
+    except Resolver404:
+        return False
+
+    return match.url_name in SNAPSHOT_URL_NAMES
+
+
+def snapshot_response(request, snapshot=None):
+    """Returns the response of request from the snapshot, None when the snapshot can't answer it"""
+    if snapshot is None:
+        snapshot = catalog_snapshots.get(request)
+    # a missing detail may have been created since the snapshot was built, the view answers it
+    document = snapshot.documents.get(request.path) if snapshot is not None else None
+    if document is None:
+        return None
+
+    response = get_conditional_response(request, etag=snapshot.etag, last_modified=snapshot.last_modified)
+    if response is None:
+        response = HttpResponse(document.content, content_type=JSONRenderer.media_type)
+    # the headers the views add to their responses, 304s included
+    response['Allow'] = document.allow
+    patch_vary_headers(response, ['Accept', 'Cookie'])
+
+    return set_validators(response, snapshot.etag, snapshot.last_modified)
+
+
+class CatalogSnapshotMiddleware:
+    """
+    Answers the requests of serves_snapshot from the catalog snapshot, enabled by settings.PIZZA_CATALOG_SNAPSHOT.
+    Runs under WSGI and ASGI. Async requests are answered from a fresh snapshot in the event loop, reading the marker
+    or building a snapshot runs in a thread.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        response = snapshot_response(request) if serves_snapshot(request) else None
+        if response is None:
+            response = self.get_response(request)
+
+        return response
+
+    async def __acall__(self, request):
+        response = None
+        if serves_snapshot(request):
+            snapshot = catalog_snapshots.get_fresh(request)
+            if snapshot is not None:
+                response = snapshot_response(request, snapshot)
+            else:
+                response = await sync_to_async(snapshot_response)(request)
+        if response is None:
+            response = await self.get_response(request)
+
+        return response
@@ -0,0 +1,54 @@
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+# Number of entries fetched and serialized at a time while streaming
+CHUNK_SIZE = 1000
+
+
+def wants_stream(request):
+    """
+    Streaming is opt-in with ?stream=1.
+    Only responses negotiated to JSONRenderer are streamed, the other formats are rendered as a whole by their renderer.
+    """
+    if request.accepted_renderer.format != JSONRenderer.format:
+        return False
+
+    return request.query_params.get('stream', '').lower() in ('1', 'true')
+
+
+def _iterate_in_chunks(queryset, chunk_size):
+    """Yields lists of entries ordered by pk. Each chunk is fetched with 'WHERE id > last id LIMIT chunk_size'"""
+    queryset = queryset.order_by('pk')
+    chunk = list(queryset[:chunk_size])
+    while chunk:
+        yield chunk
+        if len(chunk) < chunk_size:
+            return
+        chunk = list(queryset.filter(pk__gt=chunk[-1].pk)[:chunk_size])
+
+
+def _render_json_list(queryset, serializer_class, context, chunk_size):
+    """Encodes the queryset as a JSON array one chunk at a time. Output matches DRF's JSONRenderer."""
+    encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    separator = b'['
+    for chunk in _iterate_in_chunks(queryset, chunk_size):
+        serializer = serializer_class(chunk, many=True, context=context)
+        items = ','.join(encoder.encode(item) for item in serializer.data)
+        yield separator + items.encode('utf-8')
+        separator = b','
+
+    # '[' was never sent if the queryset is empty
+    yield b']' if separator == b',' else b'[]'
+
+
+def stream_json_list(queryset, serializer_class, context):
+    """
+    Returns the whole queryset as a streamed JSON array, serialized with the serializer context.
+    Only one chunk of entries is held in memory at a time and the first chunk is sent
+    without waiting for the rest of the table.
+    """
+    content = _render_json_list(queryset, serializer_class, context, CHUNK_SIZE)
+
+    return StreamingHttpResponse(content, content_type='application/json')
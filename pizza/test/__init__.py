@@ -0,0 +1,12 @@
+"""
+The tests use a FileBasedCache in a temporary directory instead of the cache directory of the project, so responses
+cached by earlier runs or by the development server aren't served to them.
+"""
+import tempfile
+from django.test import override_settings
+
+
+_cache_dir = tempfile.TemporaryDirectory()
+override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': _cache_dir.name}
+    }).enable()
@@ -1,8 +1,55 @@
+import base64
+import gzip
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from unittest import skipUnless
+from unittest.mock import patch
+import brotli
+import msgpack
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth import authenticate
 from django.contrib.auth.models import User, Group, Permission
-from django.test import TestCase
-from rest_framework.test import APIClient
-from pizza.models import Pizza, PizzaTopping
-from pizza.views import ToppingDetails, PizzaDetails
+from django.core.exceptions import ValidationError
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, OperationalError, connection
+from django.db.models import F
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.http import http_date
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from pizza import async_views
+from pizza.authentication import verified_credentials
+from pizza.database import apply_pragmas, configure_sqlite_connection
+from pizza.writes import WriteDispatcher, WriteUnavailable, is_locked, run_write
+from pizza.models import EMPTY_FINGERPRINT, CatalogChange, CatalogVersion, Pizza, PizzaTopping, toppings_fingerprint
+from pizza.routers import PIN_COOKIE, ReplicaRouter
+from pizza.serializers import PizzaSerializer, PizzaToppingSerializer, only_requested
+from pizza.serializers import PizzaReadSerializer, PizzaToppingReadSerializer
+from pizza.snapshot import catalog_snapshots
+from pizza.views import ToppingDetails, ToppingList, PizzaDetails, PizzaList
+
+
+def use_shared_cache(add_cleanup):
+    """Makes the default cache a FileBasedCache, which the processes share, the PIZZA_CACHE_ALIAS until cleanup"""
+    cache_dir = tempfile.TemporaryDirectory()
+    add_cleanup(cache_dir.cleanup)
+    shared_cache = override_settings(
+        CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': cache_dir.name}
+            },
+        PIZZA_CACHE_ALIAS='default'
+        )
+    shared_cache.enable()
+    add_cleanup(shared_cache.disable)
 
 
 class TestHomepage(TestCase):
@@ -483,3 +530,1978 @@ class TestPizzaEndpoints(TestCase):
         self.assertEqual(stored_pizzas_toppings.values()[0]['topping'], 'Onion')
         self.assertEqual(len(stored_pizzas_toppings.values()), 1)
 
+
+class TestPizzaQueryCount(TestCase):
+    """Query count of pizza endpoints should not grow with the number of pizzas or toppings"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.toppings = [PizzaTopping.objects.create(topping=f'Topping {number}') for number in range(5)]
+        cls.client = APIClient()
+        cls.factory = APIRequestFactory()
+
+    def _create_pizzas(self, count):
+        """Adds pizzas with all toppings until there are count pizzas in the database"""
+        for number in range(Pizza.objects.count(), count):
+            pizza = Pizza.objects.create(pizza=f'Pizza {number}')
+            pizza.toppings.set(self.toppings)
+
+    def test_get_pizza_list_should_use_the_same_number_of_queries_as_catalog_grows(self):
+        """1 query for the catalog version and 1 query for the pizzas with their topping names"""
+        for count in (1, 10, 50):
+            self._create_pizzas(count)
+            with self.assertNumQueries(2):
+                response = self.client.get('/pizzas/')
+
+            self.assertEqual(len(response.data), count)
+            self.assertEqual(response.data[-1]['toppings'], [topping.topping for topping in self.toppings])
+
+    def test_get_pizza_detail_should_load_toppings_in_one_query(self):
+        """1 query for the catalog version and 1 query for the pizza with its topping names"""
+        self._create_pizzas(1)
+        pizza = Pizza.objects.get()
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/pizzas/{pizza.pk}')
+
+        self.assertEqual(len(response.data['toppings']), 5)
+
+    @override_settings(PIZZA_DENORMALIZED_TOPPINGS=False)
+    def test_get_pizzas_should_load_toppings_in_one_query_without_topping_names(self):
+        self._create_pizzas(10)
+        pizza = Pizza.objects.first()
+        with self.assertNumQueries(3):
+            response = self.client.get('/pizzas/')
+        self.assertEqual(response.data[0]['toppings'], [topping.topping for topping in self.toppings])
+
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/pizzas/{pizza.pk}')
+        self.assertEqual(response.data['toppings'], [topping.topping for topping in self.toppings])
+
+    def test_response_after_post_should_load_toppings_in_one_query(self):
+        request = self.factory.post('/pizzas/')
+        data = {'pizza': 'New Pizza', 'toppings': [topping.topping for topping in self.toppings]}
+        serializer = PizzaSerializer(data=data, context={'request': request})
+        self.assertTrue(serializer.is_valid())
+        serializer.save()
+
+        with self.assertNumQueries(1):
+            self.assertEqual(len(serializer.data['toppings']), 5)
+
+    def test_response_after_put_should_load_toppings_in_one_query(self):
+        self._create_pizzas(1)
+        pizza = Pizza.objects.get()
+        request = self.factory.put(f'/pizzas/{pizza.pk}')
+        data = {'pizza': 'Edited Pizza', 'toppings': [self.toppings[0].topping]}
+        serializer = PizzaSerializer(pizza, data=data, context={'request': request})
+        self.assertTrue(serializer.is_valid())
+        serializer.save()
+
+        with self.assertNumQueries(1):
+            self.assertEqual(serializer.data['toppings'], [self.toppings[0].topping])
+
+    def test_validation_should_resolve_toppings_in_one_query(self):
+        """1 query for all of its toppings, the uniqueness of the pizza is left to the insert"""
+        request = self.factory.post('/pizzas/')
+        toppings = [topping.topping for topping in reversed(self.toppings)]
+        serializer = PizzaSerializer(data={'pizza': 'New Pizza', 'toppings': toppings}, context={'request': request})
+        with self.assertNumQueries(1):
+            self.assertTrue(serializer.is_valid())
+
+        self.assertEqual(serializer.validated_data['toppings'], list(reversed(self.toppings)))
+
+    def test_validation_should_match_toppings_regardless_of_case(self):
+        request = self.factory.post('/pizzas/')
+        serializer = PizzaSerializer(data={'pizza': 'New Pizza', 'toppings': ['TOPPING 1', 'topping 2']}, context={'request': request})
+
+        self.assertTrue(serializer.is_valid())
+        self.assertEqual(serializer.validated_data['toppings'], self.toppings[1:3])
+
+    def test_validation_should_report_each_missing_topping(self):
+        request = self.factory.post('/pizzas/')
+        data = {'pizza': 'New Pizza', 'toppings': ['Ham', 'Topping 1', 'Onion']}
+        serializer = PizzaSerializer(data=data, context={'request': request})
+
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(serializer.errors['toppings'], [
+            'Object with topping=Ham does not exist.',
+            'Object with topping=Onion does not exist.',
+            ])
+
+class TestListPagination(TestCase):
+    """Tests cursor pagination of /toppings/ and /pizzas/"""
+
+    @classmethod
+    def setUpTestData(cls):
+        toppings = [PizzaTopping.objects.create(topping=f'Topping {number}') for number in range(5)]
+        for number in range(5):
+            pizza = Pizza.objects.create(pizza=f'Pizza {number}')
+            pizza.toppings.set(toppings[:number])
+
+        cls.client = APIClient()
+
+    def test_list_should_not_be_paginated_without_page_size(self):
+        response = self.client.get('/toppings/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 5)
+
+    def test_pages_should_follow_next_and_previous_links(self):
+        for url, field in (('/toppings/', 'topping'), ('/pizzas/', 'pizza')):
+            response = self.client.get(url, {'page_size': 2})
+            self.assertEqual([item[field] for item in response.data['results']], [f'{field.title()} 0', f'{field.title()} 1'])
+            self.assertIsNone(response.data['previous'])
+
+            response = self.client.get(response.data['next'])
+            self.assertEqual([item[field] for item in response.data['results']], [f'{field.title()} 2', f'{field.title()} 3'])
+
+            last_page = self.client.get(response.data['next'])
+            self.assertEqual([item[field] for item in last_page.data['results']], [f'{field.title()} 4'])
+            self.assertIsNone(last_page.data['next'])
+
+            previous_page = self.client.get(last_page.data['previous'])
+            self.assertEqual(previous_page.data['results'], response.data['results'])
+
+    def test_pages_should_be_fetched_without_offset(self):
+        first_page = self.client.get('/pizzas/', {'page_size': 2})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(first_page.data['next'])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 2)  # catalog version, pizzas with their topping names
+        self.assertNotIn('OFFSET', queries[1]['sql'])
+        self.assertIn('LIMIT 3', queries[1]['sql'])
+
+    def test_page_size_should_be_capped(self):
+        response = self.client.get('/toppings/', {'page_size': 100000})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 5)
+
+    def test_invalid_cursor_should_return_404(self):
+        response = self.client.get('/toppings/', {'page_size': 2, 'cursor': 'invalid'})
+
+        self.assertContains(response, status_code=404, text='Invalid cursor')
+
+class TestStreamingLists(TestCase):
+    """Tests ?stream=1 on /toppings/ and /pizzas/"""
+
+    @classmethod
+    def setUpTestData(cls):
+        toppings = [PizzaTopping.objects.create(topping=f'Topping {number}') for number in range(5)]
+        for number in range(5):
+            pizza = Pizza.objects.create(pizza=f'Pizza {number}')
+            pizza.toppings.set(toppings[:number])
+
+        cls.client = APIClient()
+
+    def test_streamed_list_should_match_regular_list(self):
+        for url in ('/toppings/', '/pizzas/'):
+            response = self.client.get(url)
+            streamed_response = self.client.get(url, {'stream': 1})
+
+            self.assertEqual(streamed_response.status_code, 200)
+            self.assertTrue(streamed_response.streaming)
+            self.assertEqual(streamed_response['Content-Type'], 'application/json')
+            self.assertEqual(json.loads(b''.join(streamed_response.streaming_content)), json.loads(response.content))
+
+    def test_other_formats_should_not_be_streamed(self):
+        for format, content_type in (('msgpack', 'application/msgpack'), ('orjson', 'application/json; encoder=orjson')):
+            response = self.client.get('/pizzas/', {'stream': 1, 'format': format})
+
+            self.assertFalse(response.streaming)
+            self.assertEqual(response['Content-Type'], content_type)
+            self.assertEqual(response['ETag'], f'"{CatalogVersion.objects.get().version}-{format}"')
+
+        response = self.client.get('/pizzas/', {'stream': 1}, HTTP_ACCEPT='text/html')
+        self.assertFalse(response.streaming)
+        self.assertTrue(response['Content-Type'].startswith('text/html'))
+
+    def test_streamed_list_should_be_empty_list_if_database_is_empty(self):
+        PizzaTopping.objects.all().delete()
+        response = self.client.get('/toppings/', {'stream': 1})
+
+        self.assertEqual(b''.join(response.streaming_content), b'[]')
+
+    @patch('pizza.streaming.CHUNK_SIZE', 2)
+    def test_streamed_list_should_be_fetched_in_chunks(self):
+        response = self.client.get('/pizzas/', {'stream': 1})
+        with CaptureQueriesContext(connection) as queries:
+            chunks = list(response.streaming_content)
+
+        # 3 chunks of pizzas, each with a query for their toppings
+        self.assertEqual(len(queries), 6)
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual([pizza['pizza'] for pizza in json.loads(b''.join(chunks))], [f'Pizza {number}' for number in range(5)])
+
+    def test_streamed_list_should_not_query_the_columns_that_are_not_requested(self):
+        response = self.client.get('/toppings/', {'stream': 1, 'fields': 'url'})
+        with CaptureQueriesContext(connection) as queries:
+            toppings = json.loads(b''.join(response.streaming_content))
+
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(len(toppings), 5)
+        self.assertEqual(set(toppings[0]), {'url'})
+
+@override_settings(PIZZA_CACHE_ALIAS='default')
+class TestResponseCache(TestCase):
+    """Tests that GET responses are cached and invalidated when toppings and pizzas change"""
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_superuser(username='admin_created', password='pass')
+        cls.client = APIClient()
+
+    def setUp(self):
+        cache.clear()
+        self.pepperoni_topping = PizzaTopping.objects.create(topping='Pepperoni')
+        self.bacon_topping = PizzaTopping.objects.create(topping='Bacon')
+        self.pepperoni_pizza = Pizza.objects.create(pizza='Pepperoni Pizza')
+        self.pepperoni_pizza.toppings.set([self.pepperoni_topping])
+        self.bacon_pizza = Pizza.objects.create(pizza='Bacon Pizza')
+        self.bacon_pizza.toppings.set([self.bacon_topping])
+
+    def test_repeated_get_should_be_served_from_cache(self):
+        for url in ('/toppings/', f'/toppings/{self.bacon_topping.pk}', '/pizzas/', f'/pizzas/{self.bacon_pizza.pk}'):
+            response = self.client.get(url)
+            with self.assertNumQueries(1):  # catalog version
+                cached_response = self.client.get(url)
+
+            self.assertEqual(cached_response.status_code, 200)
+            self.assertEqual(cached_response.content, response.content)
+
+    def test_query_string_should_be_cached_separately(self):
+        self.client.get('/toppings/')
+        response = self.client.get('/toppings/', {'page_size': 1})
+
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_not_found_should_not_be_cached(self):
+        self.client.get('/pizzas/100')
+        with self.assertNumQueries(2):
+            self.client.get('/pizzas/100')
+
+    def test_renaming_a_topping_should_invalidate_toppings_and_pizzas_with_the_topping(self):
+        urls = ('/toppings/', f'/toppings/{self.bacon_topping.pk}', '/pizzas/', f'/pizzas/{self.bacon_pizza.pk}')
+        for url in urls + (f'/pizzas/{self.pepperoni_pizza.pk}',):
+            self.client.get(url)
+
+        self.client.login(username='admin_created', password='pass')
+        response = self.client.put(f'/toppings/{self.bacon_topping.pk}', data={'topping': 'Ham'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.client.logout()
+
+        for url in urls:
+            self.assertContains(self.client.get(url), text='Ham')
+        # pizzas without the topping are still cached
+        with self.assertNumQueries(1):  # catalog version
+            self.client.get(f'/pizzas/{self.pepperoni_pizza.pk}')
+
+    def test_deleting_a_topping_should_invalidate_pizzas_with_the_topping(self):
+        self.client.get(f'/pizzas/{self.bacon_pizza.pk}')
+        self.bacon_topping.delete()
+
+        response = self.client.get(f'/pizzas/{self.bacon_pizza.pk}')
+        self.assertEqual(response.data['toppings'], [])
+
+    def test_changing_pizza_toppings_should_invalidate_the_pizza(self):
+        self.client.get('/pizzas/')
+        self.client.get(f'/pizzas/{self.pepperoni_pizza.pk}')
+
+        self.pepperoni_pizza.toppings.add(self.bacon_topping)
+        self.assertEqual(self.client.get(f'/pizzas/{self.pepperoni_pizza.pk}').data['toppings'], ['Pepperoni', 'Bacon'])
+        self.assertEqual(self.client.get('/pizzas/').data[0]['toppings'], ['Pepperoni', 'Bacon'])
+
+        self.bacon_topping.pizza_set.clear()
+        self.assertEqual(self.client.get(f'/pizzas/{self.pepperoni_pizza.pk}').data['toppings'], ['Pepperoni'])
+
+    def test_saving_and_deleting_a_pizza_should_invalidate_the_pizza(self):
+        self.client.get('/pizzas/')
+        self.client.get(f'/pizzas/{self.pepperoni_pizza.pk}')
+
+        self.pepperoni_pizza.pizza = 'Pepperoni Special'
+        self.pepperoni_pizza.save()
+        self.assertContains(self.client.get(f'/pizzas/{self.pepperoni_pizza.pk}'), text='Pepperoni Special')
+        self.assertContains(self.client.get('/pizzas/'), text='Pepperoni Special')
+
+        pk = self.pepperoni_pizza.pk
+        self.pepperoni_pizza.delete()
+        self.assertEqual(self.client.get(f'/pizzas/{pk}').status_code, 404)
+        self.assertNotContains(self.client.get('/pizzas/'), text='Pepperoni Special')
+
+    def test_adding_a_topping_should_invalidate_the_topping_list_only(self):
+        self.client.get('/toppings/')
+        self.client.get('/pizzas/')
+        PizzaTopping.objects.create(topping='Onion')
+
+        self.assertContains(self.client.get('/toppings/'), text='Onion')
+        with self.assertNumQueries(1):  # catalog version
+            self.client.get('/pizzas/')
+
+class TestConditionalGet(TestCase):
+    """Tests ETag and Last-Modified headers taken from the catalog version"""
+
+    def setUp(self):
+        self.topping = PizzaTopping.objects.create(topping='Bacon')
+        self.pizza = Pizza.objects.create(pizza='Bacon Pizza')
+        self.pizza.toppings.set([self.topping])
+        self.urls = ('/toppings/', f'/toppings/{self.topping.pk}', '/pizzas/', f'/pizzas/{self.pizza.pk}')
+
+    def test_get_should_include_etag_and_last_modified(self):
+        catalog_version = CatalogVersion.objects.get()
+        for url in self.urls:
+            response = self.client.get(url)
+
+            self.assertEqual(response['ETag'], f'"{catalog_version.version}-json"')
+            self.assertEqual(response['Last-Modified'], http_date(catalog_version.modified.timestamp()))
+
+    def test_matching_if_none_match_should_return_304_without_serializing(self):
+        for url in self.urls:
+            etag = self.client.get(url)['ETag']
+            with patch('pizza.views.PizzaSerializer') as mock_pizza_serializer, \
+                    patch('pizza.views.PizzaToppingSerializer') as mock_topping_serializer:
+                with self.assertNumQueries(1):  # catalog version
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response['ETag'], etag)
+            self.assertEqual(response.content, b'')
+            mock_pizza_serializer.assert_not_called()
+            mock_topping_serializer.assert_not_called()
+
+    def test_matching_if_modified_since_should_return_304(self):
+        last_modified = self.client.get('/pizzas/')['Last-Modified']
+        response = self.client.get('/pizzas/', HTTP_IF_MODIFIED_SINCE=last_modified)
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_writes_should_change_the_etag(self):
+        version = CatalogVersion.objects.get().version
+        etag = self.client.get(f'/pizzas/{self.pizza.pk}')['ETag']
+        self.topping.topping = 'Ham'
+        self.topping.save()
+
+        response = self.client.get(f'/pizzas/{self.pizza.pk}', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['toppings'], ['Ham'])
+        self.assertGreater(CatalogVersion.objects.get().version, version)
+
+    def test_browsable_api_should_have_a_different_etag(self):
+        json_etag = self.client.get('/pizzas/')['ETag']
+        html_response = self.client.get('/pizzas/', HTTP_ACCEPT='text/html', HTTP_IF_NONE_MATCH=json_etag)
+
+        self.assertEqual(html_response.status_code, 200)
+        self.assertNotEqual(html_response['ETag'], json_etag)
+
+    def test_not_found_should_not_include_etag(self):
+        response = self.client.get('/pizzas/100')
+
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.has_header('ETag'))
+
+    @override_settings(PIZZA_CACHE_ALIAS='default')
+    def test_a_write_of_another_process_should_change_the_etag(self):
+        cache.clear()
+        etag = self.client.get('/toppings/')['ETag']
+        with self.assertNumQueries(1):  # catalog version
+            self.assertEqual(self.client.get('/toppings/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # the version is incremented without the signals that would run in the process making the write
+        CatalogVersion.objects.update(version=F('version') + 1)
+        self.assertEqual(self.client.get('/toppings/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_reads_should_not_create_the_catalog_version(self):
+        CatalogVersion.objects.all().delete()
+        response = self.client.get('/toppings/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('ETag'))
+        self.assertFalse(CatalogVersion.objects.exists())
+
+        PizzaTopping.objects.create(topping='Ham')
+        self.assertEqual(self.client.get('/toppings/')['ETag'], '"1-json"')
+
+
+class TestCachedBasicAuthentication(TestCase):
+    """Tests that Basic auth credentials are only hashed once while cached"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner_user = User.objects.create_user(username='owner_created', password='pass')
+        owner_group, created = Group.objects.get_or_create(name='Pizza Owner')
+        owner_group.permissions.add(*Permission.objects.filter(codename__endswith='_pizzatopping'))
+        cls.owner_user.groups.add(owner_group)
+
+    def setUp(self):
+        verified_credentials.clear()
+        self.topping = PizzaTopping.objects.create(topping='Bacon')
+
+    def _put(self, password, topping='Ham'):
+        credentials = base64.b64encode(f'owner_created:{password}'.encode()).decode()
+        return self.client.put(
+            f'/toppings/{self.topping.pk}', data={'topping': topping},
+            content_type='application/json', HTTP_AUTHORIZATION=f'Basic {credentials}'
+            )
+
+    @patch('rest_framework.authentication.authenticate', wraps=authenticate)
+    def test_repeated_requests_should_only_check_the_password_once(self, mock_authenticate):
+        for topping in ('Ham', 'Bacon', 'Ham'):
+            response = self._put('pass', topping)
+            self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(mock_authenticate.call_count, 1)
+
+    @patch('rest_framework.authentication.authenticate', wraps=authenticate)
+    def test_wrong_password_should_not_be_cached(self, mock_authenticate):
+        self.assertEqual(self._put('wrong').status_code, 401)
+        self.assertEqual(self._put('wrong').status_code, 401)
+
+        self.assertEqual(mock_authenticate.call_count, 2)
+        self.assertEqual(len(verified_credentials), 0)
+
+    def test_changing_the_password_should_invalidate_cached_credentials(self):
+        self.assertEqual(self._put('pass').status_code, 200)
+        self.owner_user.set_password('new pass')
+        self.owner_user.save()
+
+        self.assertEqual(self._put('pass').status_code, 401)
+        self.assertEqual(self._put('new pass').status_code, 200)
+
+    def test_deactivating_the_user_should_invalidate_cached_credentials(self):
+        self.assertEqual(self._put('pass').status_code, 200)
+        self.owner_user.is_active = False
+        self.owner_user.save()
+
+        self.assertEqual(self._put('pass').status_code, 401)
+
+class TestCachedPermissions(TestCase):
+    """
+    Tests that user and group permissions are cached and dropped when they change.
+    The cache is a FileBasedCache, permissions aren't cached in LocMemCache.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        use_shared_cache(cls.addClassCleanup)
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner_user = User.objects.create_user(username='owner_created', password='pass')
+        cls.owner_group, created = Group.objects.get_or_create(name='Pizza Owner')
+        cls.topping_permissions = Permission.objects.filter(codename__endswith='_pizzatopping')
+        cls.owner_group.permissions.set(cls.topping_permissions)
+        cls.owner_user.groups.add(cls.owner_group)
+
+    def setUp(self):
+        cache.clear()
+
+    def _load_user(self):
+        """Users are loaded on every request so permissions aren't kept on the instance between requests"""
+        return User.objects.get(pk=self.owner_user.pk)
+
+    def test_permissions_should_be_loaded_once(self):
+        self.assertTrue(self._load_user().has_perm('pizza.add_pizzatopping'))
+        user = self._load_user()
+
+        with self.assertNumQueries(0):
+            self.assertTrue(user.has_perms(['pizza.add_pizzatopping', 'pizza.change_pizzatopping']))
+            self.assertFalse(user.has_perm('pizza.add_pizza'))
+
+    def test_write_requests_should_not_query_permissions_once_cached(self):
+        self.client.force_login(self.owner_user)
+        topping = PizzaTopping.objects.create(topping='Bacon')
+        self.client.put(f'/toppings/{topping.pk}', data={'topping': 'Ham'}, content_type='application/json')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.put(f'/toppings/{topping.pk}', data={'topping': 'Bacon'}, content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([query for query in queries if 'auth_permission' in query['sql']])
+
+    def test_changing_group_permissions_should_drop_cached_permissions(self):
+        self.assertTrue(self._load_user().has_perm('pizza.delete_pizzatopping'))
+        self.owner_group.permissions.remove(Permission.objects.get(codename='delete_pizzatopping'))
+        self.assertFalse(self._load_user().has_perm('pizza.delete_pizzatopping'))
+
+        Permission.objects.get(codename='add_pizza').group_set.add(self.owner_group)
+        self.assertTrue(self._load_user().has_perm('pizza.add_pizza'))
+
+    def test_changing_group_membership_should_drop_cached_permissions(self):
+        self.assertTrue(self._load_user().has_perm('pizza.add_pizzatopping'))
+        self.owner_group.user_set.remove(self.owner_user)
+        self.assertFalse(self._load_user().has_perm('pizza.add_pizzatopping'))
+
+        self.owner_user.groups.add(self.owner_group)
+        self.assertTrue(self._load_user().has_perm('pizza.add_pizzatopping'))
+
+        self.owner_user.groups.clear()
+        self.assertFalse(self._load_user().has_perm('pizza.add_pizzatopping'))
+
+    def test_changing_user_permissions_should_drop_cached_permissions(self):
+        self.assertFalse(self._load_user().has_perm('pizza.add_pizza'))
+        self.owner_user.user_permissions.add(Permission.objects.get(codename='add_pizza'))
+
+        self.assertTrue(self._load_user().has_perm('pizza.add_pizza'))
+
+    def test_deleting_a_group_should_drop_cached_permissions(self):
+        self.assertTrue(self._load_user().has_perm('pizza.add_pizzatopping'))
+        self.owner_group.delete()
+
+        self.assertFalse(self._load_user().has_perm('pizza.add_pizzatopping'))
+
+    def test_inactive_users_should_not_have_permissions(self):
+        self.assertTrue(self._load_user().has_perm('pizza.add_pizzatopping'))
+        self.owner_user.is_active = False
+        self.owner_user.save()
+
+        self.assertFalse(self._load_user().has_perm('pizza.add_pizzatopping'))
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}, PIZZA_CACHE_ALIAS='default'
+    )
+class TestLocalCachePermissions(TestCase):
+    """Tests that permissions aren't kept in a cache local to the process, which the other processes can't drop"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner_user = User.objects.create_user(username='owner_created', password='pass')
+        cls.owner_group, created = Group.objects.get_or_create(name='Pizza Owner')
+        cls.owner_group.permissions.set(Permission.objects.filter(codename__endswith='_pizzatopping'))
+        cls.owner_user.groups.add(cls.owner_group)
+        cls.topping = PizzaTopping.objects.create(topping='Bacon')
+
+    def _put(self, topping):
+        return self.client.put(f'/toppings/{self.topping.pk}', data={'topping': topping}, content_type='application/json')
+
+    def test_a_permission_revoked_by_another_process_should_be_denied(self):
+        cache.clear()
+        self.client.force_login(self.owner_user)
+        self.assertEqual(self._put('Ham').status_code, 200)
+
+        # the signals of the other process only drop the entries of its own cache
+        with patch('pizza.signals.forget_groups'):
+            self.owner_group.permissions.clear()
+
+        self.assertEqual(self._put('Bacon').status_code, 403)
+
+
+class TestBulkToppingCreation(TestCase):
+    """Tests POSTing a list of toppings to /toppings/"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner_user = User.objects.create_user(username='owner_created', password='pass')
+        owner_group, created = Group.objects.get_or_create(name='Pizza Owner')
+        owner_group.permissions.add(*Permission.objects.filter(codename__endswith='_pizzatopping'))
+        cls.owner_user.groups.add(owner_group)
+
+    def setUp(self):
+        PizzaTopping.objects.create(topping='Bacon')
+        self.client.force_login(self.owner_user)
+
+    def _post(self, toppings):
+        return self.client.post('/toppings/', data=[{'topping': topping} for topping in toppings], content_type='application/json')
+
+    def test_post_list_should_create_all_toppings(self):
+        response = self._post(['Ham', 'Onion', 'Pepperoni'])
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([topping['topping'] for topping in response.data], ['Ham', 'Onion', 'Pepperoni'])
+        topping = PizzaTopping.objects.get(topping='Onion')
+        self.assertEqual(response.data[1]['url'], f'http://testserver/toppings/{topping.pk}')
+        self.assertEqual(PizzaTopping.objects.count(), 4)
+
+    def test_post_list_should_insert_in_one_statement_without_checking_uniqueness_first(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self._post([f'Topping {number}' for number in range(100)])
+
+        self.assertEqual(response.status_code, 201)
+        topping_queries = [query['sql'] for query in queries if 'pizza_pizzatopping' in query['sql']]
+        self.assertEqual(len(topping_queries), 1)
+        self.assertTrue(topping_queries[0].startswith('INSERT'))
+
+    def test_post_list_should_reject_existing_toppings_regardless_of_case(self):
+        response = self._post(['Ham', 'bacon'])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, [{}, {'topping': ['Topping already exists']}])
+        self.assertFalse(PizzaTopping.objects.filter(topping='Ham').exists())
+
+    def test_post_list_should_reject_repeated_toppings(self):
+        response = self._post(['Ham', 'Onion', 'HAM'])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, [{}, {}, {'topping': ['Topping already exists']}])
+
+    def test_post_list_should_fold_case_like_nocase_collation(self):
+        """NOCASE only folds ASCII letters so É and é are different toppings"""
+        response = self._post(['Épice', 'épice'])
+
+        self.assertEqual(response.status_code, 201)
+
+    def test_post_list_should_return_errors_of_each_topping(self):
+        response = self.client.post('/toppings/', data=[{'topping': 'Ham'}, {'missing': 'field'}], content_type='application/json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[0], {})
+        self.assertEqual(response.data[1]['topping'], ['This field is required.'])
+
+    def test_post_list_should_require_permission(self):
+        self.client.logout()
+        response = self._post(['Ham'])
+
+        self.assertEqual(response.status_code, 401)
+
+    @override_settings(PIZZA_CACHE_ALIAS='default')
+    def test_post_list_should_invalidate_topping_list(self):
+        cache.clear()
+        etag = self.client.get('/toppings/')['ETag']
+        self._post(['Ham'])
+        response = self.client.get('/toppings/')
+
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.data), 2)
+
+
+class TestAsyncReads(TestCase):
+    """Tests the async GET handlers used under ASGI against the sync views"""
+
+    def setUp(self):
+        self.topping = PizzaTopping.objects.create(topping='Bacon')
+        PizzaTopping.objects.create(topping='Onion')
+        self.pizza = Pizza.objects.create(pizza='Bacon Pizza')
+        self.pizza.toppings.set([self.topping])
+        self.factory = RequestFactory()
+        self.routes = (
+            (ToppingList, async_views.topping_list, '/toppings/', {}),
+            (ToppingDetails, async_views.topping_detail, f'/toppings/{self.topping.pk}', {'pk': self.topping.pk}),
+            (PizzaList, async_views.pizza_list, '/pizzas/', {}),
+            (PizzaDetails, async_views.pizza_detail, f'/pizzas/{self.pizza.pk}', {'pk': self.pizza.pk}),
+            )
+
+    def _sync_get(self, view_class, path, kwargs, **headers):
+        return view_class.as_view()(self.factory.get(path, **headers), **kwargs).render()
+
+    def _async_get(self, view_class, handler, path, kwargs, **headers):
+        view = async_views.async_reads(view_class, handler)
+        return async_to_sync(view)(self.factory.get(path, **headers), **kwargs)
+
+    def test_get_should_return_the_same_response_as_the_sync_views(self):
+        for view_class, handler, path, kwargs in self.routes:
+            sync_response = self._sync_get(view_class, path, kwargs)
+            response = self._async_get(view_class, handler, path, kwargs)
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content, sync_response.content)
+            for header in ('Content-Type', 'ETag', 'Last-Modified', 'Allow', 'Vary'):
+                self.assertEqual(response[header], sync_response[header])
+
+    @override_settings(PIZZA_CACHE_ALIAS=None)
+    def test_get_should_use_the_same_number_of_queries_as_the_sync_views(self):
+        """1 query for the catalog version and 1 for the pizzas with their topping names, like TestPizzaQueryCount"""
+        for view_class, handler, path, kwargs in self.routes[2:]:
+            with self.assertNumQueries(2):
+                self._sync_get(view_class, path, kwargs)
+            with self.assertNumQueries(2):
+                self._async_get(view_class, handler, path, kwargs)
+
+    def test_lists_should_be_read_in_the_order_of_the_sync_views(self):
+        for view_class, handler, path, kwargs in (self.routes[0], self.routes[2]):
+            with CaptureQueriesContext(connection) as queries:
+                self._async_get(view_class, handler, path, kwargs)
+
+            # an unordered query returns the rows in the order of the plan of the database
+            self.assertIn('ORDER BY', queries[-1]['sql'])
+
+    @override_settings(PIZZA_DENORMALIZED_TOPPINGS=False)
+    def test_pizzas_should_be_read_like_the_sync_views_without_topping_names(self):
+        for view_class, handler, path, kwargs in self.routes[2:]:
+            sync_response = self._sync_get(view_class, path, kwargs)
+            response = self._async_get(view_class, handler, path, kwargs)
+
+            self.assertEqual(response.content, sync_response.content)
+
+    def test_get_missing_entry_should_return_404_like_the_sync_views(self):
+        sync_response = self._sync_get(PizzaDetails, '/pizzas/0', {'pk': 0})
+        response = self._async_get(PizzaDetails, async_views.pizza_detail, '/pizzas/0', {'pk': 0})
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.content, sync_response.content)
+
+    def test_matching_if_none_match_should_return_304(self):
+        view_class, handler, path, kwargs = self.routes[2]
+        etag = self._async_get(view_class, handler, path, kwargs)['ETag']
+        response = self._async_get(view_class, handler, path, kwargs, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_other_requests_should_be_passed_to_the_sync_views(self):
+        view = async_views.async_reads(ToppingList, async_views.topping_list)
+        browsable_response = async_to_sync(view)(self.factory.get('/toppings/', HTTP_ACCEPT='text/html'))
+        paginated_response = async_to_sync(view)(self.factory.get('/toppings/', {'page_size': 1}))
+        post_response = async_to_sync(view)(self.factory.post('/toppings/', {'topping': 'Ham'}))
+
+        self.assertTrue(browsable_response['Content-Type'].startswith('text/html'))
+        self.assertEqual(len(paginated_response.data['results']), 1)
+        self.assertIn(post_response.status_code, (401, 403))
+        self.assertFalse(PizzaTopping.objects.filter(topping='Ham').exists())
+
+    @override_settings(PIZZA_CACHE_ALIAS='default')
+    def test_cached_responses_should_be_shared_with_the_sync_views(self):
+        cache.clear()
+        view_class, handler, path, kwargs = self.routes[2]
+        sync_response = self._sync_get(view_class, path, kwargs)
+        with self.assertNumQueries(1):  # catalog version
+            response = self._async_get(view_class, handler, path, kwargs)
+
+        self.assertEqual(response.content, sync_response.content)
+
+
+class TestSqlitePragmas(TestCase):
+    """Tests the pragmas applied to new sqlite connections"""
+
+    def _pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_new_connections_should_apply_the_pragmas_of_the_settings(self):
+        self.assertEqual(self._pragma('synchronous'), 1)  # NORMAL
+        self.assertEqual(self._pragma('busy_timeout'), 5000)
+        self.assertEqual(self._pragma('cache_size'), -64000)
+
+    @override_settings(PIZZA_SQLITE_PRAGMAS={'busy_timeout': 1234})
+    def test_pragmas_should_be_configurable(self):
+        configure_sqlite_connection(sender=connection.__class__, connection=connection)
+        # synchronous can't be changed inside the transaction of the test, so only busy_timeout is restored
+        self.addCleanup(lambda: apply_pragmas(connection.cursor(), {'busy_timeout': 5000}))
+
+        self.assertEqual(self._pragma('busy_timeout'), 1234)
+
+
+class TestSingleWriter(TransactionTestCase):
+    """Tests running the writes of many threads through the single writer of pizza/writes.py"""
+
+    def _run_writers(self, count, writes_per_writer):
+        """Returns the errors raised in count threads that each create writes_per_writer toppings"""
+        errors = []
+
+        def writer(number):
+            for write in range(writes_per_writer):
+                try:
+                    run_write(lambda: PizzaTopping.objects.create(topping=f'Topping {number}-{write}'))
+                except Exception as error:
+                    errors.append(error)
+
+        threads = [threading.Thread(target=writer, args=(number,)) for number in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return errors
+
+    def test_50_concurrent_writers_should_not_get_lock_errors(self):
+        errors = self._run_writers(50, 10)
+
+        self.assertEqual(errors, [])
+        self.assertEqual(PizzaTopping.objects.count(), 500)
+
+    @override_settings(PIZZA_WRITE_GROUP_SIZE=10)
+    def test_50_concurrent_writers_should_not_get_lock_errors_with_group_commit(self):
+        errors = self._run_writers(50, 10)
+
+        self.assertEqual(errors, [])
+        self.assertEqual(PizzaTopping.objects.count(), 500)
+
+    @override_settings(PIZZA_WRITE_GROUP_SIZE=10)
+    def test_failed_write_should_not_roll_back_the_rest_of_the_group(self):
+        PizzaTopping.objects.create(topping='Bacon')
+        dispatcher = WriteDispatcher()
+        started = threading.Event()
+        release = threading.Event()
+        results = {}
+
+        def submit(name, function):
+            try:
+                results[name] = dispatcher.submit(function)
+            except Exception as error:
+                results[name] = error
+
+        # the first write holds the worker so the next two are committed as one group
+        first = threading.Thread(target=submit, args=('first', lambda: started.set() or release.wait()))
+        first.start()
+        started.wait()
+        threads = [
+            threading.Thread(target=submit, args=(name, lambda name=name: PizzaTopping.objects.create(topping=name)))
+            for name in ('Bacon', 'Onion')
+            ]
+        for thread in threads:
+            thread.start()
+        release.set()
+        for thread in [first] + threads:
+            thread.join()
+
+        self.assertEqual(results['Onion'].topping, 'Onion')
+        self.assertIsInstance(results['Bacon'], Exception)
+        self.assertEqual(PizzaTopping.objects.count(), 2)
+
+    def test_duplicate_name_should_be_raised_as_a_validation_error_by_the_writer(self):
+        PizzaTopping.objects.create(topping='Bacon')
+        serializer = PizzaToppingSerializer(data={'topping': 'BACON'}, context={'request': None})
+        self.assertTrue(serializer.is_valid())
+
+        with self.assertRaises(serializers.ValidationError) as context:
+            WriteDispatcher().submit(serializer.save)
+
+        self.assertEqual(context.exception.detail, {'topping': ['Topping already exists']})
+        self.assertEqual(PizzaTopping.objects.count(), 1)
+
+    @override_settings(PIZZA_WRITE_RETRY_DELAY=0)
+    def test_locked_transaction_should_be_retried(self):
+        calls = []
+
+        def write():
+            calls.append(1)
+            if len(calls) < 3:
+                raise OperationalError('database is locked')
+            return PizzaTopping.objects.create(topping='Bacon')
+
+        topping = WriteDispatcher().submit(write)
+
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(topping.topping, 'Bacon')
+
+    @override_settings(PIZZA_WRITE_RETRIES=2, PIZZA_WRITE_RETRY_DELAY=0)
+    def test_write_should_be_unavailable_when_the_retries_run_out(self):
+        def write():
+            raise OperationalError('database is locked')
+
+        with self.assertRaises(WriteUnavailable):
+            WriteDispatcher().submit(write)
+
+    @override_settings(PIZZA_WRITE_QUEUE_SIZE=1, PIZZA_WRITE_TIMEOUT=0.1)
+    def test_write_should_be_unavailable_when_the_worker_is_busy_for_too_long(self):
+        dispatcher = WriteDispatcher()
+        started = threading.Event()
+        release = threading.Event()
+        running = threading.Thread(target=dispatcher.submit, args=(lambda: started.set() or release.wait(),))
+        running.start()
+        started.wait()
+        try:
+            # the worker is busy so the first write waits in the queue until it times out
+            with self.assertRaises(WriteUnavailable):
+                dispatcher.submit(lambda: None)
+            # the timed out write is still in the queue
+            with self.assertRaises(WriteUnavailable):
+                dispatcher.submit(lambda: None)
+        finally:
+            release.set()
+            running.join()
+
+
+class TestConcurrentWriteRequests(TransactionTestCase):
+    """Tests concurrent PUT and POST requests to the topping and pizza views, with and without the single writer"""
+
+    threads = 20
+    writes_per_thread = 5
+
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser(username='admin_created', password='pass')
+        self.toppings = [PizzaTopping.objects.create(topping=f'Topping {number}') for number in range(self.threads)]
+        self.pizzas = []
+        for number, topping in enumerate(self.toppings):
+            pizza = Pizza.objects.create(pizza=f'Pizza {number}')
+            pizza.toppings.set([topping])
+            self.pizzas.append(pizza)
+
+    def _send_writes(self):
+        """Returns the errors of the requests sent by the threads, each changing its own topping and pizza"""
+        errors = []
+
+        def writer(number):
+            client = APIClient()
+            client.force_authenticate(self.admin_user)
+            topping_url = f'/toppings/{self.toppings[number].pk}'
+            pizza_url = f'/pizzas/{self.pizzas[number].pk}'
+            try:
+                for write in range(self.writes_per_thread):
+                    requests = (
+                        (client.put, topping_url, {'topping': f'Topping {number}-{write}'}),
+                        (client.put, pizza_url, {'pizza': f'Pizza {number}-{write}', 'toppings': [f'Topping {number}-{write}']}),
+                        (client.post, '/toppings/', {'topping': f'New Topping {number}-{write}'}),
+                        )
+                    for method, url, data in requests:
+                        try:
+                            response = method(url, data=data, format='json')
+                        except Exception as error:
+                            errors.append(error)
+                        else:
+                            if response.status_code >= 400:
+                                errors.append(response)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=writer, args=(number,)) for number in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return errors
+
+    def test_concurrent_writes_should_not_fail_with_the_single_writer(self):
+        errors = self._send_writes()
+
+        self.assertEqual(errors, [])
+        writes = self.threads * self.writes_per_thread
+        self.assertEqual(PizzaTopping.objects.filter(topping__startswith='New Topping').count(), writes)
+        last_write = self.writes_per_thread - 1
+        self.assertEqual(Pizza.objects.get(pk=self.pizzas[0].pk).topping_names, [f'Topping 0-{last_write}'])
+
+    @override_settings(PIZZA_WRITE_DISPATCHER=False)
+    def test_concurrent_writes_should_fail_with_lock_errors_without_the_single_writer(self):
+        errors = self._send_writes()
+
+        # besides the lock errors, pizzas are rejected when the rename of their topping failed
+        self.assertTrue([error for error in errors if is_locked(error)])
+
+
+class TestCaseInsensitiveNames(TestCase):
+    """Tests the lookup keys that make topping and pizza names unique regardless of case"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.topping = PizzaTopping.objects.create(topping='Bacon')
+        cls.pizza = Pizza.objects.create(pizza='Bacon Pizza')
+        cls.factory = APIRequestFactory()
+
+    def test_save_should_set_the_key(self):
+        self.assertEqual(PizzaTopping.objects.get(topping_key='bacon'), self.topping)
+        self.assertEqual(Pizza.objects.get(pizza_key='bacon pizza'), self.pizza)
+
+    def test_names_in_another_case_should_be_rejected(self):
+        """The unique index of the key rejects the name when it is saved"""
+        request = self.factory.post('/')
+        topping_serializer = PizzaToppingSerializer(data={'topping': 'BACON'}, context={'request': request})
+        pizza_serializer = PizzaSerializer(data={'pizza': 'bacon pizza', 'toppings': []}, context={'request': request})
+
+        self.assertTrue(topping_serializer.is_valid())
+        with self.assertRaises(serializers.ValidationError) as context:
+            topping_serializer.save()
+        self.assertEqual(context.exception.detail, {'topping': ['Topping already exists']})
+        self.assertTrue(pizza_serializer.is_valid())
+        with self.assertRaises(serializers.ValidationError) as context:
+            pizza_serializer.save()
+        self.assertEqual(context.exception.detail, {'pizza': ['Pizza already exists']})
+
+    def test_changing_the_case_of_a_name_should_be_allowed(self):
+        request = self.factory.put('/')
+        serializer = PizzaToppingSerializer(self.topping, data={'topping': 'BACON'}, context={'request': request})
+        self.assertTrue(serializer.is_valid())
+        serializer.save()
+
+        self.topping.refresh_from_db()
+        self.assertEqual(self.topping.topping, 'BACON')
+        self.assertEqual(self.topping.topping_key, 'bacon')
+
+    def test_save_with_update_fields_should_update_the_key(self):
+        self.topping.topping = 'Smoked Bacon'
+        self.topping.save(update_fields=['topping'])
+
+        self.assertEqual(PizzaTopping.objects.get(pk=self.topping.pk).topping_key, 'smoked bacon')
+
+    def test_full_clean_should_check_the_key(self):
+        """The key isn't on the forms of the admin, so the uniqueness of the name checks it"""
+        with self.assertRaises(ValidationError) as context:
+            PizzaTopping(topping='bacon').full_clean(exclude=['topping_key'])
+
+        self.assertEqual(context.exception.message_dict['topping_key'], ['Topping already exists'])
+
+
+class TestUniqueNameWrites(TestCase):
+    """Tests that POST and PUT leave the uniqueness of the names to the unique index instead of a SELECT"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='unique_writer', password='pass')
+        cls.user.user_permissions.add(*Permission.objects.filter(codename__in=[
+            'add_pizzatopping', 'change_pizzatopping', 'add_pizza', 'change_pizza',
+            ]))
+        cls.bacon = PizzaTopping.objects.create(topping='Bacon')
+        cls.ham = PizzaTopping.objects.create(topping='Ham')
+        cls.pizza = Pizza.objects.create(pizza='Bacon Pizza')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def _write(self, method, url, data):
+        """Returns the response and the statements run on the table of the names"""
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data=data, content_type='application/json')
+
+        return response, queries
+
+    def _name_lookups(self, queries, key_field):
+        return [query['sql'] for query in queries if query['sql'].startswith('SELECT') and f'"{key_field}" =' in query['sql']]
+
+    def test_post_topping_should_only_insert(self):
+        response, queries = self._write('post', '/toppings/', {'topping': 'Onion'})
+
+        self.assertEqual(response.status_code, 201)
+        topping_queries = [query['sql'] for query in queries if 'pizza_pizzatopping' in query['sql']]
+        self.assertEqual(len(topping_queries), 1)
+        self.assertTrue(topping_queries[0].startswith('INSERT'))
+
+    def test_put_topping_should_select_by_pk_and_update(self):
+        response, queries = self._write('put', f'/toppings/{self.ham.pk}', {'topping': 'Smoked Ham'})
+
+        self.assertEqual(response.status_code, 200)
+        topping_queries = [query['sql'] for query in queries if 'pizza_pizzatopping' in query['sql']]
+        self.assertEqual(len(topping_queries), 2)
+        self.assertTrue(topping_queries[1].startswith('UPDATE'))
+        self.assertEqual(self._name_lookups(queries, 'topping_key'), [])
+
+    def test_post_and_put_pizza_should_not_look_up_the_name(self):
+        response, queries = self._write('post', '/pizzas/', {'pizza': 'Ham Pizza', 'toppings': ['Ham']})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self._name_lookups(queries, 'pizza_key'), [])
+
+        response, queries = self._write('put', f'/pizzas/{self.pizza.pk}', {'pizza': 'BACON PIZZA', 'toppings': []})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._name_lookups(queries, 'pizza_key'), [])
+
+    def test_duplicates_should_be_rejected_with_400_and_leave_the_entries_unchanged(self):
+        response, queries = self._write('put', f'/toppings/{self.ham.pk}', {'topping': 'BACON'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'topping': ['Topping already exists']})
+        self.assertEqual(PizzaTopping.objects.get(pk=self.ham.pk).topping, 'Ham')
+
+        response, queries = self._write('post', '/pizzas/', {'pizza': 'bacon pizza', 'toppings': ['Ham']})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'pizza': ['Pizza already exists']})
+        self.assertEqual(Pizza.objects.count(), 1)
+
+    def test_other_integrity_errors_should_be_raised(self):
+        serializer = PizzaToppingSerializer(data={'topping': 'Onion'}, context={'request': None})
+        self.assertTrue(serializer.is_valid())
+        with patch.object(PizzaTopping, 'set_key', lambda topping: setattr(topping, 'topping_key', None)):
+            with self.assertRaises(IntegrityError):
+                serializer.save()
+
+
+@override_settings(PIZZA_READ_REPLICAS=['replica'], PIZZA_REPLICA_PIN_SECONDS=5)
+class TestReadReplicas(TestCase):
+    """
+    Tests the routing of reads to replicas.
+    The router is patched to record the database it picks and read from default, which stands in for the replica.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner_user = User.objects.create_user(username='owner_created', password='pass')
+        owner_group, created = Group.objects.get_or_create(name='Pizza Owner')
+        owner_group.permissions.add(*Permission.objects.filter(codename__endswith='_pizzatopping'))
+        cls.owner_user.groups.add(owner_group)
+        cls.topping = PizzaTopping.objects.create(topping='Bacon')
+        credentials = base64.b64encode(b'owner_created:pass').decode()
+        cls.authorization = f'Basic {credentials}'
+
+    def setUp(self):
+        cache.clear()
+        self.databases_read = []
+        self.models_read = []
+        db_for_read = ReplicaRouter.db_for_read
+
+        def record(router, model, **hints):
+            database = db_for_read(router, model, **hints)
+            self.databases_read.append(database)
+            self.models_read.append((model, database))
+
+        patcher = patch.object(ReplicaRouter, 'db_for_read', autospec=True, side_effect=record)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _read(self, url='/toppings/', **headers):
+        self.databases_read.clear()
+        self.models_read.clear()
+        response = self.client.get(url, **headers)
+        self.assertEqual(response.status_code, 200)
+
+        return set(self.databases_read)
+
+    def _create_topping(self, topping='Ham'):
+        return self.client.post(
+            '/toppings/', data={'topping': topping}, content_type='application/json',
+            HTTP_AUTHORIZATION=self.authorization
+            )
+
+    def test_reads_of_the_list_and_detail_views_should_go_to_the_replica(self):
+        self.assertEqual(self._read('/toppings/'), {'replica'})
+        self.assertEqual(self._read(f'/toppings/{self.topping.pk}'), {'replica'})
+
+    def test_the_catalog_version_should_be_read_from_the_database_of_the_response(self):
+        self._read()
+        self.assertIn((CatalogVersion, 'replica'), self.models_read)
+
+        self._create_topping()
+        self._read()
+        self.assertIn((CatalogVersion, None), self.models_read)
+
+    @override_settings(PIZZA_READ_REPLICAS=[])
+    def test_reads_should_go_to_default_without_replicas(self):
+        self.assertEqual(self._read(), {None})
+        self.assertNotIn(PIN_COOKIE, self._create_topping().cookies)
+
+    def test_a_change_should_pin_the_client_to_default(self):
+        response = self._create_topping()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 5)
+
+        self.assertEqual(self._read(), {None})
+
+    def test_clients_without_cookies_should_be_pinned_by_their_credentials(self):
+        use_shared_cache(self.addCleanup)
+        self.assertEqual(self._create_topping().status_code, 201)
+        self.client.cookies.clear()
+
+        self.assertEqual(self._read(HTTP_AUTHORIZATION=self.authorization), {None})
+        self.assertEqual(self._read(), {'replica'})
+
+    @override_settings(
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}, PIZZA_CACHE_ALIAS='default'
+        )
+    def test_clients_sending_credentials_should_read_from_default_without_a_shared_cache(self):
+        # the pin of a change made through another process can't be seen in a LocMemCache
+        self.assertEqual(self._read(HTTP_AUTHORIZATION=self.authorization), {None})
+        self.assertEqual(self._read(), {'replica'})
+
+    def test_a_failed_change_should_not_pin_the_client(self):
+        use_shared_cache(self.addCleanup)
+        response = self._create_topping('Bacon')
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+        self.assertEqual(self._read(HTTP_AUTHORIZATION=self.authorization), {'replica'})
+
+    @override_settings(PIZZA_CACHE_ALIAS='default')
+    def test_responses_read_from_a_replica_should_not_be_cached(self):
+        self._read()
+
+        self.assertEqual(self._read(), {'replica'})
+
+    def test_async_reads_should_go_to_the_replica(self):
+        view = async_views.async_reads(ToppingList, async_views.topping_list)
+        request = RequestFactory().get('/toppings/', HTTP_ACCEPT='application/json')
+
+        self.assertEqual(async_to_sync(view)(request).status_code, 200)
+        self.assertEqual(set(self.databases_read), {'replica'})
+
+    def test_replicas_should_not_be_migrated(self):
+        self.assertFalse(ReplicaRouter().allow_migrate('replica', 'pizza'))
+        self.assertIsNone(ReplicaRouter().allow_migrate('default', 'pizza'))
+
+
+class TestNameSearch(TestCase):
+    """Tests the ?prefix= and ?search= filters of the lists"""
+
+    @classmethod
+    def setUpTestData(cls):
+        for topping in ('Bacon', 'Black Olive', 'Basil', 'Smoked Bacon', 'Ham'):
+            PizzaTopping.objects.create(topping=topping)
+        Pizza.objects.create(pizza='Bacon Deluxe')
+        Pizza.objects.create(pizza='Hawaiian')
+
+    def _names(self, url, field='topping'):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        return sorted(item[field] for item in response.data)
+
+    def test_prefix_should_match_the_start_of_names_regardless_of_case(self):
+        self.assertEqual(self._names('/toppings/?prefix=ba'), ['Bacon', 'Basil'])
+        self.assertEqual(self._names('/toppings/?prefix=BLACK O'), ['Black Olive'])
+        self.assertEqual(self._names('/pizzas/?prefix=h', 'pizza'), ['Hawaiian'])
+
+    def test_search_should_match_the_start_of_every_word(self):
+        self.assertEqual(self._names('/toppings/?search=bac'), ['Bacon', 'Smoked Bacon'])
+        self.assertEqual(self._names('/toppings/?search=bacon sm'), ['Smoked Bacon'])
+        self.assertEqual(self._names('/toppings/?search=aco'), [])
+        self.assertEqual(self._names('/pizzas/?search=DELUXE', 'pizza'), ['Bacon Deluxe'])
+
+    def test_search_syntax_should_be_matched_as_text(self):
+        for search in ('"', 'bacon OR ham', 'NEAR(bacon', '*', 'ham-'):
+            response = self.client.get('/toppings/', {'search': search})
+            self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self._names('/toppings/?search=ham-'), ['Ham'])
+
+    def test_filters_should_combine_with_pagination(self):
+        response = self.client.get('/toppings/', {'prefix': 'b', 'page_size': 2})
+
+        self.assertEqual([item['topping'] for item in response.data['results']], ['Bacon', 'Black Olive'])
+        self.assertEqual(
+            [item['topping'] for item in self.client.get(response.data['next']).data['results']], ['Basil']
+            )
+
+    def test_search_index_should_follow_changes(self):
+        topping = PizzaTopping.objects.get(topping='Ham')
+        topping.topping = 'Smoked Ham'
+        topping.save()
+        PizzaTopping.objects.get(topping='Basil').delete()
+        PizzaTopping.objects.bulk_create([PizzaTopping(topping='Smoked Salmon', topping_key='smoked salmon')])
+
+        self.assertEqual(self._names('/toppings/?search=smoked'), ['Smoked Bacon', 'Smoked Ham', 'Smoked Salmon'])
+        self.assertEqual(self._names('/toppings/?search=basil'), [])
+
+    @skipUnless(connection.vendor == 'sqlite', 'the keys are compared as a range on sqlite')
+    def test_prefix_should_seek_the_key_index(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/toppings/?prefix=bac')
+        sql = next(query['sql'] for query in queries.captured_queries if 'topping_key" >=' in query['sql'])
+        self.assertNotIn('LIKE', sql)
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('USING INDEX', plan)
+
+    def _postgresql_plan(self, url, table):
+        """Returns the plan of the query of url on table, with sequential scans off as the tables are tiny"""
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        sql = next(query['sql'] for query in queries.captured_queries if f'FROM "{table}"' in query['sql'])
+
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute(f'EXPLAIN {sql}')
+            return ' '.join(row[0] for row in cursor.fetchall())
+
+    @skipUnless(connection.vendor == 'postgresql', 'the pattern index of the keys is only created on PostgreSQL')
+    def test_prefix_should_use_the_pattern_index_of_the_key_on_postgresql(self):
+        self.assertIn('_like', self._postgresql_plan('/toppings/?prefix=bac', 'pizza_pizzatopping'))
+
+    @skipUnless(connection.vendor == 'postgresql', 'the tsvector index is only created on PostgreSQL')
+    def test_search_should_use_the_tsvector_index_on_postgresql(self):
+        self.assertIn('pizza_pizzatopping_search', self._postgresql_plan('/toppings/?search=bac', 'pizza_pizzatopping'))
+
+
+class TestToppingFilters(TestCase):
+    """Tests the ?topping=, ?topping_match= and ?exclude_topping= filters of the pizza list"""
+
+    @classmethod
+    def setUpTestData(cls):
+        toppings = {name: PizzaTopping.objects.create(topping=name) for name in ('Mushroom', 'Olive', 'Ham', 'Basil')}
+        for pizza, names in (
+            ('Funghi', ['Mushroom']),
+            ('Capricciosa', ['Mushroom', 'Olive', 'Ham']),
+            ('Vegetariana', ['Mushroom', 'Olive', 'Basil']),
+            ('Margherita', ['Basil']),
+            ('Plain', []),
+        ):
+            Pizza.objects.create(pizza=pizza).toppings.set([toppings[name] for name in names])
+
+    def _pizzas(self, params):
+        response = self.client.get('/pizzas/', params)
+        self.assertEqual(response.status_code, 200)
+
+        return sorted(item['pizza'] for item in response.data)
+
+    def test_pizzas_should_have_every_topping(self):
+        self.assertEqual(self._pizzas({'topping': ['mushroom', 'OLIVE']}), ['Capricciosa', 'Vegetariana'])
+        self.assertEqual(self._pizzas({'topping': ['Mushroom', 'Olive', 'Basil']}), ['Vegetariana'])
+        self.assertEqual(self._pizzas({'topping': ['Mushroom', 'Pineapple']}), [])
+
+    def test_pizzas_should_have_any_topping(self):
+        self.assertEqual(
+            self._pizzas({'topping': ['Ham', 'Basil'], 'topping_match': 'any'}),
+            ['Capricciosa', 'Margherita', 'Vegetariana']
+            )
+        self.assertEqual(self._pizzas({'topping': ['Ham', 'Pineapple'], 'topping_match': 'any'}), ['Capricciosa'])
+
+    def test_pizzas_should_have_no_excluded_topping(self):
+        self.assertEqual(self._pizzas({'exclude_topping': 'ham'}), ['Funghi', 'Margherita', 'Plain', 'Vegetariana'])
+        self.assertEqual(
+            self._pizzas({'topping': 'Mushroom', 'exclude_topping': ['Ham', 'Basil']}), ['Funghi']
+            )
+
+    def test_pizzas_should_keep_all_their_toppings(self):
+        response = self.client.get('/pizzas/', {'topping': 'Ham'})
+
+        self.assertEqual(sorted(response.data[0]['toppings']), ['Ham', 'Mushroom', 'Olive'])
+
+    def test_unknown_match_should_be_rejected(self):
+        response = self.client.get('/pizzas/', {'topping': 'Ham', 'topping_match': 'some'})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('topping_match', response.data)
+
+    def test_filters_should_combine_with_pagination(self):
+        response = self.client.get('/pizzas/', {'topping': 'Mushroom', 'page_size': 2})
+
+        self.assertEqual([item['pizza'] for item in response.data['results']], ['Funghi', 'Capricciosa'])
+        self.assertEqual(
+            [item['pizza'] for item in self.client.get(response.data['next']).data['results']], ['Vegetariana']
+            )
+
+    def test_toppings_should_be_read_from_the_topping_index(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/pizzas/', {'topping': ['Mushroom', 'Olive']})
+
+        sql = next(query['sql'] for query in queries.captured_queries if 'topping_key" IN' in query['sql'])
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('COVERING INDEX pizza_pizza_toppings_pizzatopping_id_pizza_id', plan)
+
+
+class TestToppingsFingerprint(TestCase):
+    """Tests the fingerprint of the toppings of pizzas and ?toppings_exact="""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.chef_user = User.objects.create_user(username='chef_created', password='pass')
+        cls.chef_user.user_permissions.add(*Permission.objects.filter(codename__endswith='_pizza'))
+        cls.ham, cls.olive, cls.basil = (
+            PizzaTopping.objects.create(topping=name) for name in ('Ham', 'Olive', 'Basil')
+            )
+        cls.pizza = Pizza.objects.create(pizza='Capricciosa')
+        cls.pizza.toppings.set([cls.ham, cls.olive])
+        cls.plain = Pizza.objects.create(pizza='Plain')
+
+    def assertFingerprint(self, pizza, toppings):
+        pizza.refresh_from_db()
+        self.assertEqual(pizza.toppings_fingerprint, toppings_fingerprint(topping.pk for topping in toppings))
+
+    def test_fingerprint_should_not_depend_on_the_order(self):
+        self.assertEqual(toppings_fingerprint([1, 2, 3]), toppings_fingerprint([3, 1, 2, 1]))
+        self.assertNotEqual(toppings_fingerprint([1, 23]), toppings_fingerprint([12, 3]))
+
+    def test_fingerprint_should_follow_changes_of_the_toppings(self):
+        self.assertFingerprint(self.pizza, [self.ham, self.olive])
+        self.assertEqual(self.plain.toppings_fingerprint, EMPTY_FINGERPRINT)
+
+        self.pizza.toppings.add(self.basil)
+        self.assertFingerprint(self.pizza, [self.ham, self.olive, self.basil])
+        self.pizza.toppings.remove(self.ham)
+        self.assertFingerprint(self.pizza, [self.olive, self.basil])
+        self.pizza.toppings.clear()
+        self.assertFingerprint(self.pizza, [])
+
+    def test_fingerprint_should_follow_changes_from_the_topping_side(self):
+        self.olive.pizza_set.add(self.plain)
+        self.assertFingerprint(self.plain, [self.olive])
+        self.olive.pizza_set.clear()
+        self.assertFingerprint(self.plain, [])
+        self.assertFingerprint(self.pizza, [self.ham])
+
+    def test_deleting_a_topping_should_update_the_fingerprint(self):
+        self.ham.delete()
+
+        self.assertFingerprint(self.pizza, [self.olive])
+
+    def test_toppings_exact_should_find_the_pizzas_with_the_same_toppings(self):
+        def pizzas(toppings):
+            response = self.client.get('/pizzas/', {'toppings_exact': toppings})
+            return [item['pizza'] for item in response.data]
+
+        self.assertEqual(pizzas(['olive', 'HAM']), ['Capricciosa'])
+        self.assertEqual(pizzas(['Ham']), [])
+        self.assertEqual(pizzas(['Ham', 'Olive', 'Pineapple']), [])
+        self.assertEqual(pizzas(''), ['Plain'])
+
+    def test_toppings_exact_should_seek_the_fingerprint_index(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/pizzas/', {'toppings_exact': ['Ham', 'Olive']})
+        sql = next(query['sql'] for query in queries.captured_queries if 'toppings_fingerprint" =' in query['sql'])
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('USING INDEX pizza_pizza_toppings_fingerprint', plan)
+
+    @override_settings(PIZZA_UNIQUE_TOPPING_SETS=True)
+    def test_duplicate_toppings_should_be_rejected_when_enabled(self):
+        self.client.force_login(self.chef_user)
+        response = self.client.post(
+            '/pizzas/', {'pizza': 'Prosciutto', 'toppings': ['Olive', 'Ham']}, content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['toppings'], ['Capricciosa already has these toppings'])
+
+        response = self.client.put(
+            f'/pizzas/{self.pizza.pk}', {'pizza': 'Capricciosa', 'toppings': ['Ham', 'Olive']},
+            content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def test_duplicate_toppings_should_be_allowed_by_default(self):
+        self.client.force_login(self.chef_user)
+        response = self.client.post(
+            '/pizzas/', {'pizza': 'Prosciutto', 'toppings': ['Olive', 'Ham']}, content_type='application/json'
+            )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertFingerprint(Pizza.objects.get(pizza='Prosciutto'), [self.ham, self.olive])
+
+
+class TestSparseFields(TestCase):
+    """Tests that ?fields= leaves the fields that aren't requested out of the responses and the queries"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ham = PizzaTopping.objects.create(topping='Ham')
+        for number in range(3):
+            Pizza.objects.create(pizza=f'Pizza {number}').toppings.set([cls.ham])
+
+    def test_list_should_only_have_the_requested_fields(self):
+        response = self.client.get('/toppings/', {'fields': 'topping'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, [{'topping': 'Ham'}])
+
+    @patch('rest_framework.relations.HyperlinkedRelatedField.get_url')
+    def test_urls_that_are_not_requested_should_not_be_built(self, mock_get_url):
+        self.client.get('/pizzas/', {'fields': 'pizza,toppings'})
+        self.client.get(f'/toppings/{self.ham.pk}', {'fields': 'topping'})
+
+        mock_get_url.assert_not_called()
+
+    def test_toppings_that_are_not_requested_should_not_be_queried(self):
+        # the catalog version and the pizzas
+        with self.assertNumQueries(2):
+            response = self.client.get('/pizzas/', {'fields': 'pizza,url'})
+        self.assertEqual(set(response.data[0]), {'pizza', 'url'})
+
+        with self.assertNumQueries(2):
+            response = self.client.get('/pizzas/', {'fields': 'toppings'})
+        self.assertEqual(response.data[0], {'toppings': ['Ham']})
+
+    def test_columns_that_are_not_requested_should_not_be_selected(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/pizzas/', {'fields': 'url'})
+
+        self.assertNotIn('"pizza_pizza"."pizza"', queries.captured_queries[-1]['sql'])
+        self.assertNotIn('"pizza_pizza"."topping_names"', queries.captured_queries[-1]['sql'])
+
+    def test_detail_should_only_have_the_requested_fields(self):
+        pizza = Pizza.objects.first()
+        response = self.client.get(f'/pizzas/{pizza.pk}', {'fields': 'toppings'})
+
+        self.assertEqual(response.data, {'toppings': ['Ham']})
+
+    def test_fields_should_combine_with_pagination_and_streaming(self):
+        response = self.client.get('/pizzas/', {'fields': 'pizza', 'page_size': 2})
+        self.assertEqual(response.data['results'], [{'pizza': 'Pizza 0'}, {'pizza': 'Pizza 1'}])
+
+        response = self.client.get('/pizzas/', {'fields': 'pizza', 'stream': 1})
+        self.assertEqual(
+            json.loads(b''.join(response.streaming_content)),
+            [{'pizza': 'Pizza 0'}, {'pizza': 'Pizza 1'}, {'pizza': 'Pizza 2'}]
+            )
+
+    def test_unknown_fields_should_be_rejected(self):
+        response = self.client.get('/toppings/', {'fields': 'topping,price'})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['fields'], ['Unknown field: price'])
+
+    def test_writes_should_return_every_field(self):
+        user = User.objects.create_user(username='owner_created', password='pass')
+        user.user_permissions.add(*Permission.objects.filter(codename__endswith='_pizzatopping'))
+        self.client.force_login(user)
+        response = self.client.post('/toppings/?fields=topping', {'topping': 'Basil'}, content_type='application/json')
+
+        self.assertEqual(set(response.data), {'topping', 'url'})
+
+
+class TestRenderers(TestCase):
+    """Tests the MessagePack and orjson renderers and the compression of responses"""
+
+    @classmethod
+    def setUpTestData(cls):
+        toppings = [PizzaTopping.objects.create(topping=name) for name in ('Ham', 'Jalapeño', 'Olive')]
+        for number in range(30):
+            Pizza.objects.create(pizza=f'Pizza {number}').toppings.set(toppings)
+        cls.pizza = Pizza.objects.first()
+
+    def test_msgpack_should_be_negotiated(self):
+        for url in ('/toppings/', '/pizzas/', f'/pizzas/{self.pizza.pk}'):
+            expected = self.client.get(url).json()
+            by_accept = self.client.get(url, HTTP_ACCEPT='application/msgpack')
+            by_format = self.client.get(url, {'format': 'msgpack'})
+
+            self.assertEqual(by_accept['Content-Type'], 'application/msgpack')
+            self.assertEqual(msgpack.unpackb(by_accept.content), expected)
+            self.assertEqual(by_format['Content-Type'], 'application/msgpack')
+
+    def test_orjson_should_render_the_same_json(self):
+        for url in ('/toppings/', '/pizzas/', f'/pizzas/{self.pizza.pk}', '/pizzas/?page_size=2'):
+            expected = self.client.get(url, HTTP_ACCEPT='application/json').content
+            response = self.client.get(url, HTTP_ACCEPT='application/json; encoder=orjson')
+
+            self.assertEqual(response.content, expected)
+            self.assertEqual(response['Content-Type'], 'application/json; encoder=orjson')
+
+    def test_format_should_select_the_renderer_whatever_the_accept_header(self):
+        # the urls of the response keep ?format=
+        expected = self.client.get('/pizzas/', {'format': 'json'}).content.replace(b'format=json', b'format=orjson')
+        response = self.client.get('/pizzas/', {'format': 'orjson'}, HTTP_ACCEPT='text/html')
+
+        self.assertEqual(response.content, expected)
+
+    def test_plain_json_should_keep_the_default_renderer(self):
+        response = self.client.get('/toppings/', HTTP_ACCEPT='application/json')
+
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+    def test_large_responses_should_be_compressed_with_brotli(self):
+        plain = self.client.get('/pizzas/')
+        response = self.client.get('/pizzas/', HTTP_ACCEPT_ENCODING='gzip, deflate, br')
+
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.content), plain.content)
+        self.assertTrue(response['ETag'].startswith('W/'))
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_large_responses_should_be_compressed_with_gzip_without_brotli(self):
+        plain = self.client.get('/pizzas/')
+        response = self.client.get('/pizzas/', HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+
+    def test_streamed_responses_should_be_compressed(self):
+        plain = self.client.get('/pizzas/', {'stream': 1})
+        response = self.client.get('/pizzas/', {'stream': 1}, HTTP_ACCEPT_ENCODING='br')
+
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(b''.join(response.streaming_content)), b''.join(plain.streaming_content))
+
+    def test_small_responses_should_not_be_compressed(self):
+        response = self.client.get(f'/toppings/{self.pizza.toppings.first().pk}', HTTP_ACCEPT_ENCODING='br, gzip')
+
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_html_should_not_be_compressed_with_brotli(self):
+        response = self.client.get('/pizzas/', HTTP_ACCEPT='text/html', HTTP_ACCEPT_ENCODING='gzip, br')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    def test_compressed_responses_should_match_if_none_match(self):
+        response = self.client.get('/pizzas/', HTTP_ACCEPT_ENCODING='br')
+        response = self.client.get('/pizzas/', HTTP_ACCEPT_ENCODING='br', HTTP_IF_NONE_MATCH=response['ETag'])
+
+        self.assertEqual(response.status_code, 304)
+
+
+class TestReadSerializerParity(TestCase):
+    """Tests that the read serializers of the lists render the same JSON as PizzaToppingSerializer and PizzaSerializer"""
+
+    @classmethod
+    def setUpTestData(cls):
+        names = ['Ham', 'Épice', 'Smoked "Bacon"', 'Olive \u2028 Oil', '🍍 Pineapple']
+        toppings = [PizzaTopping.objects.create(topping=name) for name in names]
+        # toppings added out of pk order and pizzas with none, one or all of them
+        Pizza.objects.create(pizza='Plain')
+        Pizza.objects.create(pizza='Ham Pizza').toppings.set([toppings[0]])
+        pizza = Pizza.objects.create(pizza='Everything')
+        for topping in reversed(toppings):
+            pizza.toppings.add(topping)
+        Pizza.objects.create(pizza='Two').toppings.set([toppings[3], toppings[1]])
+
+    def _assert_same_json(self, serializer_class, read_serializer_class, queryset, path='/', fields=None):
+        request = Request(APIRequestFactory().get(path))
+        context = {'request': request, 'fields': fields}
+        # lists are ordered by pk unless they are ordered otherwise
+        queryset = queryset if queryset.ordered else queryset.order_by('pk')
+        expected = serializer_class(only_requested(queryset, fields), many=True, context=context).data
+        rows = read_serializer_class.values(queryset, fields)
+        data = read_serializer_class(rows, context=context).data
+
+        self.assertEqual(JSONRenderer().render(data), JSONRenderer().render(expected))
+
+    def test_toppings_should_render_the_same_json(self):
+        for fields in (None, ['topping'], ['url'], ['url', 'topping']):
+            with self.subTest(fields=fields):
+                self._assert_same_json(
+                    PizzaToppingSerializer, PizzaToppingReadSerializer, PizzaTopping.objects.all(), fields=fields
+                    )
+
+    def test_pizzas_should_render_the_same_json(self):
+        queryset = Pizza.objects.prefetch_related('toppings')
+        for denormalized in (True, False):
+            for fields in (None, ['pizza'], ['toppings'], ['url'], ['toppings', 'pizza'], ['url', 'toppings']):
+                with self.subTest(fields=fields, denormalized=denormalized):
+                    with override_settings(PIZZA_DENORMALIZED_TOPPINGS=denormalized):
+                        self._assert_same_json(PizzaSerializer, PizzaReadSerializer, queryset, fields=fields)
+
+    def test_urls_should_keep_the_format_of_the_request(self):
+        self._assert_same_json(PizzaToppingSerializer, PizzaToppingReadSerializer, PizzaTopping.objects.all(), '/?format=json')
+        self._assert_same_json(PizzaSerializer, PizzaReadSerializer, Pizza.objects.all(), '/?format=json')
+
+    def test_empty_and_filtered_lists_should_render_the_same_json(self):
+        for queryset in (Pizza.objects.none(), Pizza.objects.filter(pizza__startswith='T'), Pizza.objects.order_by('-pk')):
+            with self.subTest(query=str(queryset.query) if queryset.exists() else 'none'):
+                self._assert_same_json(PizzaSerializer, PizzaReadSerializer, queryset)
+
+    def test_list_responses_should_be_the_serializer_output(self):
+        for url, serializer_class, queryset in (
+                ('/toppings/', PizzaToppingSerializer, PizzaTopping.objects.order_by('pk')),
+                ('/pizzas/', PizzaSerializer, Pizza.objects.prefetch_related('toppings').order_by('pk')),
+                ):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                context = {'request': response.wsgi_request}
+                expected = serializer_class(queryset, many=True, context=context).data
+
+                self.assertEqual(response.content, JSONRenderer().render(expected))
+
+    def test_detail_response_should_be_the_serializer_output(self):
+        for pizza in Pizza.objects.prefetch_related('toppings'):
+            with self.subTest(pizza=pizza.pizza):
+                response = self.client.get(f'/pizzas/{pizza.pk}')
+                expected = PizzaSerializer(pizza, context={'request': response.wsgi_request}).data
+
+                self.assertEqual(response.content, JSONRenderer().render(expected))
+
+    def test_pages_should_be_the_serializer_output(self):
+        queryset = Pizza.objects.prefetch_related('toppings').order_by('pk')
+        response = self.client.get('/pizzas/', {'page_size': 3})
+        first_page = PizzaSerializer(queryset[:3], many=True, context={'request': response.wsgi_request}).data
+        self.assertEqual(JSONRenderer().render(response.data['results']), JSONRenderer().render(first_page))
+
+        response = self.client.get(response.data['next'])
+        last_page = PizzaSerializer(queryset[3:], many=True, context={'request': response.wsgi_request}).data
+        self.assertEqual(JSONRenderer().render(response.data['results']), JSONRenderer().render(last_page))
+        self.assertIsNone(response.data['next'])
+
+
+class TestToppingNames(TestCase):
+    """Tests the topping names stored on pizzas and the check_pizza_toppings command"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ham, cls.olive, cls.basil = (
+            PizzaTopping.objects.create(topping=name) for name in ('Ham', 'Olive', 'Basil')
+            )
+        cls.pizza = Pizza.objects.create(pizza='Capricciosa')
+        cls.pizza.toppings.set([cls.olive, cls.ham])
+        cls.plain = Pizza.objects.create(pizza='Plain')
+
+    def assertToppingNames(self, pizza, names):
+        pizza.refresh_from_db()
+        self.assertEqual(pizza.topping_names, names)
+
+    def _check(self, *args):
+        stdout = io.StringIO()
+        call_command('check_pizza_toppings', *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_names_should_follow_changes_of_the_toppings(self):
+        # by topping pk whatever the order they were added in
+        self.assertToppingNames(self.pizza, ['Ham', 'Olive'])
+        self.assertToppingNames(self.plain, [])
+
+        self.pizza.toppings.add(self.basil)
+        self.assertToppingNames(self.pizza, ['Ham', 'Olive', 'Basil'])
+        self.pizza.toppings.remove(self.ham)
+        self.assertToppingNames(self.pizza, ['Olive', 'Basil'])
+        self.pizza.toppings.clear()
+        self.assertToppingNames(self.pizza, [])
+
+    def test_names_should_follow_changes_from_the_topping_side(self):
+        self.olive.pizza_set.add(self.plain)
+        self.assertToppingNames(self.plain, ['Olive'])
+        self.olive.pizza_set.clear()
+        self.assertToppingNames(self.plain, [])
+        self.assertToppingNames(self.pizza, ['Ham'])
+
+    def test_renaming_or_deleting_a_topping_should_update_the_names(self):
+        self.ham.topping = 'Smoked Ham'
+        self.ham.save()
+        self.assertToppingNames(self.pizza, ['Smoked Ham', 'Olive'])
+
+        self.olive.delete()
+        self.assertToppingNames(self.pizza, ['Smoked Ham'])
+
+    def test_check_should_pass_when_nothing_drifted(self):
+        self.assertIn('Checked 2 pizzas, 0 drifted', self._check())
+
+    def test_check_should_fail_on_drift_and_repair_it(self):
+        # update() doesn't send signals
+        PizzaTopping.objects.filter(pk=self.ham.pk).update(topping='Prosciutto')
+        Pizza.toppings.through.objects.filter(pizza_id=self.plain.pk).delete()
+        Pizza.toppings.through.objects.create(pizza_id=self.plain.pk, pizzatopping_id=self.basil.pk)
+
+        with self.assertRaises(CommandError):
+            self._check()
+        self.assertToppingNames(self.pizza, ['Ham', 'Olive'])
+
+        output = self._check('--repair', '--batch-size', '1')
+        self.assertIn('Checked 2 pizzas, 2 drifted', output)
+        self.assertToppingNames(self.pizza, ['Prosciutto', 'Olive'])
+        self.assertToppingNames(self.plain, ['Basil'])
+        self.assertEqual(self.plain.toppings_fingerprint, toppings_fingerprint([self.basil.pk]))
+        self.assertIn('0 drifted', self._check())
+
+
+@override_settings(PIZZA_CATALOG_SNAPSHOT=True, PIZZA_SNAPSHOT_MAX_AGE=0)
+class TestCatalogSnapshot(TestCase):
+    """Tests the responses of the catalog snapshot of pizza/snapshot.py against the views"""
+
+    def setUp(self):
+        catalog_snapshots.clear()
+        self.addCleanup(catalog_snapshots.clear)
+        self.bacon = PizzaTopping.objects.create(topping='Bacon')
+        PizzaTopping.objects.create(topping='Onion')
+        self.pizza = Pizza.objects.create(pizza='Bacon Pizza')
+        self.pizza.toppings.set([self.bacon])
+        self.urls = ('/toppings/', f'/toppings/{self.bacon.pk}', '/pizzas/', f'/pizzas/{self.pizza.pk}')
+
+    def test_responses_should_be_the_responses_of_the_views(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                with self.settings(PIZZA_CATALOG_SNAPSHOT=False):
+                    expected = self.client.get(url)
+                response = self.client.get(url)
+
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.content, expected.content)
+                for header in ('Content-Type', 'ETag', 'Last-Modified', 'Allow', 'Vary', 'X-Frame-Options'):
+                    self.assertEqual(response[header], expected[header])
+
+    def test_repeated_gets_should_not_query_the_database(self):
+        with self.settings(PIZZA_SNAPSHOT_MAX_AGE=60):
+            self.client.get('/toppings/')
+            with self.assertNumQueries(0):
+                for url in self.urls:
+                    self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_version_should_be_read_without_rebuilding_when_unchanged(self):
+        self.client.get('/toppings/')
+        with self.assertNumQueries(1):
+            self.client.get('/pizzas/')
+
+    def test_changes_should_be_served_once_the_version_is_read_again(self):
+        with self.settings(PIZZA_SNAPSHOT_MAX_AGE=60):
+            self.client.get('/toppings/')
+            self.bacon.topping = 'Smoked Bacon'
+            self.bacon.save()
+
+            self.assertEqual(self.client.get(f'/toppings/{self.bacon.pk}').json()['topping'], 'Bacon')
+            with patch('pizza.snapshot.time.monotonic', return_value=time.monotonic() + 60):
+                self.assertEqual(self.client.get(f'/toppings/{self.bacon.pk}').json()['topping'], 'Smoked Bacon')
+                self.assertEqual(self.client.get(f'/pizzas/{self.pizza.pk}').json()['toppings'], ['Smoked Bacon'])
+
+    def test_version_should_be_the_mtime_of_the_marker_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with self.settings(PIZZA_SNAPSHOT_MARKER_FILE=os.path.join(directory, 'catalog-version')):
+                self.client.get('/toppings/')
+                with self.assertNumQueries(0):
+                    self.client.get('/toppings/')
+
+                with self.captureOnCommitCallbacks(execute=True):
+                    PizzaTopping.objects.create(topping='Ham')
+                self.assertIn('Ham', [topping['topping'] for topping in self.client.get('/toppings/').json()])
+
+    def test_matching_etag_should_return_not_modified(self):
+        etag = self.client.get('/pizzas/')['ETag']
+        response = self.client.get('/pizzas/', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_missing_detail_should_be_answered_by_the_view(self):
+        with self.settings(PIZZA_SNAPSHOT_MAX_AGE=60):
+            self.client.get('/pizzas/')
+            pizza = Pizza.objects.create(pizza='Plain')
+
+            self.assertEqual(self.client.get(f'/pizzas/{pizza.pk}').json()['pizza'], 'Plain')
+            self.assertEqual(self.client.get('/pizzas/100').status_code, 404)
+
+    def test_other_requests_should_be_answered_by_the_views(self):
+        self.client.get('/toppings/')
+        requests = (
+            {'HTTP_AUTHORIZATION': 'Basic ' + base64.b64encode(b'user:pass').decode()},
+            {'HTTP_ACCEPT': 'text/html'},
+            {'HTTP_ACCEPT': 'application/msgpack'},
+            {'data': {'fields': 'url'}},
+            )
+        for kwargs in requests:
+            with self.subTest(kwargs=kwargs), patch('pizza.snapshot.snapshot_response') as snapshot_response:
+                self.client.get('/toppings/', **kwargs)
+                snapshot_response.assert_not_called()
+
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = 'session'
+        with patch('pizza.snapshot.snapshot_response') as snapshot_response:
+            self.client.get('/toppings/')
+            snapshot_response.assert_not_called()
+
+    def test_a_client_that_made_a_change_should_read_it(self):
+        owner_user = User.objects.create_user(username='owner_created', password='pass')
+        owner_user.user_permissions.set(Permission.objects.filter(codename__endswith='_pizzatopping'))
+        credentials = base64.b64encode(b'owner_created:pass').decode()
+        with self.settings(PIZZA_SNAPSHOT_MAX_AGE=60):
+            self.client.get('/toppings/')
+            response = self.client.put(
+                f'/toppings/{self.bacon.pk}', data={'topping': 'Smoked Bacon'}, content_type='application/json',
+                HTTP_AUTHORIZATION=f'Basic {credentials}'
+                )
+            self.assertIn(PIN_COOKIE, response.cookies)
+
+            self.assertEqual(self.client.get(f'/toppings/{self.bacon.pk}').json()['topping'], 'Smoked Bacon')
+
+    async def test_async_requests_should_be_answered_from_a_fresh_snapshot_in_the_event_loop(self):
+        with self.settings(PIZZA_SNAPSHOT_MAX_AGE=60):
+            expected = await self.async_client.get('/toppings/')
+            with patch.object(catalog_snapshots, 'get') as get:
+                response = await self.async_client.get('/toppings/')
+
+        get.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, expected.content)
+        self.assertEqual(response['ETag'], expected['ETag'])
+
+
+class TestChangeLog(TestCase):
+    """Tests the change log of toppings and pizzas, /changes/ and the compact_changes command"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.ham = PizzaTopping.objects.create(topping='Ham')
+        self.olive = PizzaTopping.objects.create(topping='Olive')
+        self.pizza = Pizza.objects.create(pizza='Capricciosa')
+        self.pizza.toppings.set([self.ham])
+
+    def _changes_after(self, seq):
+        return list(
+            CatalogChange.objects.filter(seq__gt=seq).order_by('seq').values_list('resource', 'object_id', 'action')
+            )
+
+    def _get_changes(self, **params):
+        response = self.client.get('/changes/', params)
+        self.assertEqual(response.status_code, 200)
+
+        return response.json()
+
+    def test_only_the_latest_change_of_every_object_should_be_kept(self):
+        self.assertEqual(self._changes_after(0), [
+            ('topping', self.ham.pk, 'created'),
+            ('topping', self.olive.pk, 'created'),
+            ('pizza', self.pizza.pk, 'toppings'),
+            ])
+
+        seq = CatalogChange.latest_seq()
+        pizza_pk = self.pizza.pk
+        self.pizza.pizza = 'Capricciosa Special'
+        self.pizza.save()
+        self.assertEqual(self._changes_after(seq), [('pizza', pizza_pk, 'updated')])
+
+        self.olive.pizza_set.add(self.pizza)
+        self.pizza.delete()
+        self.assertEqual(self._changes_after(0), [
+            ('topping', self.ham.pk, 'created'),
+            ('topping', self.olive.pk, 'created'),
+            ('pizza', pizza_pk, 'deleted'),
+            ])
+
+    def test_renaming_or_deleting_a_topping_should_change_its_pizzas(self):
+        seq = CatalogChange.latest_seq()
+        ham_pk = self.ham.pk
+        self.ham.topping = 'Smoked Ham'
+        self.ham.save()
+        self.ham.delete()
+
+        self.assertEqual(self._changes_after(seq), [
+            ('topping', ham_pk, 'deleted'),
+            ('pizza', self.pizza.pk, 'toppings'),
+            ])
+
+    def test_bulk_created_toppings_should_be_logged(self):
+        seq = CatalogChange.latest_seq()
+        serializer = PizzaToppingSerializer(data=[{'topping': 'Basil'}, {'topping': 'Onion'}], many=True)
+        serializer.is_valid(raise_exception=True)
+        toppings = serializer.save()
+
+        self.assertEqual(self._changes_after(seq), [('topping', topping.pk, 'created') for topping in toppings])
+
+    def test_changes_should_be_paginated_by_sequence_number(self):
+        first_page = self._get_changes(since=0, page_size=2)
+        seqs = [change['seq'] for change in first_page['results']]
+        latest_seq = CatalogChange.latest_seq()
+
+        self.assertEqual(len(seqs), 2)
+        self.assertEqual(seqs, sorted(seqs))
+        self.assertEqual(first_page['last_seq'], seqs[-1])
+        self.assertEqual(first_page['latest_seq'], latest_seq)
+        self.assertEqual(first_page['results'][0], {
+            'seq': seqs[0], 'resource': 'topping', 'object_id': self.ham.pk, 'action': 'created',
+            'changed': first_page['results'][0]['changed'], 'url': f'http://testserver/toppings/{self.ham.pk}',
+            'data': {'topping': 'Ham', 'url': f'http://testserver/toppings/{self.ham.pk}'},
+            })
+
+        # compacted_seq, page, latest_seq and the pizzas of the page
+        with self.assertNumQueries(4):
+            second_page = self.client.get(first_page['next']).json()
+        self.assertEqual([change['seq'] for change in second_page['results']], [latest_seq])
+        self.assertIsNone(second_page['next'])
+        self.assertEqual(self._get_changes(since=latest_seq)['results'], [])
+        self.assertEqual(self._get_changes(since=latest_seq)['last_seq'], latest_seq)
+
+    def test_changes_should_carry_the_current_data_of_the_object(self):
+        seq = CatalogChange.latest_seq()
+        self.pizza.pizza = 'Capricciosa Special'
+        self.pizza.save()
+        self.olive.pizza_set.add(self.pizza)
+        ham_pk = self.ham.pk
+        self.ham.delete()
+
+        changes = {(change['resource'], change['object_id']): change for change in self._get_changes(since=seq)['results']}
+        self.assertEqual(changes[('pizza', self.pizza.pk)]['data'], {
+            'pizza': 'Capricciosa Special', 'toppings': ['Olive'], 'url': f'http://testserver/pizzas/{self.pizza.pk}',
+            })
+        # deleted objects are tombstones
+        self.assertEqual(changes[('topping', ham_pk)]['action'], 'deleted')
+        self.assertIsNone(changes[('topping', ham_pk)]['data'])
+
+    def test_invalid_since_should_be_rejected(self):
+        for since in ('-1', 'abc'):
+            with self.subTest(since=since):
+                self.assertEqual(self.client.get('/changes/', {'since': since}).status_code, 400)
+
+    def test_changes_should_be_read_only(self):
+        self.client.force_authenticate(User.objects.create_superuser(username='admin_created', password='pass'))
+
+        self.assertEqual(self.client.post('/changes/', {}).status_code, 405)
+
+    def test_compaction_should_keep_the_newest_changes(self):
+        latest_seq = CatalogChange.latest_seq()
+        output = io.StringIO()
+        seqs = list(CatalogChange.objects.order_by('seq').values_list('seq', flat=True))
+        call_command('compact_changes', '--keep', '1', '--batch-size', '2', stdout=output)
+
+        self.assertIn('Deleted 2 changes', output.getvalue())
+        self.assertEqual(list(CatalogChange.objects.values_list('seq', flat=True)), [latest_seq])
+        self.assertEqual(CatalogVersion.objects.get().compacted_seq, seqs[-2])
+
+        response = self.client.get('/changes/', {'since': 0})
+        self.assertEqual(response.status_code, 410)
+        self.assertEqual(response.json()['latest_seq'], latest_seq)
+        self.assertEqual(len(self._get_changes(since=seqs[-2])['results']), 1)
+
+        # the sequence numbers of deleted changes aren't given out again
+        PizzaTopping.objects.create(topping='Basil')
+        self.assertGreater(CatalogChange.latest_seq(), latest_seq)
+
+    def test_compaction_should_do_nothing_below_the_limit(self):
+        output = io.StringIO()
+        call_command('compact_changes', '--keep', '100', stdout=output)
+
+        self.assertIn('Nothing to compact', output.getvalue())
+        self.assertEqual(CatalogVersion.objects.get().compacted_seq, 0)
+        with self.assertRaises(CommandError):
+            call_command('compact_changes', '--keep', '0')
@@ -1,12 +1,19 @@
 from unittest.mock import patch, MagicMock
-from django.test import TestCase
+from asgiref.sync import iscoroutinefunction
+from django.db import NotSupportedError, connection
+from django.test import TestCase, override_settings
 from django.urls import resolve
 from django.http import Http404
+from rest_framework import serializers
+from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
 from rest_framework.test import APIRequestFactory
+from pizza.async_views import read_view, wants_plain_json, topping_list
+from pizza.authentication import VerifiedCredentials
 from pizza.models import PizzaTopping, Pizza
-from pizza.serializers import PizzaToppingSerializer, PizzaSerializer
+from pizza.search import filter_prefix, filter_search, prefix_range, tsquery
+from pizza.serializers import PizzaToppingSerializer, PizzaSerializer, TemplatedHyperlinkedIdentityField
 from pizza.views import ToppingList, ToppingDetails, Homepage, PizzaList, PizzaDetails
 
 
@@ -20,14 +27,17 @@ class TestPizzaToppingModel(TestCase):
 
         self.assertIn('topping', pizza_topping_fields)
 
-    def test_topping_field_should_have_unique_constraint(self):
+    def test_topping_key_field_should_have_unique_constraint(self):
 
-        self.assertTrue(self.topping_field.unique)
+        self.assertTrue(PizzaTopping._meta.get_field('topping_key').unique)
 
-    def test_tooping_field_db_collation_should_be_set_nocase(self):
-        """db_collation set to 'NOCASE' in sqlite3 ensures uniqueness is case insensitive"""
+    def test_topping_key_should_fold_the_case_of_topping(self):
+        """The key is unique so the topping is unique regardless of case on every database"""
+        topping_instance = PizzaTopping(topping='Bacon Bits')
+        topping_instance.set_key()
 
-        self.assertEqual(self.topping_field.db_collation, 'NOCASE')
+        self.assertEqual(topping_instance.topping_key, 'bacon bits')
+        self.assertIsNone(self.topping_field.db_collation)
 
     def test_str_should_be_same_as_topping_field(self):
         """__str__ of the instance should be topping field"""
@@ -51,14 +61,17 @@ class TestPizzaModel(TestCase):
 
         self.assertIn('toppings', self.pizza_fields)
 
-    def test_pizza_field_should_have_unique_constraint(self):
+    def test_pizza_key_field_should_have_unique_constraint(self):
 
-        self.assertTrue(self.pizza_field.unique)
+        self.assertTrue(Pizza._meta.get_field('pizza_key').unique)
 
-    def test_pizza_field_db_collation_should_be_set_nocase(self):
-        """db_collation set to 'NOCASE' in sqlite3 ensures uniqueness is case insensitive"""
+    def test_pizza_key_should_fold_the_case_of_pizza(self):
+        """The key is unique so the pizza is unique regardless of case on every database"""
+        pizza_instance = Pizza(pizza='Bacon Pizza')
+        pizza_instance.set_key()
 
-        self.assertEqual(self.pizza_field.db_collation, 'NOCASE')
+        self.assertEqual(pizza_instance.pizza_key, 'bacon pizza')
+        self.assertIsNone(self.pizza_field.db_collation)
         
     def test_topping_is_many_to_many_field(self):
         
@@ -128,6 +141,13 @@ class TestPizzaAppURLs(TestCase):
         self.assertEqual(resolve_url.url_name, 'pizzas_detail')
         self.assertDictEqual(resolve_url.kwargs, {'pk':1})
 
+    def test_changes_list_url_is_correct(self):
+        reverse_url = reverse(viewname='changes_list')
+        resolve_url = resolve('/changes/')
+
+        self.assertEqual(reverse_url, '/changes/')
+        self.assertEqual(resolve_url.url_name, 'changes_list')
+
 
 class TestHomepage(TestCase):
 
@@ -142,10 +162,15 @@ class TestHomepage(TestCase):
         request = self.factory.get('/')
         response = self.homepage_view(request)
 
-        self.assertEqual(response.data, {'Topping List': 'reversed_link', 'Pizza List': 'reversed_link', 'Swagger' : 'reversed_link'})
+        self.assertEqual(response.data, {
+            'Topping List': 'reversed_link', 'Pizza List': 'reversed_link', 'Change List': 'reversed_link',
+            'Swagger' : 'reversed_link'
+            })
         self.assertEqual(response.status_code, 200)
 
 
+# the database is stubbed, responses of one test would be served to the next from the cache
+@override_settings(PIZZA_CACHE_ALIAS=None)
 class TestPizzaToppingListView(TestCase):
     """Tests ToppingList class views"""
 
@@ -157,6 +182,10 @@ class TestPizzaToppingListView(TestCase):
         stub_topping.pk = 1
         cls.stub_topping_query_set = MagicMock()
         cls.stub_topping_query_set.__iter__.return_value = [stub_topping]
+        # rows read by PizzaToppingReadSerializer
+        cls.stub_topping_query_set.prefetch_related.return_value.values.return_value = [
+            {'pk': 1, 'topping': 'Stub Topping'}
+            ]
 
         cls.factory = APIRequestFactory()
         cls.topping_list_view = ToppingList.as_view()
@@ -228,6 +257,8 @@ class TestPizzaToppingListView(TestCase):
         self.assertContains(response, status_code=405, text='Method \\"DELETE\\" not allowed')
 
 
+# the database is stubbed, responses of one test would be served to the next from the cache
+@override_settings(PIZZA_CACHE_ALIAS=None)
 class TestPizzaToppingDetailsView(TestCase):
     """ Tests ToppingDetails class views"""
 
@@ -363,6 +394,8 @@ class TestPizzaToppingDetailsView(TestCase):
         self.assertContains(response, status_code=405, text='Method \\"POST\\" not allowed')
 
 
+# the database is stubbed, responses of one test would be served to the next from the cache
+@override_settings(PIZZA_CACHE_ALIAS=None)
 class TestPizzaListView(TestCase):
     """Tests PizzaList class views"""
 
@@ -380,6 +413,10 @@ class TestPizzaListView(TestCase):
         stub_pizza.toppings = [stub_topping]
         cls.stub_query_set = MagicMock()
         cls.stub_query_set.__iter__.return_value = [stub_pizza]
+        # rows read by PizzaReadSerializer
+        cls.stub_query_set.prefetch_related.return_value.values.return_value = [
+            {'pk': 1, 'pizza': 'Stub Pizza', 'topping_names': ['Stub Topping']}
+            ]
 
         cls.factory = APIRequestFactory()
         cls.pizza_list_view = PizzaList.as_view()
@@ -461,6 +498,8 @@ class TestPizzaListView(TestCase):
         self.assertContains(response, status_code=405, text='Method \\"DELETE\\" not allowed')
 
 
+# the database is stubbed, responses of one test would be served to the next from the cache
+@override_settings(PIZZA_CACHE_ALIAS=None)
 class TestPizzaDetailsView(TestCase):
     """ Tests PizzaDetails class views"""
 
@@ -473,6 +512,11 @@ class TestPizzaDetailsView(TestCase):
         cls.stub_pizza.pizza = 'Stub Pizza'
         cls.stub_pizza.pk = 1
         cls.stub_pizza.toppings = [stub_topping]
+        # GET reads the pizza as a row, see PizzaReadSerializer
+        cls.stub_pizza_rows = MagicMock()
+        cls.stub_pizza_rows.prefetch_related.return_value.values.return_value = [
+            {'pk': 1, 'pizza': 'Stub Pizza', 'topping_names': ['Stub Topping']}
+            ]
 
         cls.factory = APIRequestFactory()
         cls.pizza_details_view = PizzaDetails.as_view()
@@ -497,10 +541,9 @@ class TestPizzaDetailsView(TestCase):
         with self.assertRaises(Http404):
             pizza_detail_instance._get_object(pk=self.pk)
 
-    @patch('pizza.views.Pizza.objects.get')
-    def test_get_should_return_200_and_response_data_if_pizza_exists(self, mock_object_get):
-        """get_object will raise http404 if pizza doesn't exist"""
-        mock_object_get.return_value = self.stub_pizza # stubs database call
+    @patch('pizza.views.Pizza.objects.filter')
+    def test_get_should_return_200_and_response_data_if_pizza_exists(self, mock_object_filter):
+        mock_object_filter.return_value = self.stub_pizza_rows # stubs database call
         request = self.factory.get(f'/pizzas/{self.pk}')
         response = self.pizza_details_view(request, pk=self.pk)
 
@@ -509,20 +552,20 @@ class TestPizzaDetailsView(TestCase):
         self.assertEqual(response.data['toppings'], ['Stub Topping'])
         self.assertIsInstance(response, Response)
 
-    @patch('pizza.views.Pizza.objects.get')
-    def test_get_should_allow_anonymous_users_to_see_pizza_details(self, mock_object_get):
+    @patch('pizza.views.Pizza.objects.filter')
+    def test_get_should_allow_anonymous_users_to_see_pizza_details(self, mock_object_filter):
         self.permission_patcher.stop()  # stops mocking permission
-        mock_object_get.return_value = self.stub_pizza  # stubs database call
+        mock_object_filter.return_value = self.stub_pizza_rows  # stubs database call
         request = self.factory.get(f'/pizzas/{self.pk}/')
         response = self.pizza_details_view(request, pk=self.pk)
 
         self.assertTrue(request.user.is_anonymous)
         self.assertContains(response, status_code=200, text='Stub Pizza')
 
-    @patch('pizza.views.Pizza.objects.get')
-    def test_get_should_return_404_if_pizza_does_not_exist(self, mock_object_get) :
-        """Objects.get raise exception to simulate not existing"""
-        mock_object_get.side_effect = Pizza.DoesNotExist
+    @patch('pizza.views.Pizza.objects.filter')
+    def test_get_should_return_404_if_pizza_does_not_exist(self, mock_object_filter) :
+        """No row is read for a pizza that doesn't exist"""
+        mock_object_filter.return_value.prefetch_related.return_value.values.return_value = []
         request = self.factory.get(f'/pizzas/{self.pk}/')
         response = self.pizza_details_view(request, pk=self.pk)
 
@@ -596,3 +639,145 @@ class TestPizzaDetailsView(TestCase):
         response = self.pizza_details_view(request)
 
         self.assertContains(response, status_code=405, text='Method \\"POST\\" not allowed')
+
+
+class TestVerifiedCredentials(TestCase):
+    """Tests the cache of verified Basic auth credentials"""
+
+    def setUp(self):
+        self.credentials = VerifiedCredentials()
+        self.user = MagicMock(pk=1, password='pbkdf2_sha256$hash')
+
+    def test_digest_should_not_contain_the_password(self):
+        digest = self.credentials.digest('owner', 'secret password')
+
+        self.assertNotIn('secret password', digest)
+        self.assertNotEqual(digest, self.credentials.digest('owner', 'other password'))
+        self.assertNotEqual(digest, self.credentials.digest('chef', 'secret password'))
+
+    def test_get_should_return_user_pk_and_password_hash(self):
+        self.credentials.set('key', self.user)
+
+        self.assertEqual(self.credentials.get('key'), (1, 'pbkdf2_sha256$hash'))
+        self.assertIsNone(self.credentials.get('missing key'))
+
+    @override_settings(PIZZA_AUTH_CACHE_TTL=60)
+    @patch('pizza.authentication.time.monotonic')
+    def test_entries_should_expire(self, mock_monotonic):
+        mock_monotonic.return_value = 100
+        self.credentials.set('key', self.user)
+        mock_monotonic.return_value = 159
+
+        self.assertIsNotNone(self.credentials.get('key'))
+        mock_monotonic.return_value = 161
+        self.assertIsNone(self.credentials.get('key'))
+        self.assertEqual(len(self.credentials), 0)
+
+    @override_settings(PIZZA_AUTH_CACHE_SIZE=2)
+    def test_least_recently_used_entry_should_be_dropped_when_full(self):
+        self.credentials.set('first', self.user)
+        self.credentials.set('second', self.user)
+        self.credentials.get('first')
+        self.credentials.set('third', self.user)
+
+        self.assertEqual(len(self.credentials), 2)
+        self.assertIsNone(self.credentials.get('second'))
+        self.assertIsNotNone(self.credentials.get('first'))
+
+
+class TestAsyncReadRouting(TestCase):
+    """Tests which requests are answered by the async handlers of pizza/async_views.py"""
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+
+    def test_plain_json_get_should_be_answered_async(self):
+        self.assertTrue(wants_plain_json(self.factory.get('/toppings/')))
+        self.assertTrue(wants_plain_json(self.factory.get('/toppings/', HTTP_ACCEPT='application/json')))
+
+    def test_other_requests_should_be_answered_by_the_sync_views(self):
+        self.assertFalse(wants_plain_json(self.factory.post('/toppings/')))
+        self.assertFalse(wants_plain_json(self.factory.get('/toppings/', HTTP_ACCEPT='text/html,*/*')))
+        self.assertFalse(wants_plain_json(self.factory.get('/toppings/', {'page_size': 10})))
+        self.assertFalse(wants_plain_json(self.factory.get('/toppings/', HTTP_AUTHORIZATION='Basic b3duZXI6cGFzcw==')))
+
+    def test_read_view_should_only_be_async_when_enabled(self):
+        self.assertFalse(iscoroutinefunction(read_view(ToppingList, topping_list)))
+        with override_settings(PIZZA_ASYNC_READS=True):
+            self.assertTrue(iscoroutinefunction(read_view(ToppingList, topping_list)))
+
+
+class TestPrefixRange(TestCase):
+    """Tests the key bounds of ?prefix="""
+
+    def test_upper_bound_should_increment_the_last_character(self):
+        self.assertEqual(prefix_range('bac'), ('bac', 'bad'))
+        self.assertEqual(prefix_range('z'), ('z', '{'))
+
+    def test_upper_bound_should_skip_surrogates(self):
+        self.assertEqual(prefix_range('a\ud7ff'), ('a\ud7ff', 'a\ue000'))
+
+    def test_upper_bound_should_drop_the_last_code_point(self):
+        self.assertEqual(prefix_range('a\U0010ffff'), ('a\U0010ffff', 'b'))
+        self.assertEqual(prefix_range('\U0010ffff'), ('\U0010ffff', None))
+
+
+class TestPostgresqlSearch(TestCase):
+    """Tests the ?prefix= and ?search= queries built for PostgreSQL"""
+
+    def test_tsquery_should_match_every_word_as_a_prefix(self):
+        self.assertEqual(tsquery(['smoked', 'bac']), "'smoked':* & 'bac':*")
+
+    def test_tsquery_should_quote_its_syntax(self):
+        self.assertEqual(tsquery(["o'neil", 'a\\b', '!|&']), "'o''neil':* & 'a\\\\b':* & '!|&':*")
+
+    def test_prefix_should_be_a_like_of_the_key_instead_of_a_range(self):
+        """The range needs the keys ordered by code point, which the collation of the database may not do"""
+        with patch.object(connection, 'vendor', 'postgresql'):
+            queryset = filter_prefix(PizzaTopping.objects.all(), 'BAC')
+
+        self.assertEqual(queryset.query.where.children[0].lookup_name, 'startswith')
+        self.assertEqual(queryset.query.where.children[0].rhs, 'bac')
+
+    def test_search_should_read_the_tsvector_of_the_index(self):
+        with patch.object(connection, 'vendor', 'postgresql'):
+            queryset = filter_search(PizzaTopping.objects.all(), 'smoked bac')
+
+        sql, params = queryset.query.where.children[0].rhs.as_sql(None, connection)
+        self.assertIn("to_tsvector('simple', topping) @@ to_tsquery('simple', %s)", sql)
+        self.assertEqual(params, ("'smoked':* & 'bac':*",))
+
+    def test_search_should_not_scan_the_table_on_other_databases(self):
+        with patch.object(connection, 'vendor', 'mysql'):
+            with self.assertRaises(NotSupportedError):
+                filter_search(PizzaTopping.objects.all(), 'bac')
+
+
+class TestTemplatedHyperlinkedIdentityField(TestCase):
+    """Tests that the urls formatted from a template are the urls of HyperlinkedIdentityField"""
+
+    def _urls(self, field_class, view_name, pks, **headers):
+        request = Request(APIRequestFactory().get('/', **headers))
+        field = field_class(view_name=view_name)
+        field.bind('url', PizzaToppingSerializer(context={'request': request}))
+
+        return [field.to_representation(PizzaTopping(pk=pk)) for pk in pks]
+
+    def test_urls_should_match_reverse(self):
+        pks = [1, 9, 10, 12345, 2 ** 40]
+        for view_name in ('toppings_detail', 'pizzas_detail'):
+            for headers in ({}, {'HTTP_HOST': 'localhost:8000'}, {'secure': True, 'HTTP_HOST': 'localhost'}):
+                self.assertEqual(
+                    self._urls(TemplatedHyperlinkedIdentityField, view_name, pks, **headers),
+                    self._urls(serializers.HyperlinkedIdentityField, view_name, pks, **headers)
+                    )
+
+    def test_url_should_only_be_reversed_once(self):
+        with patch('rest_framework.relations.reverse', wraps=reverse) as mock_reverse:
+            urls = self._urls(TemplatedHyperlinkedIdentityField, 'toppings_detail', [1, 2, 3])
+
+        self.assertEqual(mock_reverse.call_count, 1)
+        self.assertEqual(urls[2], 'http://testserver/toppings/3')
+
+    def test_unsaved_objects_should_have_no_url(self):
+        self.assertEqual(self._urls(TemplatedHyperlinkedIdentityField, 'toppings_detail', [None]), [None])
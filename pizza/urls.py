@@ -1,11 +1,13 @@
 from django.urls import path
-from pizza import views
+from pizza import async_views, views
+from pizza.async_views import read_view
 
 
 # toppings/<int:pk> and pizza/<int:pk> can be <slug:slug> but code will need refactoring
 urlpatterns = [
-    path('toppings/', views.ToppingList.as_view(), name='toppings_list'),
-    path('toppings/<int:pk>', views.ToppingDetails.as_view(), name='toppings_detail'),
-    path('pizzas/', views.PizzaList.as_view(), name='pizzas_list'),
-    path('pizzas/<int:pk>', views.PizzaDetails.as_view(), name='pizzas_detail')
+    path('toppings/', read_view(views.ToppingList, async_views.topping_list), name='toppings_list'),
+    path('toppings/<int:pk>', read_view(views.ToppingDetails, async_views.topping_detail), name='toppings_detail'),
+    path('pizzas/', read_view(views.PizzaList, async_views.pizza_list), name='pizzas_list'),
+    path('pizzas/<int:pk>', read_view(views.PizzaDetails, async_views.pizza_detail), name='pizzas_detail'),
+    path('changes/', views.ChangeList.as_view(), name='changes_list'),
 ]
\ No newline at end of file
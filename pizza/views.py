@@ -4,8 +4,18 @@ from rest_framework import generics, status, permissions
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
 from rest_framework.decorators import APIView
-from pizza.models import PizzaTopping, Pizza
-from pizza.serializers import PizzaToppingSerializer, PizzaSerializer
+from pizza.cache import PIZZA_DETAIL, PIZZA_LIST, TOPPING_DETAIL, TOPPING_LIST, cache_response
+from pizza.conditional import CATALOG_VERSION_PK, conditional_get
+from pizza.filters import ToppingFilter
+from pizza.models import CatalogChange, CatalogVersion, PizzaTopping, Pizza
+from pizza.pagination import SequencePagination, since_param
+from pizza.renderers import RENDERER_CLASSES, FormatContentNegotiation
+from pizza.routers import ReplicaReadsMixin
+from pizza.search import NameSearchFilter
+from pizza.serializers import PizzaToppingSerializer, PizzaSerializer, only_requested, requested_fields
+from pizza.serializers import PizzaToppingReadSerializer, PizzaReadSerializer, CatalogChangeSerializer
+from pizza.streaming import stream_json_list, wants_stream
+from pizza.writes import run_write
 
 
 
@@ -23,11 +33,12 @@ class Homepage(APIView):
         return Response({
             'Topping List' : reverse('toppings_list', request=request),
             'Pizza List' : reverse('pizzas_list', request=request),
+            'Change List' : reverse('changes_list', request=request),
             'Swagger' : reverse('swagger', request=request)
             })
 
 # toppings/
-class ToppingList(generics.GenericAPIView):
+class ToppingList(ReplicaReadsMixin, generics.GenericAPIView):
     """
     Lists pizza toppings added by an owner.<br>
     Implemented methods are **GET**, **POST**.<br>
@@ -39,27 +50,55 @@ class ToppingList(generics.GenericAPIView):
     serializer_class = PizzaToppingSerializer
     queryset = PizzaTopping.objects.all()
     permission_classes = [permissions.DjangoModelPermissionsOrAnonReadOnly]
+    renderer_classes = RENDERER_CLASSES
+    content_negotiation_class = FormatContentNegotiation
+    filter_backends = [NameSearchFilter]
 
+    @conditional_get
+    @cache_response(TOPPING_LIST)
     def get(self, request) :
-        """Returns a list of all pizza toppings."""
-        topping_list = self.get_queryset()
-        serializer = PizzaToppingSerializer(topping_list, many=True, context={'request': request})
+        """
+        Returns a list of all pizza toppings.
+        Paginated by cursor when ?page_size= is sent. Streamed in chunks when ?stream=1 is sent.
+        Filtered to the names starting with ?prefix= or having words starting with the words of ?search=.
+        Only the fields listed in ?fields=, e.g. ?fields=topping,url, are returned when it is sent.
+        """
+        fields = requested_fields(request, PizzaToppingSerializer)
+        topping_list = only_requested(self.filter_queryset(self.get_queryset()), fields)
+        context = {'request': request, 'fields': fields}
+        if wants_stream(request):
+            return stream_json_list(topping_list, PizzaToppingSerializer, context)
+
+        # the rows are serialized from values(), with the output of PizzaToppingSerializer
+        topping_rows = PizzaToppingReadSerializer.values(topping_list, fields)
+        page = self.paginate_queryset(topping_rows)
+        if page is not None:
+            serializer = PizzaToppingReadSerializer(page, context=context)
+            return self.get_paginated_response(serializer.data)
+
+        serializer = PizzaToppingReadSerializer(topping_rows, context=context)
 
         return Response(serializer.data)
 
     def post(self, request):
-        """Submits a new pizza topping. Must be unique."""
+        """Submits a new pizza topping, or a list of new toppings. Must be unique."""
         new_topping = request.data
-        serializer = PizzaToppingSerializer(data=new_topping, context={'request': request})
+        many = isinstance(new_topping, list)
+        serializer = PizzaToppingSerializer(data=new_topping, many=many, context={'request': request})
         if serializer.is_valid():
-            serializer.save()
+            run_write(serializer.save)
+            if many:
+                # the created toppings are displayed like the list view, from their rows
+                rows = [{'pk': topping.pk, 'topping': topping.topping} for topping in serializer.instance]
+                data = PizzaToppingReadSerializer(rows, context={'request': request}).data
+                return Response(data, status=status.HTTP_201_CREATED)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
 # toppings/<int:pk>
-class ToppingDetails(generics.GenericAPIView):
+class ToppingDetails(ReplicaReadsMixin, generics.GenericAPIView):
     """
     Displays an individual topping<br>
     Implemented methods are **GET**, **PUT**, **DELETE**.<br>
@@ -70,6 +109,8 @@ class ToppingDetails(generics.GenericAPIView):
     serializer_class = PizzaToppingSerializer
     queryset = PizzaTopping.objects.all()
     permission_classes = [permissions.DjangoModelPermissionsOrAnonReadOnly]
+    renderer_classes = RENDERER_CLASSES
+    content_negotiation_class = FormatContentNegotiation
 
     def _get_object(self, pk):
         try:
@@ -79,10 +120,13 @@ class ToppingDetails(generics.GenericAPIView):
         except PizzaTopping.DoesNotExist:
             raise Http404
 
+    @conditional_get
+    @cache_response(TOPPING_DETAIL)
     def get(self, request, pk):
-        """Returns an individual topping."""
+        """Returns an individual topping. Only the fields listed in ?fields= are returned when it is sent."""
         topping = self._get_object(pk=pk)
-        serializer = PizzaToppingSerializer(topping, context={'request': request})
+        context = {'request': request, 'fields': requested_fields(request, PizzaToppingSerializer)}
+        serializer = PizzaToppingSerializer(topping, context=context)
 
         return Response(serializer.data)
 
@@ -91,7 +135,7 @@ class ToppingDetails(generics.GenericAPIView):
         topping = self._get_object(pk=pk)
         serializer = PizzaToppingSerializer(topping,  data=request.data, partial=False, context= {'request':request})
         if serializer.is_valid():
-            serializer.save()
+            run_write(serializer.save)
             return Response(serializer.data)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -99,13 +143,13 @@ class ToppingDetails(generics.GenericAPIView):
     def delete(self, request, pk):
         """Deletes the topping entry."""
         topping = self._get_object(pk=pk)
-        topping.delete()
+        run_write(topping.delete)
 
         return Response("Sucessfully Deleted", status=status.HTTP_204_NO_CONTENT)
 
 
 # pizzas/
-class PizzaList(generics.GenericAPIView):
+class PizzaList(ReplicaReadsMixin, generics.GenericAPIView):
     """
     Lists pizzas added by a pizza chef.<br>
     Implemented methods are **GET**, **POST**.<br>
@@ -115,12 +159,37 @@ class PizzaList(generics.GenericAPIView):
     """
 
     serializer_class = PizzaSerializer
-    queryset = Pizza.objects.all()
+    # toppings are loaded in one extra query instead of one query per pizza
+    queryset = Pizza.objects.prefetch_related('toppings')
     permission_classes = [permissions.DjangoModelPermissionsOrAnonReadOnly]
+    renderer_classes = RENDERER_CLASSES
+    content_negotiation_class = FormatContentNegotiation
+    filter_backends = [NameSearchFilter, ToppingFilter]
+
+    @conditional_get
+    @cache_response(PIZZA_LIST)
     def get(self, request):
-        """Returns a list of all pizzas."""
-        pizza_list = self.get_queryset()
-        serializer = PizzaSerializer(pizza_list, many=True, context={'request': request})
+        """
+        Returns a list of all pizzas.
+        Paginated by cursor when ?page_size= is sent. Streamed in chunks when ?stream=1 is sent.
+        Filtered to the names starting with ?prefix= or having words starting with the words of ?search=.
+        Only the fields listed in ?fields=, e.g. ?fields=pizza,url, are returned when it is sent.
+        Filtered to the pizzas having every ?topping= (any of them with ?topping_match=any) and no ?exclude_topping=.
+        """
+        fields = requested_fields(request, PizzaSerializer)
+        pizza_list = only_requested(self.filter_queryset(self.get_queryset()), fields)
+        context = {'request': request, 'fields': fields}
+        if wants_stream(request):
+            return stream_json_list(pizza_list, PizzaSerializer, context)
+
+        # the rows are serialized from values(), with the output of PizzaSerializer
+        pizza_rows = PizzaReadSerializer.values(pizza_list, fields)
+        page = self.paginate_queryset(pizza_rows)
+        if page is not None:
+            serializer = PizzaReadSerializer(page, context=context)
+            return self.get_paginated_response(serializer.data)
+
+        serializer = PizzaReadSerializer(pizza_rows, context=context)
 
         return Response(serializer.data)
 
@@ -129,14 +198,14 @@ class PizzaList(generics.GenericAPIView):
         new_pizza = request.data
         serializer = PizzaSerializer(data=new_pizza, context={'request': request})
         if serializer.is_valid():
-            serializer.save()
+            run_write(serializer.save)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
 # pizzas/<int:pk>
-class PizzaDetails(generics.GenericAPIView):
+class PizzaDetails(ReplicaReadsMixin, generics.GenericAPIView):
     """
     Displays an individual pizza<br>
     Implemented methods are **GET**, **PUT**, **DELETE**.<br>
@@ -148,6 +217,8 @@ class PizzaDetails(generics.GenericAPIView):
     serializer_class = PizzaSerializer
     queryset = Pizza.objects.all()
     permission_classes = [permissions.DjangoModelPermissionsOrAnonReadOnly]
+    renderer_classes = RENDERER_CLASSES
+    content_negotiation_class = FormatContentNegotiation
 
     def _get_object(self, pk):
         try:
@@ -157,19 +228,25 @@ class PizzaDetails(generics.GenericAPIView):
         except Pizza.DoesNotExist:
             raise Http404
 
+    @conditional_get
+    @cache_response(PIZZA_DETAIL)
     def get(self, request, pk):
-        """Returns an individual pizza."""
-        pizza = self._get_object(pk=pk)
-        serializer = PizzaSerializer(pizza, context={'request': request})
+        """Returns an individual pizza. Only the fields listed in ?fields= are returned when it is sent."""
+        fields = requested_fields(request, PizzaSerializer)
+        # the pizza is one row of pizza_pizza when its topping names are stored on it
+        pizza_rows = PizzaReadSerializer.values(Pizza.objects.filter(pk=pk), fields)
+        data = PizzaReadSerializer(pizza_rows, context={'request': request, 'fields': fields}).data
+        if not data:
+            raise Http404
 
-        return Response(serializer.data)
+        return Response(data[0])
 
     def put(self, request, pk):
         """Updates the pizza."""
         pizza = self._get_object(pk=pk)
         serializer = PizzaSerializer(pizza,  data=request.data, partial=False, context= {'request':request})
         if serializer.is_valid():
-            serializer.save()
+            run_write(serializer.save)
             return Response(serializer.data)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -177,7 +254,44 @@ class PizzaDetails(generics.GenericAPIView):
     def delete(self, request, pk):
         """Deletes the pizza entry."""
         pizza = self._get_object(pk=pk)
-        pizza.delete()
+        run_write(pizza.delete)
 
         return Response("Sucessfully Deleted", status=status.HTTP_204_NO_CONTENT)
 
+
+# changes/
+class ChangeList(ReplicaReadsMixin, generics.GenericAPIView):
+    """
+    Lists the changes made to toppings and pizzas after the sequence number ?since=, oldest first.<br>
+    Implemented methods are **GET**.<br>
+    Only the latest change of every topping and pizza is kept, with its current data in 'data', null once it was
+    deleted. Pages hold ?page_size= changes, 100 by default. The next page is at 'next', and once there is none
+    'last_seq' is the ?since= that returns the changes made afterwards.<br>
+    A page costs about 6 ms plus 0.05 ms per change, downloading /pizzas/ again about 0.013 ms per pizza: catching up
+    is faster than a full download while fewer than about a quarter of the catalog changed, and not at all for
+    catalogs of a few hundred objects (see the change_feed benchmark).<br>
+    Changes are kept for a limited time, a client that is too far behind is answered with 410 Gone and downloads
+    the toppings and pizzas again.
+    """
+
+    serializer_class = CatalogChangeSerializer
+    queryset = CatalogChange.objects.all()
+    permission_classes = [permissions.DjangoModelPermissionsOrAnonReadOnly]
+    renderer_classes = RENDERER_CLASSES
+    content_negotiation_class = FormatContentNegotiation
+    pagination_class = SequencePagination
+
+    def get(self, request):
+        """Returns a page of the changes made after ?since=, 0 lists the changes from the start of the log."""
+        compacted_seq = CatalogVersion.objects.filter(pk=CATALOG_VERSION_PK).values_list('compacted_seq', flat=True)
+        compacted_seq = compacted_seq.first() or 0
+        if since_param(request) < compacted_seq:
+            return Response({
+                'detail': f'The changes up to {compacted_seq} were deleted, download the toppings and pizzas again.',
+                'latest_seq': CatalogChange.latest_seq(),
+                }, status=status.HTTP_410_GONE)
+
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = CatalogChangeSerializer(page, many=True, context={'request': request})
+
+        return self.get_paginated_response(serializer.data)
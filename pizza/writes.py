@@ -0,0 +1,143 @@
+"""
+Single writer for the database.
+sqlite allows one write transaction at a time, so concurrent writes from the threads of a worker process
+wait on the database lock and fail with 'database is locked' once busy_timeout runs out.
+The views hand their writes to one thread instead, which runs them one after the other.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from django.conf import settings
+from django.db import OperationalError, close_old_connections, connection, transaction
+from rest_framework import exceptions
+
+
+class WriteUnavailable(exceptions.APIException):
+    """Raised when the queue of writes is full or a queued write waited too long, answered with a 503"""
+
+    status_code = 503
+    default_detail = 'Too many changes are in progress, try again later.'
+    default_code = 'write_unavailable'
+    # seconds sent in the Retry-After header
+    wait = 1
+
+
+def is_locked(error):
+    return isinstance(error, OperationalError) and 'locked' in str(error)
+
+
+class WriteDispatcher:
+    """
+    Runs writes submitted from any thread on one worker thread.
+    Up to PIZZA_WRITE_GROUP_SIZE queued writes are committed together in one transaction, each in its own savepoint
+    so an error only rolls back its own write.
+
+    A transaction that fails with 'database is locked', because another process is writing, is retried after
+    PIZZA_WRITE_RETRY_DELAY seconds, doubled after every retry. With WAL a commit doesn't wait for a lock,
+    so the error can only happen at the first write of the transaction, before any write has been made.
+    """
+
+    def __init__(self):
+        self._queue = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            if self._queue is None:
+                self._queue = queue.Queue(maxsize=getattr(settings, 'PIZZA_WRITE_QUEUE_SIZE', 100))
+                threading.Thread(target=self._run, name='pizza-writes', daemon=True).start()
+
+        return self._queue
+
+    def submit(self, function):
+        """
+        Runs function in a transaction on the worker thread and returns its result or raises its exception.
+        Raises WriteUnavailable when the queue stays full or the write isn't started within PIZZA_WRITE_TIMEOUT.
+        """
+        timeout = getattr(settings, 'PIZZA_WRITE_TIMEOUT', 10)
+        future = Future()
+        try:
+            self._start().put((function, future), timeout=timeout)
+        except queue.Full:
+            raise WriteUnavailable()
+
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            if future.cancel():
+                raise WriteUnavailable()
+            # the write is already running and has to finish
+            return future.result()
+
+    def _run(self):
+        while True:
+            jobs = [self._queue.get()]
+            group_size = getattr(settings, 'PIZZA_WRITE_GROUP_SIZE', 1)
+            while len(jobs) < group_size:
+                try:
+                    jobs.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            # writes whose caller gave up waiting are dropped
+            jobs = [(function, future) for function, future in jobs if future.set_running_or_notify_cancel()]
+            if jobs:
+                self._commit(jobs)
+
+    def _commit(self, jobs):
+        retries = getattr(settings, 'PIZZA_WRITE_RETRIES', 5)
+        delay = getattr(settings, 'PIZZA_WRITE_RETRY_DELAY', 0.05)
+        for attempt in range(retries + 1):
+            try:
+                results = self._run_group(jobs)
+            except OperationalError as error:
+                if not is_locked(error) or attempt == retries:
+                    for function, future in jobs:
+                        future.set_exception(WriteUnavailable() if is_locked(error) else error)
+                    return
+                time.sleep(delay * 2 ** attempt)
+            except Exception as error:
+                for function, future in jobs:
+                    future.set_exception(error)
+                return
+            else:
+                for (function, future), (result, error) in zip(jobs, results):
+                    if error is None:
+                        future.set_result(result)
+                    else:
+                        future.set_exception(error)
+                return
+
+    @staticmethod
+    def _run_group(jobs):
+        """Returns the (result, exception) of every job, a lock error is raised so the group is retried"""
+        results = []
+        # the connection of the worker thread is never closed by the end of a request
+        close_old_connections()
+        with transaction.atomic():
+            for function, future in jobs:
+                try:
+                    with transaction.atomic():
+                        results.append((function(), None))
+                except Exception as error:
+                    if is_locked(error):
+                        raise
+                    results.append((None, error))
+
+        return results
+
+
+dispatcher = WriteDispatcher()
+
+
+def run_write(function):
+    """
+    Runs function, which writes to the database, in a transaction of the single writer.
+    Calls from inside a transaction run directly, since the writer thread couldn't see the uncommitted changes.
+    """
+    if not getattr(settings, 'PIZZA_WRITE_DISPATCHER', True) or connection.in_atomic_block:
+        with transaction.atomic():
+            return function()
+
+    return dispatcher.submit(function)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -43,6 +44,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # compresses the responses on their way out, so it has to come before the middleware changing them
+    'pizza.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -50,6 +53,8 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    # last, so the responses from the snapshot go through the headers and compression of the middleware above
+    'pizza.snapshot.CatalogSnapshotMiddleware',
 ]
 
 ROOT_URLCONF = 'pizza_store.urls'
@@ -80,9 +85,133 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # connections are kept for a minute instead of being opened for every request
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+        # a file like the server's, connections of an in-memory test database share a cache with table locks
+        # instead of running in WAL mode, so concurrent requests would fail on reads as well
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
+# PostgreSQL is used instead of sqlite when PIZZA_DB_NAME is set
+# It needs psycopg, which isn't in requirements.txt: pip install -r requirements-postgresql.txt
+if os.environ.get('PIZZA_DB_NAME'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ['PIZZA_DB_NAME'],
+            'USER': os.environ.get('PIZZA_DB_USER', ''),
+            'PASSWORD': os.environ.get('PIZZA_DB_PASSWORD', ''),
+            'HOST': os.environ.get('PIZZA_DB_HOST', ''),
+            'PORT': os.environ.get('PIZZA_DB_PORT', ''),
+            # each thread of a worker keeps its connection, which pools the connections of the worker
+            'CONN_MAX_AGE': int(os.environ.get('PIZZA_DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            # set PIZZA_DB_PGBOUNCER=1 when connecting through pgbouncer in transaction pooling mode
+            'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('PIZZA_DB_PGBOUNCER') == '1',
+        }
+    }
+
+# Read replicas, aliases of DATABASES that GET requests of the list and detail views read from, see pizza/routers.py
+# PIZZA_REPLICA_DB is the path of a copy of the sqlite database, refreshed by 'manage.py snapshot_replica'
+# and PIZZA_DB_REPLICA_HOST the host of a PostgreSQL replica
+PIZZA_READ_REPLICAS = []
+if os.environ.get('PIZZA_DB_REPLICA_HOST') and DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    DATABASES['replica'] = {**DATABASES['default'], 'HOST': os.environ['PIZZA_DB_REPLICA_HOST']}
+    PIZZA_READ_REPLICAS = ['replica']
+elif os.environ.get('PIZZA_REPLICA_DB') and DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    # connections aren't kept so every request reads the latest snapshot
+    DATABASES['replica'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': os.environ['PIZZA_REPLICA_DB']}
+    PIZZA_READ_REPLICAS = ['replica']
+
+DATABASE_ROUTERS = ['pizza.routers.ReplicaRouter']
+
+# Seconds a client reads from default after a change, so it reads its own writes
+# Should be longer than the time the replicas take to catch up
+# Clients sending credentials are pinned in the PIZZA_CACHE_ALIAS cache, they always read from default without a shared one
+PIZZA_REPLICA_PIN_SECONDS = 5
+
+# Applied to every new sqlite connection, see pizza/database.py
+# WAL lets reads run while a write is in progress and synchronous=NORMAL is safe with WAL
+PIZZA_SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,  # milliseconds to wait for a lock before 'database is locked'
+    'cache_size': -64000,  # negative values are in KiB
+    'mmap_size': 268435456,
+    'temp_store': 'MEMORY',
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# The files are shared by the workers of a host, set PIZZA_CACHE_DIR to move them
+# With several hosts use a backend they all reach (e.g. Redis): local memory is per process, a write only invalidates
+# the entries of the worker making it and the other workers keep serving their cached responses until they expire
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('PIZZA_CACHE_DIR', BASE_DIR / 'cache'),
+    }
+}
+
+# Cache alias and timeout in seconds of cached GET responses, see pizza/cache.py
+# Only set the alias to a backend shared by every worker, None disables caching
+# The permissions of users and groups are only cached when the backend is shared, see pizza/permissions.py
+PIZZA_CACHE_ALIAS = 'default'
+PIZZA_CACHE_TIMEOUT = 300
+
+# JSON GET requests are answered by the async handlers of pizza/async_views.py under ASGI when PIZZA_ASYNC_READS=1
+# Off by default, the async_reads benchmark doesn't show them faster than the sync views under ASGI
+PIZZA_ASYNC_READS = os.environ.get('PIZZA_ASYNC_READS') == '1'
+
+# Writes of the views are run one at a time by a single thread, see pizza/writes.py
+# Only needed for sqlite, which allows one writer at a time
+PIZZA_WRITE_DISPATCHER = DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3'
+# Seconds to wait for a place in the queue and for the write to start before answering with a 503
+PIZZA_WRITE_QUEUE_SIZE = 100
+PIZZA_WRITE_TIMEOUT = 10
+# Retries of a transaction that fails with 'database is locked', the first after PIZZA_WRITE_RETRY_DELAY seconds
+PIZZA_WRITE_RETRIES = 5
+PIZZA_WRITE_RETRY_DELAY = 0.05
+# Queued writes committed together in one transaction, 1 commits every write on its own
+PIZZA_WRITE_GROUP_SIZE = 1
+
+# Responses of at least PIZZA_COMPRESSION_MIN_SIZE bytes are compressed with brotli or gzip, see pizza/middleware.py
+# Quality 5 of brotli compresses about as fast as gzip and smaller, 11 is too slow for responses built per request
+PIZZA_COMPRESSION_MIN_SIZE = 1024
+PIZZA_BROTLI_QUALITY = 5
+
+# Rejects a pizza with the same toppings as another pizza, see PizzaSerializer.validate
+PIZZA_UNIQUE_TOPPING_SETS = False
+
+# The toppings of pizzas are read from the topping names stored on the pizzas instead of joining Pizza.toppings
+PIZZA_DENORMALIZED_TOPPINGS = True
+
+# Anonymous JSON GETs of toppings and pizzas are answered from an in-memory snapshot of the catalog, see pizza/snapshot.py
+# Off by default, the snapshot serves data up to PIZZA_SNAPSHOT_MAX_AGE seconds old to clients that didn't make a change
+PIZZA_CATALOG_SNAPSHOT = False
+# Seconds between reads of the catalog version by each process, the longest a write takes to reach every process
+PIZZA_SNAPSHOT_MAX_AGE = 1
+# When set, the catalog version is the mtime of this file, touched on every write, instead of a query
+PIZZA_SNAPSHOT_MARKER_FILE = os.environ.get('PIZZA_SNAPSHOT_MARKER_FILE')
+
+# Number of changes kept in the change log of /changes/ by 'manage.py compact_changes'
+PIZZA_CHANGE_LOG_SIZE = 100000
+
+# Seconds and number of entries recently verified Basic auth credentials are kept, see pizza/authentication.py
+PIZZA_AUTH_CACHE_TTL = 60
+PIZZA_AUTH_CACHE_SIZE = 1024
+
+
+# Permissions of users and groups are kept in the PIZZA_CACHE_ALIAS cache when it's shared, see pizza/permissions.py
+
+AUTHENTICATION_BACKENDS = [
+    'pizza.permissions.CachedModelBackend',
+]
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -128,7 +257,9 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.BasicAuthentication',
+        'pizza.authentication.CachedBasicAuthentication',
         'rest_framework.authentication.SessionAuthentication',
-    )
+    ),
+    # Lists are only paginated when ?page_size= is sent unless PAGE_SIZE is set
+    'DEFAULT_PAGINATION_CLASS': 'pizza.pagination.PrimaryKeyCursorPagination',
 }
\ No newline at end of file